@@ -2,19 +2,46 @@ from __future__ import annotations
 import argparse
 import asyncio
 import json
-from typing import Optional
+import os
+import sys
+from pathlib import Path
+from typing import List, Optional
 import aiohttp
 
 from app.config import load_config
-from app.storage.settings_store import SettingsStore
+from app.services import control
+from app.services.backfill import ID_BATCH, parse_ref, resolve_batches
+from app.services.derpi import DEFAULT_FILTER, DerpiClient
+from app.storage import history_io
+from app.storage.archive import HistoryArchive
+from app.storage.bloom import BloomFilter
+from app.storage.sent_store import SentImageStore
+from app.storage.stats import HistoryStats
+from app.storage.settings_store import POST_MODES, SettingsStore
+
+# процесс не запущен (или сокет управления выключен) — работаем с settings.json напрямую
+OFFLINE = object()
 
 
 def _print(obj) -> None:
     print(json.dumps(obj, ensure_ascii=False, indent=2))
 
 
+async def _control(cfg, method: str, **params):
+    if not cfg.control_socket:
+        return OFFLINE
+    try:
+        return await control.call(cfg.control_socket, method, **params)
+    except (FileNotFoundError, ConnectionRefusedError):
+        return OFFLINE
+
+
 async def cmd_show() -> None:
     cfg = load_config()
+    live = await _control(cfg, "show")
+    if live is not OFFLINE:
+        _print(live)
+        return
     store = SettingsStore(cfg.settings_file, default_interval=cfg.post_interval_minutes, default_filter_id=cfg.filter_id)
     await store.load()
     _print(store.settings.to_dict())
@@ -22,6 +49,10 @@ async def cmd_show() -> None:
 
 async def cmd_set_interval(minutes: int) -> None:
     cfg = load_config()
+    live = await _control(cfg, "set", interval=minutes)
+    if live is not OFFLINE:
+        _print({"ok": True, "post_interval_minutes": live["post_interval_minutes"]})
+        return
     store = SettingsStore(cfg.settings_file, default_interval=cfg.post_interval_minutes, default_filter_id=cfg.filter_id)
     await store.load()
     await store.update(tags_raw=None, interval=minutes, filter_id=store.settings.filter_id)
@@ -30,21 +61,41 @@ async def cmd_set_interval(minutes: int) -> None:
 
 async def cmd_set_filter(value: str) -> None:
     cfg = load_config()
+    filter_id = None if value.lower() in {"none", "null", "off", "0"} else int(value)
+    live = await _control(cfg, "set", filter_id=filter_id)
+    if live is not OFFLINE:
+        _print({"ok": True, "filter_id": live["filter_id"]})
+        return
     store = SettingsStore(cfg.settings_file, default_interval=cfg.post_interval_minutes, default_filter_id=cfg.filter_id)
     await store.load()
-    filter_id = None if value.lower() in {"none", "null", "off", "0"} else int(value)
     await store.update(tags_raw=None, interval=None, filter_id=filter_id)
     _print({"ok": True, "filter_id": store.settings.filter_id})
 
 
 async def cmd_set_tags(text: str) -> None:
     cfg = load_config()
+    live = await _control(cfg, "set", tags=text)
+    if live is not OFFLINE:
+        _print({"ok": True, "tags": live["tags"]})
+        return
     store = SettingsStore(cfg.settings_file, default_interval=cfg.post_interval_minutes, default_filter_id=cfg.filter_id)
     await store.load()
     await store.update(tags_raw=text, interval=None, filter_id=store.settings.filter_id)
     _print({"ok": True, "tags": store.settings.tags})
 
 
+async def cmd_set_mode(mode: str) -> None:
+    cfg = load_config()
+    live = await _control(cfg, "set", mode=mode)
+    if live is not OFFLINE:
+        _print({"ok": True, "mode": live["mode"]})
+        return
+    store = SettingsStore(cfg.settings_file, default_interval=cfg.post_interval_minutes, default_filter_id=cfg.filter_id)
+    await store.load()
+    await store.update(tags_raw=None, interval=None, filter_id=store.settings.filter_id, mode=mode)
+    _print({"ok": True, "mode": store.settings.mode})
+
+
 async def _login(session: aiohttp.ClientSession, base_url: str, user: str, password: str) -> None:
     # cookie-based login via form
     async with session.post(f"{base_url}/auth/login", data={"user": user, "password": password}, allow_redirects=False) as resp:
@@ -52,22 +103,259 @@ async def _login(session: aiohttp.ClientSession, base_url: str, user: str, passw
             raise RuntimeError(f"Login failed, status={resp.status}")
 
 
-async def cmd_post_now(base_url: Optional[str]) -> None:
+async def cmd_post_now(base_url: Optional[str], tags: Optional[str]) -> None:
     cfg = load_config()
+    if base_url is None:
+        live = await _control(cfg, "post-now", tags=tags)
+        if live is not OFFLINE:
+            _print({"ok": True, **live})
+            return
     base_url = base_url or f"http://{cfg.web_host}:{cfg.web_port}"
     async with aiohttp.ClientSession() as session:
         await _login(session, base_url, cfg.admin_user, cfg.admin_password)
-        async with session.post(f"{base_url}/api/post-now") as resp:
+        async with session.post(f"{base_url}/api/post-now", json={"tags_raw": tags} if tags else None) as resp:
             if resp.status != 200:
                 raise RuntimeError(f"POST /api/post-now failed: {resp.status}")
             _print(await resp.json())
 
 
+async def _live_only(method: str) -> None:
+    cfg = load_config()
+    live = await _control(cfg, method)
+    if live is OFFLINE:
+        raise RuntimeError(f"Bot is not running (no control socket at {cfg.control_socket})")
+    _print(live)
+
+
+async def cmd_stats() -> None:
+    await _live_only("stats")
+
+
+async def cmd_queue() -> None:
+    await _live_only("queue")
+
+
+async def cmd_history_stats(top: int, days: int, rebuild: bool, force: bool) -> None:
+    cfg = load_config()
+    if not rebuild:
+        live = await _control(cfg, "history-stats", top=top, days=days)
+        if live is not OFFLINE:
+            _print(live)
+            return
+        # без бота — из снимка, историю не читаем
+        stats = HistoryStats(cfg.stats_snapshot_file, read_only=True)
+        if await asyncio.to_thread(stats.load_sync):
+            _print(stats.summary(top=top, days=days))
+            return
+    await _require_offline(cfg, "rebuilding stats", force)
+    store = SentImageStore(
+        cfg.sent_images_file,
+        archive=HistoryArchive(cfg.history_archive_dir),
+        stats=HistoryStats(cfg.stats_snapshot_file),
+    )
+    await store.load()
+    # без снимка load() уже посчитал всё с нуля — остаётся сохранить
+    if rebuild:
+        await store.rebuild_stats()
+    else:
+        await store.stats.save()
+    _print(store.stats.summary(top=top, days=days))
+
+
+async def cmd_compact(keep_days: Optional[int], keep_entries: Optional[int], force: bool) -> None:
+    cfg = load_config()
+    days = cfg.history_keep_days if keep_days is None else keep_days
+    entries = cfg.history_keep_entries if keep_entries is None else keep_entries
+    if days <= 0 and entries <= 0:
+        raise SystemExit("error: no retention limit (use --keep-days/--keep-entries or HISTORY_KEEP_*)")
+    live = await _control(cfg, "compact", keep_days=days, keep_entries=entries)
+    if live is not OFFLINE:
+        _print({"ok": True, **live})
+        return
+    await _require_offline(cfg, "compacting", force)
+    store = SentImageStore(cfg.sent_images_file, archive=HistoryArchive(cfg.history_archive_dir))
+    await store.load()
+    _print({"ok": True, **await store.compact(keep_days=days, keep_entries=entries)})
+
+
+async def cmd_archive(segment: Optional[str], tag: Optional[str], url: Optional[str], limit: int) -> None:
+    # архив только читается, поэтому запрос безопасен и при работающем боте
+    cfg = load_config()
+    archive = HistoryArchive(cfg.history_archive_dir)
+    await asyncio.to_thread(archive.load_keys_sync)
+    if segment is None and tag is None and url is None:
+        _print({"keys": len(archive), "segments": archive.segments()})
+        return
+    images = await asyncio.to_thread(archive.query_sync, segment=segment, tag=tag, url=url, limit=limit)
+    _print({"images": images})
+
+
+def _format_of(path: str, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+async def _require_offline(cfg, what: str, force: bool) -> None:
+    # работающий бот перезапишет историю своей копией из памяти. без сокета управления
+    # проверить это нечем — тогда нужен явный --force
+    if not cfg.control_socket:
+        if not force:
+            raise SystemExit(f"error: CONTROL_SOCKET is not set, so it is unknown whether the bot is running; "
+                             f"stop it and pass --force to proceed with {what}")
+        return
+    if await _control(cfg, "show") is not OFFLINE:
+        raise SystemExit(f"error: stop the bot before {what} (it owns {cfg.sent_images_file})")
+
+
+def _target(cfg) -> SentImageStore:
+    # тот же фильтр дедупликации, что у бота: импортированные URL должны попасть и в него
+    bloom = None
+    if cfg.dedupe_bloom_path:
+        bloom = BloomFilter(cfg.dedupe_bloom_path, cfg.dedupe_bloom_capacity, cfg.dedupe_bloom_fp_rate)
+    return SentImageStore(cfg.sent_images_file, bloom=bloom, archive=HistoryArchive(cfg.history_archive_dir))
+
+
+async def _store_batch(store: SentImageStore, records, to_archive: bool) -> int:
+    # в горячую историю — только в память: перезапись всего файла на каждую пачку дала бы
+    # O(N²) записи, поэтому файл пишется один раз в конце, а чекпоинт ведётся лишь для архива
+    if not to_archive:
+        return await store.add_many(records, persist=False)
+    return await store.archive_many(records)
+
+
+async def cmd_export(out_path: str, fmt: Optional[str], with_archive: bool) -> None:
+    cfg = load_config()
+    fmt = _format_of(out_path, fmt)
+    archive = HistoryArchive(cfg.history_archive_dir) if with_archive else None
+    progress = history_io.Progress("export")
+    items = history_io.iter_history(cfg.sent_images_file, archive)
+    if out_path == "-":
+        n = await asyncio.to_thread(history_io.write_records, sys.stdout, fmt, items, progress)
+    else:
+        # пишем во временный файл: оборванный экспорт не оставит полуфайла под итоговым именем
+        tmp = Path(out_path + ".part")
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            n = await asyncio.to_thread(history_io.write_records, f, fmt, items, progress)
+        os.replace(tmp, out_path)
+    _, took = progress.finish()
+    print(json.dumps({"ok": True, "exported": n, "format": fmt, "seconds": round(took, 1)}), file=sys.stderr)
+
+
+async def cmd_import(in_path: str, fmt: Optional[str], to_archive: bool, batch: int, restart: bool, force: bool) -> None:
+    cfg = load_config()
+    await _require_offline(cfg, "importing", force)
+    fmt = _format_of(in_path, fmt)
+    store = _target(cfg)
+    await store.load()
+
+    ckpt = history_io.Checkpoint(Path(in_path + ".import.ckpt"))
+    source = os.path.abspath(in_path)
+    skip = 0 if restart else ckpt.load(source)
+    imported = int(ckpt.state.get("imported", 0))
+    progress = history_io.Progress("import")
+    position = 0
+    try:
+        with open(in_path, encoding="utf-8", newline="") as f:
+            for chunk in history_io.batches(history_io.iter_input(f, fmt), batch):
+                position += len(chunk)
+                if position <= skip:
+                    continue
+                chunk = chunk[max(0, skip - (position - len(chunk))):]
+                records = [r for r in map(history_io.record_from, chunk) if r is not None]
+                imported += await _store_batch(store, records, to_archive)
+                if to_archive:
+                    ckpt.save(source, position, imported=imported)
+                progress.tick(done=position, imported=imported, skipped=position - imported)
+        if not to_archive:
+            await store.save()
+    finally:
+        store.close()
+    progress.finish()
+    ckpt.clear()
+    _print({"ok": True, "read": position, "imported": imported, "target": "archive" if to_archive else "history"})
+
+
+async def cmd_backfill(
+    in_path: str, to_archive: bool, concurrency: int, filter_id: Optional[int], restart: bool, force: bool,
+) -> None:
+    cfg = load_config()
+    await _require_offline(cfg, "backfilling", force)
+    store = _target(cfg)
+    await store.load()
+
+    ckpt = history_io.Checkpoint(Path(in_path + ".backfill.ckpt"))
+    source = os.path.abspath(in_path)
+    skip = 0 if restart else ckpt.load(source)
+    imported = int(ckpt.state.get("imported", 0))
+    missing: List[int] = list(ckpt.state.get("missing", []))
+    with open(in_path, encoding="utf-8") as f:
+        total = sum(1 for _ in f)
+    progress = history_io.Progress("backfill", total=total)
+
+    derpi = DerpiClient(
+        token=cfg.derpibooru_token,
+        search_url=cfg.derpi_search_url,
+        filter_id=cfg.filter_id,
+        http_pool_limit=concurrency,
+    )
+    await derpi.start()
+    # окно из нескольких пачек на поток: память постоянна, чекпоинт — после окна целиком
+    window = concurrency * 4
+    position = 0
+    try:
+        with open(in_path, encoding="utf-8") as f:
+            for lines in history_io.batches(iter(f), window * ID_BATCH):
+                position += len(lines)
+                if position <= skip:
+                    continue
+                lines = lines[max(0, skip - (position - len(lines))):]
+                ids = list(dict.fromkeys(i for i in map(parse_ref, lines) if i is not None))
+                id_batches = list(history_io.batches(iter(ids), ID_BATCH))
+                async for _, records, lost in resolve_batches(
+                    derpi, id_batches, concurrency=concurrency,
+                    filter_id=DEFAULT_FILTER if filter_id is None else filter_id,
+                ):
+                    imported += await _store_batch(store, records, to_archive)
+                    missing.extend(lost)
+                    progress.tick(imported=imported, missing=len(missing))
+                if to_archive:
+                    ckpt.save(source, position, imported=imported, missing=missing[-1000:])
+                progress.tick(done=position)
+        if not to_archive:
+            await store.save()
+    finally:
+        await derpi.close()
+        store.close()
+    progress.finish()
+    ckpt.clear()
+    _print({"ok": True, "lines": position, "imported": imported, "missing_ids": missing[-1000:]})
+
+
+def _force_arg(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Run without a control socket to confirm the bot is stopped (make sure it is)",
+    )
+
+
+def _target_args(parser: argparse.ArgumentParser) -> None:
+    dest = parser.add_mutually_exclusive_group()
+    dest.add_argument(
+        "--to-archive", dest="to_archive", action="store_true", default=True,
+        help="Write into archive segments (default): constant memory, resumable from the checkpoint",
+    )
+    dest.add_argument(
+        "--to-history", dest="to_archive", action="store_false",
+        help="Write into the hot history file: held in memory and saved once at the end, no checkpoint",
+    )
+
+
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(prog="derpi-bot-cli", description="CLI for Derpi Bot settings & actions")
     sub = p.add_subparsers(dest="cmd", required=True)
 
-    sub.add_parser("show", help="Show current settings.json")
+    sub.add_parser("show", help="Show current settings (live from the running bot if possible)")
 
     si = sub.add_parser("set-interval", help="Set posting interval minutes")
     si.add_argument("minutes", type=int)
@@ -78,8 +366,53 @@ def build_parser() -> argparse.ArgumentParser:
     st = sub.add_parser("set-tags", help="Set tag groups. Use \\n for new group.")
     st.add_argument("text", type=str)
 
-    pn = sub.add_parser("post-now", help="Trigger immediate posting via Web API (admin)")
+    sm = sub.add_parser("set-mode", help="Set posting mode: random or feed (new uploads only)")
+    sm.add_argument("mode", choices=POST_MODES)
+
+    pn = sub.add_parser("post-now", help="Trigger immediate posting (control socket, or Web API with --base-url)")
     pn.add_argument("--base-url", type=str, default=None)
+    pn.add_argument("--tags", type=str, default=None, help="Post from this tag group instead of a random one")
+
+    sub.add_parser("stats", help="Show runtime metrics of the running bot")
+    sub.add_parser("queue", help="Show posting queue, candidate pool and group stats")
+
+    hs = sub.add_parser("history-stats", help="Tag/author/day aggregates over the posting history")
+    hs.add_argument("--top", type=int, default=20)
+    hs.add_argument("--days", type=int, default=30)
+    hs.add_argument("--rebuild", action="store_true", help="Recount from history and archive (bot must be stopped)")
+    _force_arg(hs)
+
+    cp = sub.add_parser("compact", help="Move old history into compressed archive segments")
+    cp.add_argument("--keep-days", type=int, default=None, help="Keep records newer than N days (default HISTORY_KEEP_DAYS)")
+    cp.add_argument("--keep-entries", type=int, default=None, help="Keep the last N records (default HISTORY_KEEP_ENTRIES)")
+    _force_arg(cp)
+
+    ar = sub.add_parser("archive", help="List archive segments, or search them with --segment/--tag/--url")
+    ar.add_argument("--segment", type=str, default=None, help="YYYY-MM or 'undated'")
+    ar.add_argument("--tag", type=str, default=None)
+    ar.add_argument("--url", type=str, default=None)
+    ar.add_argument("--limit", type=int, default=50)
+
+    ex = sub.add_parser("export", help="Stream posting history (archive + hot) to NDJSON/CSV; '-' for stdout")
+    ex.add_argument("out", type=str)
+    ex.add_argument("--format", choices=history_io.FORMATS, default=None, help="Default: by file extension")
+    ex.add_argument("--no-archive", action="store_true", help="Export only the hot history file")
+
+    im = sub.add_parser("import", help="Stream NDJSON/CSV records into the history archive (bot must be stopped)")
+    im.add_argument("path", type=str)
+    im.add_argument("--format", choices=history_io.FORMATS, default=None, help="Default: by file extension")
+    _target_args(im)
+    im.add_argument("--batch", type=int, default=5000)
+    im.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over")
+    _force_arg(im)
+
+    bf = sub.add_parser("backfill", help="Resolve Derpibooru IDs/URLs (one per line) and mark them as posted")
+    bf.add_argument("path", type=str)
+    _target_args(bf)
+    bf.add_argument("--concurrency", type=int, default=4)
+    bf.add_argument("--filter-id", type=int, default=None, help="Derpibooru filter for lookups (default FILTER_ID)")
+    bf.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over")
+    _force_arg(bf)
 
     return p
 
@@ -93,8 +426,26 @@ async def _amain(args: argparse.Namespace) -> None:
         await cmd_set_filter(args.value)
     elif args.cmd == "set-tags":
         await cmd_set_tags(args.text)
+    elif args.cmd == "set-mode":
+        await cmd_set_mode(args.mode)
     elif args.cmd == "post-now":
-        await cmd_post_now(args.base_url)
+        await cmd_post_now(args.base_url, args.tags)
+    elif args.cmd == "stats":
+        await cmd_stats()
+    elif args.cmd == "queue":
+        await cmd_queue()
+    elif args.cmd == "history-stats":
+        await cmd_history_stats(max(1, args.top), max(1, args.days), args.rebuild, args.force)
+    elif args.cmd == "compact":
+        await cmd_compact(args.keep_days, args.keep_entries, args.force)
+    elif args.cmd == "archive":
+        await cmd_archive(args.segment, args.tag, args.url, args.limit)
+    elif args.cmd == "export":
+        await cmd_export(args.out, args.format, not args.no_archive)
+    elif args.cmd == "import":
+        await cmd_import(args.path, args.format, args.to_archive, max(1, args.batch), args.restart, args.force)
+    elif args.cmd == "backfill":
+        await cmd_backfill(args.path, args.to_archive, max(1, args.concurrency), args.filter_id, args.restart, args.force)
     else:
         raise RuntimeError("Unknown command")
 
@@ -102,7 +453,10 @@ async def _amain(args: argparse.Namespace) -> None:
 def run() -> None:
     parser = build_parser()
     args = parser.parse_args()
-    asyncio.run(_amain(args))
+    try:
+        asyncio.run(_amain(args))
+    except control.ControlError as e:
+        raise SystemExit(f"error: {e}")
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from pathlib import Path
+from typing import FrozenSet, Optional
 import os
 from dotenv import load_dotenv
 
@@ -14,24 +15,82 @@ def env(name: str, cast=str, default=None):
     return cast(v)
 
 
+def flag(v) -> bool:
+    return str(v).strip().lower() in {"1", "true", "yes", "on"}
+
+
+def int_set(v) -> FrozenSet[int]:
+    return frozenset(int(x) for x in str(v or "").replace(",", " ").split())
+
+
+def optional_path(v) -> Optional[Path]:
+    # пустое значение выключает функцию
+    return Path(v.strip()) if v and v.strip() else None
+
+
 @dataclass(frozen=True)
 class Config:
     telegram_token: str
     channel_id: int
+    telegram_webhook_url: str
+    telegram_webhook_secret: str
+    telegram_admin_ids: FrozenSet[int]
+    telegram_admin_workers: int
 
     derpibooru_token: str
     derpi_search_url: str
     filter_id: int
 
     post_interval_minutes: int
+    slot_budget_seconds: int
 
     web_host: str
     web_port: int
+    web_workers: int
+    event_bus_path: Path
+    control_socket: Optional[Path]
 
     settings_file: Path
     sent_images_file: Path
+    feed_state_file: Path
+    stats_snapshot_file: Path
+    history_archive_dir: Path
+    history_keep_days: int
+    history_keep_entries: int
+    dedupe_bloom_path: Optional[Path]
+    dedupe_bloom_capacity: int
+    dedupe_bloom_fp_rate: float
 
     http_pool_limit: int
+    http_api_per_host: int
+    http_cdn_per_host: int
+    http_telegram_per_host: int
+    http_keepalive_seconds: float
+    http_compress_min_bytes: int
+
+    merge_tag_queries: bool
+    local_filters: bool
+
+    preprocess_workers: int
+    preprocess_mem_mb: int
+    preprocess_cache_mb: int
+
+    blob_cache_dir: Path
+    blob_cache_mb: int
+
+    hedge_requests: bool
+    hedge_percentile: float
+
+    loop_monitor: bool
+    loop_lag_interval_ms: int
+    slow_callback_ms: int
+    loop_stall_stack_ms: int
+
+    leader_election: str
+    leader_lease_path: Path
+    leader_lease_seconds: float
+    instance_id: str
+    shared_state_poll_seconds: float
 
     admin_user: str
     admin_password: str
@@ -46,20 +105,65 @@ def load_config() -> Config:
     return Config(
         telegram_token=env("TELEGRAM_TOKEN", str),
         channel_id=env("CHANNEL_ID", int),
+        telegram_webhook_url=os.getenv("TELEGRAM_WEBHOOK_URL", "").strip(),
+        telegram_webhook_secret=os.getenv("TELEGRAM_WEBHOOK_SECRET", "").strip(),
+        telegram_admin_ids=int_set(os.getenv("TELEGRAM_ADMIN_IDS")),
+        telegram_admin_workers=env("TELEGRAM_ADMIN_WORKERS", int, 4),
 
         derpibooru_token=env("DERPIBOORU_TOKEN", str),
         derpi_search_url=env("DERPI_SEARCH_URL", str),
         filter_id=env("FILTER_ID", int, 56027),
 
         post_interval_minutes=env("POST_INTERVAL_MINUTES", int, 60),
+        slot_budget_seconds=env("SLOT_BUDGET_SECONDS", int, 180),
 
         web_host=env("WEB_HOST", str, "0.0.0.0"),
         web_port=env("WEB_PORT", int, 8080),
+        web_workers=env("WEB_WORKERS", int, 0),
+        event_bus_path=Path(env("EVENT_BUS_PATH", str, "derpi-bot.bus.sock")),
+        control_socket=optional_path(os.getenv("CONTROL_SOCKET", "derpi-bot.ctl.sock")),
 
         settings_file=Path(env("SETTINGS_FILE", str, "settings.json")),
         sent_images_file=Path(env("SENT_IMAGES_FILE", str, "sent_images.json")),
+        feed_state_file=Path(env("FEED_STATE_FILE", str, "feed_state.json")),
+        stats_snapshot_file=Path(env("STATS_SNAPSHOT_FILE", str, "stats_snapshot.json")),
+        history_archive_dir=Path(env("HISTORY_ARCHIVE_DIR", str, "history_archive")),
+        history_keep_days=env("HISTORY_KEEP_DAYS", int, 0),
+        history_keep_entries=env("HISTORY_KEEP_ENTRIES", int, 0),
+        dedupe_bloom_path=optional_path(os.getenv("DEDUPE_BLOOM_PATH")),
+        dedupe_bloom_capacity=env("DEDUPE_BLOOM_CAPACITY", int, 1_000_000),
+        dedupe_bloom_fp_rate=env("DEDUPE_BLOOM_FP_RATE", float, 0.001),
 
         http_pool_limit=env("HTTP_POOL_LIMIT", int, 64),
+        http_api_per_host=env("HTTP_API_PER_HOST", int, 8),
+        http_cdn_per_host=env("HTTP_CDN_PER_HOST", int, 16),
+        http_telegram_per_host=env("HTTP_TELEGRAM_PER_HOST", int, 8),
+        http_keepalive_seconds=env("HTTP_KEEPALIVE_SECONDS", float, 60),
+        http_compress_min_bytes=env("HTTP_COMPRESS_MIN_BYTES", int, 1024),
+
+        merge_tag_queries=env("MERGE_TAG_QUERIES", flag, "1"),
+        local_filters=env("LOCAL_FILTERS", flag, "0"),
+
+        preprocess_workers=env("PREPROCESS_WORKERS", int, 0),
+        preprocess_mem_mb=env("PREPROCESS_MEM_MB", int, 1024),
+        preprocess_cache_mb=env("PREPROCESS_CACHE_MB", int, 64),
+
+        blob_cache_dir=Path(env("BLOB_CACHE_DIR", str, "blob_cache")),
+        blob_cache_mb=env("BLOB_CACHE_MB", int, 512),
+
+        hedge_requests=env("HEDGE_REQUESTS", flag, "0"),
+        hedge_percentile=env("HEDGE_PERCENTILE", float, 0.95),
+
+        loop_monitor=env("LOOP_MONITOR", flag, "0"),
+        loop_lag_interval_ms=env("LOOP_LAG_INTERVAL_MS", int, 100),
+        slow_callback_ms=env("SLOW_CALLBACK_MS", int, 100),
+        loop_stall_stack_ms=env("LOOP_STALL_STACK_MS", int, 0),
+
+        leader_election=os.getenv("LEADER_ELECTION", "").strip().lower(),
+        leader_lease_path=Path(env("LEADER_LEASE_PATH", str, "leader.db")),
+        leader_lease_seconds=env("LEADER_LEASE_SECONDS", float, 15),
+        instance_id=os.getenv("INSTANCE_ID", "").strip(),
+        shared_state_poll_seconds=env("SHARED_STATE_POLL_SECONDS", float, 2),
 
         admin_user=env("ADMIN_USER", str, "admin"),
         admin_password=env("ADMIN_PASSWORD", str),
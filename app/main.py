@@ -2,16 +2,91 @@ from __future__ import annotations
 import asyncio
 import logging
 import sys
+from contextlib import suppress
+from datetime import datetime, timedelta, timezone
 from aiohttp import web
 
 from app.config import load_config
 from app.storage.settings_store import SettingsStore
 from app.storage.sent_store import SentImageStore
+from app.storage.feed_state import FeedStateStore
+from app.storage.archive import HistoryArchive
+from app.storage.blob_cache import BlobCache
+from app.storage.bloom import BloomFilter
+from app.storage.stats import HistoryStats
 from app.services.derpi import DerpiClient
 from app.services.telegram_client import TelegramClient
 from app.services.autoposter import AutoPoster
+from app.services.filter_engine import FilterEngine
+from app.services.hedging import Hedger
+from app.services.leader import LeaderElector, default_holder, make_lease
+from app.services.transport import API, CDN, TELEGRAM, Transport
+from app.services.preprocess import ImagePreprocessor, pillow_available
+from app.services.startup import Startup
+from app.services.loop_monitor import monitor_from_config
+from app.services.control import ControlServer, ControlService
+from app.services.admin_bot import AdminBot
+from app.services.event_bus import EventBusServer
 from app.web.ws import WsHub
 from app.web.app_factory import create_web_app
+from app.web.worker import ADMIN_UPDATE, POSTER_STATE, SETTINGS_CHANGED, WebWorkers
+
+
+POSTER_STATE_INTERVAL_S = 2.0
+RETENTION_INTERVAL_S = 3600.0
+
+
+def _post_due(sent_store: SentImageStore, settings_store: SettingsStore) -> bool:
+    # новый лидер не повторяет пост, если предыдущий отправил картинку меньше интервала назад
+    last = sent_store.recent(1)
+    if not last or not last[0].get("posted_at"):
+        return True
+    with suppress(ValueError):
+        posted = datetime.fromisoformat(last[0]["posted_at"])
+        interval = timedelta(minutes=settings_store.settings.post_interval_minutes)
+        return datetime.now(timezone.utc) - posted >= interval
+    return True
+
+
+async def _sync_shared_state(settings_store, sent_store, autoposter, ws_hub, poll_s: float) -> None:
+    # несколько реплик работают с одними файлами: подхватываем чужие изменения
+    while True:
+        await asyncio.sleep(poll_s)
+        try:
+            if await settings_store.reload_if_changed():
+                autoposter.notify_settings_changed()
+            for record in await sent_store.reload_if_changed():
+                await ws_hub.broadcast("new_image", {"record": record.to_dict()})
+        except Exception as e:
+            logging.warning("shared state sync failed: %r", e)
+
+
+async def _publish_poster_state(bus: EventBusServer, autoposter: AutoPoster, metrics) -> None:
+    # веб-воркеры отдают статистику постера из последнего снимка
+    while True:
+        try:
+            await bus.broadcast(POSTER_STATE, {
+                "next_run_at": autoposter.next_run_at.isoformat() if autoposter.next_run_at else None,
+                "group_stats": autoposter.group_stats(),
+                "pool_depth": autoposter.pool_depth(),
+                "metrics": metrics(),
+            })
+        except Exception as e:
+            logging.warning("poster state publish failed: %r", e)
+        await asyncio.sleep(POSTER_STATE_INTERVAL_S)
+
+
+async def _apply_retention(sent_store: SentImageStore, autoposter: AutoPoster, keep_days: int, keep_entries: int) -> None:
+    # историю переписывает только постящая реплика
+    while True:
+        if autoposter.running:
+            try:
+                result = await sent_store.compact(keep_days=keep_days, keep_entries=keep_entries)
+                if result["moved"]:
+                    logging.info("history retention: %s", result)
+            except Exception as e:
+                logging.warning("history retention failed: %r", e)
+        await asyncio.sleep(RETENTION_INTERVAL_S)
 
 
 def setup_logging():
@@ -22,58 +97,301 @@ def setup_logging():
     )
 
 
+async def _probe_chat(tg: TelegramClient, channel_id: int) -> None:
+    # проверка доступа к каналу не задерживает запуск — только пишет в лог
+    try:
+        chat = await tg.get_chat()
+        print("OK chat:", chat.id, chat.title)
+    except Exception as e:
+        print("Cannot access chat_id:", channel_id, "error:", repr(e))
+
+
+async def _register_webhook(tg: TelegramClient, url: str, secret: str) -> None:
+    # как и проверка канала, не задерживает запуск; вебхук остаётся и после остановки —
+    # пропущенные апдейты Telegram доставит при следующем запуске
+    try:
+        await tg.set_webhook(url, secret)
+        logging.info("Telegram webhook: %s", url)
+    except Exception as e:
+        logging.warning("cannot set Telegram webhook %s: %r", url, e)
+
+
 async def main():
     setup_logging()
+    startup = Startup()
     cfg = load_config()
+    if cfg.telegram_webhook_url and not cfg.telegram_webhook_secret:
+        raise RuntimeError("TELEGRAM_WEBHOOK_SECRET is required when TELEGRAM_WEBHOOK_URL is set")
+
+    loop_monitor = monitor_from_config(cfg)
+    if loop_monitor:
+        loop_monitor.start()
 
+    # сначала только конструируем объекты (дёшево), загрузка и сеть — ниже, параллельно
     settings_store = SettingsStore(
         cfg.settings_file,
         default_interval=cfg.post_interval_minutes,
         default_filter_id=cfg.filter_id
     )
-    await settings_store.load()
+    bloom = None
+    if cfg.dedupe_bloom_path:
+        bloom = BloomFilter(cfg.dedupe_bloom_path, cfg.dedupe_bloom_capacity, cfg.dedupe_bloom_fp_rate)
+    sent_store = SentImageStore(
+        cfg.sent_images_file,
+        bloom=bloom,
+        archive=HistoryArchive(cfg.history_archive_dir),
+        stats=HistoryStats(cfg.stats_snapshot_file),
+    )
+    feed_state = FeedStateStore(cfg.feed_state_file)
 
-    sent_store = SentImageStore(cfg.sent_images_file)
+    search_hedger = dl_hedger = None
+    if cfg.hedge_requests:
+        search_hedger = Hedger("derpi-search", percentile=cfg.hedge_percentile)
+        dl_hedger = Hedger("image-download", percentile=cfg.hedge_percentile)
+
+    transport = Transport(
+        total_limit=cfg.http_pool_limit,
+        per_host={
+            API: cfg.http_api_per_host,
+            CDN: cfg.http_cdn_per_host,
+            TELEGRAM: cfg.http_telegram_per_host,
+        },
+        keepalive_s=cfg.http_keepalive_seconds,
+    )
 
     derpi = DerpiClient(
         token=cfg.derpibooru_token,
         search_url=cfg.derpi_search_url,
         filter_id=cfg.filter_id,
         http_pool_limit=cfg.http_pool_limit,
+        hedger=search_hedger,
+        transport=transport,
     )
-    await derpi.start()
 
-    tg = TelegramClient(cfg.telegram_token, cfg.channel_id)
+    preprocessor = None
+    if cfg.preprocess_workers > 0:
+        if pillow_available():
+            preprocessor = ImagePreprocessor(
+                workers=cfg.preprocess_workers,
+                mem_limit_mb=cfg.preprocess_mem_mb,
+                cache_mb=cfg.preprocess_cache_mb,
+            )
+            preprocessor.start()
+        else:
+            logging.warning("PREPROCESS_WORKERS is set but Pillow is not installed; preprocessing disabled")
 
-    try:
-        chat = await tg._bot.get_chat(cfg.channel_id)
-        print("OK chat:", chat.id, chat.title)
-    except Exception as e:
-        print("Cannot access chat_id:", cfg.channel_id, "error:", repr(e))
+    blobs = None
+    if cfg.blob_cache_mb > 0:
+        blobs = BlobCache(cfg.blob_cache_dir, max_bytes=cfg.blob_cache_mb * 1024 * 1024)
+
+    tg = TelegramClient(
+        cfg.telegram_token,
+        cfg.channel_id,
+        preprocessor=preprocessor,
+        blobs=blobs,
+        hedger=dl_hedger,
+        transport=transport,
+    )
+
+    # с веб-воркерами события уходят в шину, а не напрямую в WebSocket
+    ws_hub = EventBusServer(cfg.event_bus_path) if cfg.web_workers > 0 else WsHub()
+    autoposter = AutoPoster(
+        tg=tg,
+        derpi=derpi,
+        sent=sent_store,
+        settings=settings_store,
+        ws=ws_hub,
+        feed_state=feed_state,
+        filters=FilterEngine(derpi.fetch_filter) if cfg.local_filters else None,
+        merge_queries=cfg.merge_tag_queries,
+        slot_budget_s=cfg.slot_budget_seconds,
+    )
 
+    elector = None
+    if cfg.leader_election:
+        # планировщик и отправка — только у лидера; остальные реплики отдают веб-панель
+        async def on_elected(info) -> None:
+            await sent_store.reload_if_changed()
+            await feed_state.reload()
+            await autoposter.start(initial_post=_post_due(sent_store, settings_store))
 
-    ws_hub = WsHub()
-    autoposter = AutoPoster(tg=tg, derpi=derpi, sent=sent_store, settings=settings_store, ws=ws_hub)
-    await autoposter.start()
+        async def on_demoted(info) -> None:
+            await autoposter.stop()
 
-    app = create_web_app(cfg=cfg, settings_store=settings_store, sent_store=sent_store, autoposter=autoposter, ws_hub=ws_hub)
+        elector = LeaderElector(
+            make_lease(cfg.leader_election, cfg.leader_lease_path),
+            holder=cfg.instance_id or default_holder(),
+            ttl_s=cfg.leader_lease_seconds,
+            on_elected=on_elected,
+            on_demoted=on_demoted,
+        )
 
-    runner = web.AppRunner(app)
-    await runner.setup()
-    site = web.TCPSite(runner, host=cfg.web_host, port=cfg.web_port)
-    await site.start()
+    workers = WebWorkers(cfg.web_workers) if cfg.web_workers > 0 else None
 
-    logging.info("Web: http://%s:%s", cfg.web_host, cfg.web_port)
+    def metrics() -> dict:
+        return {
+            "startup": startup.status(),
+            "loop_lag": loop_monitor.lag.to_dict() if loop_monitor else None,
+            "blob_cache": blobs.stats() if blobs else None,
+            "hedging": {h.name: h.stats() for h in (search_hedger, dl_hedger) if h},
+            "candidate_pool": autoposter.pool_depth(),
+            "dedupe_filter": sent_store.bloom_stats(),
+            "transport": transport.metrics(),
+            "leader": elector.status() if elector else None,
+            "web_workers": workers.stats() if workers else None,
+            "admin_bot": admin_bot.stats() if admin_bot else None,
+        }
 
+    async def settings_broadcast() -> None:
+        if workers:
+            await ws_hub.broadcast(SETTINGS_CHANGED, {})
+
+    # одни и те же команды для CLI (сокет управления) и админ-бота в Telegram
+    control_service = ControlService(
+        settings=settings_store,
+        autoposter=autoposter,
+        sent=sent_store,
+        metrics=metrics,
+        on_settings_changed=settings_broadcast,
+    )
+
+    admin_bot = None
+    if cfg.telegram_webhook_url:
+        if not cfg.telegram_admin_ids:
+            logging.warning("TELEGRAM_WEBHOOK_URL is set but TELEGRAM_ADMIN_IDS is empty; admin bot will ignore everyone")
+        admin_bot = AdminBot(
+            service=control_service,
+            send=tg.send_text,
+            admin_ids=cfg.telegram_admin_ids,
+            workers=cfg.telegram_admin_workers,
+        )
+
+    async def admin_updates(update) -> bool:
+        return admin_bot.submit(update)
+
+    # веб-сервер поднимается первым: /healthz отвечает сразу, остальное — 503 до готовности.
+    # всё, что запущено, закрывается в finally — в том числе если упала одна из фаз запуска
+    runner = None
+    state_task = probe_task = sync_task = retention_task = webhook_task = None
+    control = None
     try:
+        if workers:
+            async def on_command(cmd: str, args: dict) -> None:
+                if cmd == "post_now":
+                    # у не-лидера очереди нет — команду игнорируем
+                    if autoposter.running:
+                        tags = args.get("tags")
+                        await autoposter.post_now(tags if isinstance(tags, list) else None)
+                elif cmd == SETTINGS_CHANGED:
+                    await settings_store.reload_if_changed()
+                    autoposter.notify_settings_changed()
+                    await ws_hub.broadcast(SETTINGS_CHANGED, {})
+                elif cmd == ADMIN_UPDATE and admin_bot:
+                    admin_bot.submit(args.get("update"))
+
+            await startup.phase("event_bus", ws_hub.start(on_command))
+            await startup.phase("web", workers.start())
+            logging.info("Web: http://%s:%s (%s workers)", cfg.web_host, cfg.web_port, cfg.web_workers)
+        else:
+            app = create_web_app(
+                cfg=cfg,
+                settings_store=settings_store,
+                sent_store=sent_store,
+                autoposter=autoposter,
+                ws_hub=ws_hub,
+                metrics=metrics,
+                elector=elector,
+                startup=startup,
+                loop_monitor=loop_monitor,
+                admin_updates=admin_updates if admin_bot else None,
+            )
+
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, host=cfg.web_host, port=cfg.web_port)
+            await startup.phase("web", site.start())
+
+            logging.info("Web: http://%s:%s", cfg.web_host, cfg.web_port)
+
+        # независимые шаги — параллельно; aiogram импортируется в потоке внутри tg.start()
+        phases = {
+            "settings": settings_store.load(),
+            "sent_history": sent_store.load(),
+            "derpi": derpi.start(),
+            "telegram": tg.start(),
+        }
+        if blobs:
+            phases["blob_cache"] = blobs.start()
+        await startup.run(phases)
+
+        probe_task = asyncio.create_task(_probe_chat(tg, cfg.channel_id), name="probe-chat")
+
+        if elector:
+            await elector.start()
+            sync_task = asyncio.create_task(
+                _sync_shared_state(settings_store, sent_store, autoposter, ws_hub, cfg.shared_state_poll_seconds),
+                name="shared-state-sync",
+            )
+        else:
+            await autoposter.start()
+
+        if cfg.history_keep_days > 0 or cfg.history_keep_entries > 0:
+            retention_task = asyncio.create_task(
+                _apply_retention(sent_store, autoposter, cfg.history_keep_days, cfg.history_keep_entries),
+                name="history-retention",
+            )
+
+        if workers:
+            state_task = asyncio.create_task(_publish_poster_state(ws_hub, autoposter, metrics), name="poster-state")
+
+        if cfg.control_socket:
+            control = ControlServer(cfg.control_socket, control_service)
+            await control.start()
+
+        if admin_bot:
+            await admin_bot.start()
+            webhook_task = asyncio.create_task(
+                _register_webhook(tg, cfg.telegram_webhook_url, cfg.telegram_webhook_secret), name="register-webhook",
+            )
+
+        startup.mark_ready()
+
         while True:
             await asyncio.sleep(3600)
     finally:
-        await autoposter.stop()
+        if probe_task:
+            probe_task.cancel()
+        if autoposter.running:
+            # итоги по группам с последней записи истории ещё не в снимке
+            await sent_store.stats.save()
+        if control:
+            await control.close()
+        if webhook_task:
+            webhook_task.cancel()
+        if admin_bot:
+            await admin_bot.close()
+        if workers:
+            await workers.stop()
+            if state_task:
+                state_task.cancel()
+            await ws_hub.close()
+        if sync_task:
+            sync_task.cancel()
+        if retention_task:
+            retention_task.cancel()
+        if elector:
+            # отдаём аренду сразу, чтобы другая реплика не ждала её истечения
+            await elector.stop()
+        else:
+            await autoposter.stop()
         await derpi.close()
         await tg.close()
-        await runner.cleanup()
-        
+        await transport.close()
+        if runner:
+            await runner.cleanup()
+        sent_store.close()
+        if loop_monitor:
+            await loop_monitor.stop()
 
 
 def run() -> None:
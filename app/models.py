@@ -15,6 +15,10 @@ class ImageRecord:
     source: Optional[str]
     tags: List[str]
     posted_at: Optional[str]
+    image_id: Optional[int] = None
+    # что и откуда реально отправляем в Telegram; url остаётся ключом дедупликации
+    media_kind: str = "photo"
+    media_url: Optional[str] = None
 
     def to_dict(self) -> Dict[str, Any]:
         return asdict(self)
@@ -0,0 +1,148 @@
+from __future__ import annotations
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List
+
+from app.services.control import ControlError, ControlService
+
+log = logging.getLogger(__name__)
+
+# принятые вебхуком, но ещё не обработанные апдейты; сверх — 503, и Telegram повторит доставку
+QUEUE_SIZE = 256
+# Telegram повторяет апдейт, если не дождался ответа, — последние update_id помним
+SEEN_UPDATES = 1024
+
+HELP = (
+    "Команды:\n"
+    "/post [теги] — запостить сейчас (теги через пробел или запятую)\n"
+    "/interval N — интервал постинга в минутах\n"
+    "/status — настройки и время следующего поста\n"
+    "/queue — очередь и пул кандидатов"
+)
+
+
+class AdminBot:
+    # команды админов в Telegram поверх того же ControlService, что и CLI;
+    # апдейты из вебхука разбирают несколько воркеров, очередь ограничена
+    def __init__(
+        self,
+        *,
+        service: ControlService,
+        send: Callable[[int, str], Awaitable[None]],
+        admin_ids: FrozenSet[int],
+        workers: int = 4,
+    ):
+        self._service = service
+        self._send = send
+        self._admins = admin_ids
+        self._workers = max(1, workers)
+        self._queue: asyncio.Queue[Dict[str, Any]] = asyncio.Queue(QUEUE_SIZE)
+        self._seen: OrderedDict[Any, None] = OrderedDict()
+        self._tasks: List[asyncio.Task] = []
+
+    def submit(self, update: Any) -> bool:
+        # вызывается из обработчика вебхука: не ждёт, False — очередь полна
+        if not isinstance(update, dict):
+            return True
+        update_id = update.get("update_id")
+        if update_id is not None and update_id in self._seen:
+            return True
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return False
+        if update_id is not None:
+            self._seen[update_id] = None
+            if len(self._seen) > SEEN_UPDATES:
+                self._seen.popitem(last=False)
+        return True
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker(), name=f"admin-bot-{i}") for i in range(self._workers)]
+
+    async def close(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": self._queue.qsize(), "workers": len(self._tasks)}
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.handle(update)
+            except Exception as e:
+                log.warning("admin bot update %s failed: %r", update.get("update_id"), e)
+
+    async def handle(self, update: Dict[str, Any]) -> None:
+        msg = update.get("message") or {}
+        text = (msg.get("text") or "").strip()
+        chat_id = (msg.get("chat") or {}).get("id")
+        sender = (msg.get("from") or {}).get("id")
+        if not text.startswith("/") or chat_id is None:
+            return
+        if sender not in self._admins:
+            # посторонним не отвечаем, чтобы не подтверждать, что бот что-то умеет
+            log.info("admin bot: ignoring command from %s", sender)
+            return
+        name, _, args = text.partition(" ")
+        # /post@my_bot — так команды выглядят в группах
+        name = name[1:].split("@", 1)[0].lower()
+        handler = getattr(self, f"cmd_{name}", None)
+        if handler is None:
+            reply = HELP
+        else:
+            try:
+                reply = await handler(args.strip())
+            except ControlError as e:
+                reply = f"Ошибка: {e}"
+        await self._send(chat_id, reply)
+
+    async def cmd_start(self, args: str) -> str:
+        return HELP
+
+    async def cmd_help(self, args: str) -> str:
+        return HELP
+
+    async def cmd_post(self, args: str) -> str:
+        await self._service.rpc_post_now(tags=args or None)
+        return f"В очереди: {args}" if args else "В очереди: случайная группа тегов"
+
+    async def cmd_interval(self, args: str) -> str:
+        try:
+            minutes = int(args)
+        except ValueError:
+            return "Использование: /interval N (минуты)"
+        if minutes < 1:
+            return "Интервал — не меньше минуты"
+        settings = await self._service.rpc_set(interval=minutes)
+        return f"Интервал: {settings['post_interval_minutes']} мин"
+
+    async def cmd_status(self, args: str) -> str:
+        settings = await self._service.rpc_show()
+        queue = await self._service.rpc_queue()
+        return "\n".join([
+            f"Постер: {'работает' if queue['running'] else 'не на этой реплике'}",
+            f"Интервал: {settings['post_interval_minutes']} мин, режим: {settings['mode']}",
+            f"Фильтр: {settings['filter_id']}",
+            f"Групп тегов: {len(settings['tags'])}",
+            f"Следующий пост: {queue['next_run_at'] or '—'}",
+        ])
+
+    async def cmd_queue(self, args: str) -> str:
+        queue = await self._service.rpc_queue()
+        lines = [
+            f"Слотов в очереди: {queue['queued']}",
+            f"Отклонённых кандидатов: {queue['rejected']}",
+        ]
+        depth = queue["pool_depth"]
+        if depth:
+            lines.append("Пул кандидатов:")
+            lines += [f"  {group}: {n}" for group, n in sorted(depth.items())]
+        else:
+            lines.append("Пул кандидатов пуст")
+        return "\n".join(lines)
@@ -1,22 +1,70 @@
 from __future__ import annotations
 import asyncio
+import logging
 from contextlib import suppress
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 from app.storage.settings_store import SettingsStore, parse_tag_lines
 from app.storage.sent_store import SentImageStore
-from app.services.derpi import DerpiClient
-from app.services.telegram_client import TelegramClient
+from app.storage.feed_state import FeedStateStore
+from app.services.candidates import CandidatePool
+from app.services.derpi import DerpiClient, pick_url, to_record
+from app.services.filter_engine import CompiledFilter, FilterEngine, ImageView
+from app.services.ranking import rank
+from app.services.representations import choose_media
+from app.services.query_planner import merged_query, partition, plan_batches
+from app.services.tag_selector import TagGroupSelector, group_key
+from app.services.telegram_client import CandidateRejected
 from app.web.ws import WsHub
 
+if TYPE_CHECKING:
+    from app.services.telegram_client import TelegramClient
+
+log = logging.getLogger(__name__)
+
+PER_PAGE = 50
+# группы, у которых в пуле меньше кандидатов, обновляем "заодно" в общем запросе
+POOL_LOW_WATER = 3
+# лента ходит маленькими страницами: стоимость пропорциональна числу новых загрузок
+FEED_PAGE_SIZE = 20
+# потолки на этапы внутри слота; фактический таймаут — не больше остатка бюджета
+SEARCH_TIMEOUT_S = 30.0
+SEND_TIMEOUT_S = 90.0
+MAX_REJECTED = 1000
+
 
 class AutoPoster:
-    def __init__(self, *, tg: TelegramClient, derpi: DerpiClient, sent: SentImageStore, settings: SettingsStore, ws: WsHub):
+    def __init__(
+        self,
+        *,
+        tg: TelegramClient,
+        derpi: DerpiClient,
+        sent: SentImageStore,
+        settings: SettingsStore,
+        ws: WsHub,
+        feed_state: Optional[FeedStateStore] = None,
+        filters: Optional[FilterEngine] = None,
+        merge_queries: bool = True,
+        slot_budget_s: float = 180.0,
+    ):
         self._tg = tg
         self._derpi = derpi
         self._sent = sent
         self._settings = settings
         self._ws = ws
+        self._selector = TagGroupSelector()
+        self._pool = CandidatePool()
+        self._feed = feed_state
+        self._filters = filters
+        # filter_id, с которым идём в API, и локальный фильтр поверх его выдачи
+        self._search_filter: Optional[int] = None
+        self._local_filter: Optional[CompiledFilter] = None
+        self._merge_queries = merge_queries
+        self._slot_budget_s = slot_budget_s
+        # url кандидатов, которые не удалось отправить (dict как упорядоченное множество)
+        self._rejected: Dict[str, None] = {}
+        # Telegram попросил подождать (retry_after): до этого момента (loop.time()) не отправляем
+        self._resume_at = 0.0
 
         self._queue: asyncio.Queue[Optional[List[str]]] = asyncio.Queue()
         self._stop = asyncio.Event()
@@ -27,10 +75,20 @@ class AutoPoster:
 
         self.next_run_at: datetime | None = None
 
-    async def start(self) -> None:
+    @property
+    def running(self) -> bool:
+        return self._worker is not None
+
+    async def start(self, *, initial_post: bool = True) -> None:
+        if self._worker:
+            return
+        # после stop() (смена лидера) начинаем с чистой очереди
+        self._stop.clear()
+        self._queue = asyncio.Queue()
         self._worker = asyncio.create_task(self._post_loop(), name="post-loop")
         self._scheduler = asyncio.create_task(self._scheduler_loop(), name="scheduler-loop")
-        await self.post_now()
+        if initial_post:
+            await self.post_now()
 
     async def stop(self) -> None:
         self._stop.set()
@@ -41,10 +99,30 @@ class AutoPoster:
                 t.cancel()
                 with suppress(asyncio.CancelledError):
                     await t
+        self._worker = self._scheduler = None
+        self.next_run_at = None
 
     def notify_settings_changed(self) -> None:
+        # filter_id/теги могли поменяться — прошлые "пустые" результаты больше не показательны
+        self._selector.reset_cooldowns()
+        self._pool.clear()
         self._changed.set()
 
+    def pool_depth(self) -> Dict[str, int]:
+        return self._pool.depth()
+
+    def queue_info(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize(),
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at else None,
+            "pool_depth": self._pool.depth(),
+            "rejected": len(self._rejected),
+        }
+
+    def group_stats(self) -> List[dict]:
+        return self._selector.snapshot(self._settings.settings.tags)
+
     async def post_now(self, tags: Optional[List[str]] = None) -> None:
         await self._queue.put(tags)
 
@@ -71,20 +149,204 @@ class AutoPoster:
             tags = await self._queue.get()
             if self._stop.is_set():
                 break
-            await self._post(tags)
+            # ошибка одного слота (запись истории, поиск) не должна останавливать постинг
+            try:
+                await self._post(tags)
+            except Exception as e:
+                log.exception("posting slot failed")
+                await self._ws.broadcast("toast", {"type": "error", "message": f"Ошибка отправки: {e}"})
 
-    async def _post(self, tags: Optional[List[str]]) -> None:
-        chosen = tags or self._settings.settings.pick_random_tags()
-        record = await self._derpi.fetch_random_image(chosen, skip_urls=self._sent.known_urls)
-        if not record:
-            await self._ws.broadcast("toast", {"type": "warn", "message": f"Нет свежих картинок для: {chosen}"})
+    def _is_fresh(self, img: Dict[str, Any]) -> bool:
+        url = pick_url(img)
+        if not url or self._sent.contains(url) or url in self._rejected:
+            return False
+        return self._local_filter is None or not self._local_filter.hides(ImageView.of(img))
+
+    async def _resolve_filter(self) -> None:
+        # если разрешена локальная фильтрация, ищем с базовым (самым мягким) фильтром,
+        # а фильтр канала применяем сами — одна выдача подходит под любой filter_id
+        wanted = self._settings.settings.filter_id
+        base = self._derpi.default_filter_id
+        self._search_filter, self._local_filter = wanted, None
+        if self._filters is None or wanted is None or wanted == base:
             return
+        compiled = await self._filters.get(wanted)
+        if compiled is not None:
+            self._search_filter, self._local_filter = base, compiled
+
+    def _fill(
+        self,
+        tags: List[str],
+        images: List[Dict[str, Any]],
+        *,
+        total: Optional[int],
+        ordered: bool = False,
+        verdict: bool = True,
+    ) -> None:
+        fresh = [img for img in images if self._is_fresh(img) and choose_media(img) is not None]
+        # ранжирование уже даёт взвешенный случайный порядок, перемешивать пул не нужно
+        ranked = rank(fresh, self._settings.settings.candidate_rules, ordered=ordered)
+        self._pool.put(tags, ranked, shuffle=False, expires=not ordered)
+        if verdict:
+            self._selector.record_search(tags, total=total, returned=len(images), fresh=len(ranked))
+
+    def _batch_for(self, tags: List[str]) -> List[List[str]]:
+        if not self._merge_queries:
+            return [tags]
+        key = group_key(tags)
+        others = [
+            g for g in self._settings.settings.tags
+            if group_key(g) != key and self._pool.size(g) < POOL_LOW_WATER
+        ]
+        for batch in plan_batches([tags] + others, hits=self._selector.known_hits()):
+            if any(group_key(g) == key for g in batch):
+                return batch
+        return [tags]
+
+    def _feed_mode(self) -> bool:
+        return self._feed is not None and self._settings.settings.mode == "feed"
+
+    async def _refresh_feed(self, tags: List[str]) -> None:
+        page = await self._derpi.fetch_new(
+            tags, since_id=self._feed.get(tags), per_page=FEED_PAGE_SIZE, filter_id=self._search_filter,
+        )
+        if page is None:
+            return
+        self._fill(tags, page.images, total=page.total, ordered=True)
+        # high-water mark двигается по мере отправки (см. _advance_feed), а страницу
+        # целиком из уже отправленных картинок пропускаем сразу, чтобы не запрашивать её снова
+        if self._pool.size(tags) == 0:
+            ids = [img["id"] for img in page.images if isinstance(img.get("id"), int)]
+            if ids:
+                await self._feed.advance(tags, max(ids))
+
+    async def _refresh(self, tags: List[str]) -> None:
+        if self._feed_mode():
+            await self._refresh_feed(tags)
+            return
+
+        batch = self._batch_for(tags)
+        if len(batch) > 1:
+            page = await self._derpi.search_query(merged_query(batch), per_page=PER_PAGE, filter_id=self._search_filter)
+            if page is not None:
+                complete = page.total <= len(page.images)
+                parts = partition(page.images, batch)
+                for g in batch:
+                    part = parts[group_key(g)]
+                    # пустая доля неполной выдачи ничего не говорит о группе: её могли вытеснить
+                    # другие группы. остывание не назначаем, а целевую группу оценит её же поиск ниже
+                    self._fill(g, part, total=len(part) if complete else None, verdict=complete or bool(part))
+                # общая выдача могла быть забита другими группами — тогда добираем отдельно
+                if parts[group_key(tags)] or complete:
+                    return
+
+        page = await self._derpi.search(tags, per_page=PER_PAGE, filter_id=self._search_filter)
+        if page is not None:
+            self._fill(tags, page.images, total=page.total)
+
+    async def _next_candidate(self, tags: List[str]) -> Optional[Dict[str, Any]]:
+        await self._resolve_filter()
+        img = self._pool.take(tags, accept=self._is_fresh)
+        if img is None:
+            await self._refresh(tags)
+            img = self._pool.take(tags, accept=self._is_fresh)
+        return img
 
-        try:
-            await self._tg.send_image(record)
+    async def _advance_feed(self, tags: List[str], img: Dict[str, Any]) -> None:
+        # отметку двигаем только за картинкой, с которой покончено (отправлена или отклонена):
+        # fetch_new берёт id выше отметки, и неотправленная картинка ниже неё потерялась бы
+        if self._feed_mode() and isinstance(img.get("id"), int):
+            await self._feed.advance(tags, img["id"])
+
+    def _reject(self, url: str) -> None:
+        self._rejected[url] = None
+        while len(self._rejected) > MAX_REJECTED:
+            self._rejected.pop(next(iter(self._rejected)))
+
+    def _record_outcome(self, group: List[str], outcome: str) -> None:
+        # итог попытки по группе — для /api/stats; снимок сохранится со следующей записью истории
+        if self._sent.stats is not None:
+            self._sent.stats.record_group(group, outcome)
+
+    async def _post(self, tags: Optional[List[str]]) -> None:
+        # у слота есть бюджет времени: отклонённый кандидат сразу меняем на следующий из пула,
+        # пустую группу — на другую; поиск повторяется только когда кандидаты кончились.
+        # явные теги (post-now) группу не меняют
+        loop = asyncio.get_running_loop()
+        pause = self._resume_at - loop.time()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        deadline = loop.time() + self._slot_budget_s
+        tried: List[List[str]] = []
+        errors: List[str] = []
+        chosen = tags
+
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            if not tags:
+                chosen = self._selector.pick(self._settings.settings.tags, exclude=tried)
+                if chosen is None:
+                    break
+
+            try:
+                img = await asyncio.wait_for(
+                    self._next_candidate(chosen or []), timeout=min(SEARCH_TIMEOUT_S, remaining),
+                )
+            except asyncio.TimeoutError:
+                # Derpibooru не ответил — это сбой, а не пустая группа
+                errors.append(f"поиск {chosen}: таймаут")
+                if tags:
+                    break
+                self._record_outcome(chosen, "failed")
+                tried.append(chosen)
+                continue
+            if img is None:
+                if tags:
+                    break
+                self._record_outcome(chosen, "empty")
+                tried.append(chosen)
+                continue
+
+            record = to_record(img, pick_url(img))
+            remaining = deadline - loop.time()
+            try:
+                await asyncio.wait_for(self._tg.send_image(record), timeout=max(1.0, min(SEND_TIMEOUT_S, remaining)))
+            except CandidateRejected as e:
+                # битый кандидат в этом (и следующих) слотах больше не берём
+                self._reject(record.url)
+                await self._advance_feed(chosen or [], img)
+                errors.append(f"{record.url}: {e}")
+                if not tags:
+                    self._record_outcome(chosen, "failed")
+                continue
+            except asyncio.TimeoutError:
+                # отправка могла и дойти: другого кандидата в этот слот не шлём, этот в пул не
+                # возвращаем (придёт снова с поиском, если в историю так и не попал)
+                errors.append(f"{record.url}: таймаут отправки")
+                break
+            except Exception as e:
+                # сеть, лимит или права бота — следующий кандидат упадёт так же: слот прерываем,
+                # картинка остаётся первой в пуле
+                self._pool.put_back(chosen or [], img, expires=not self._feed_mode())
+                retry_after = getattr(e, "retry_after", None)
+                if retry_after:
+                    self._resume_at = loop.time() + retry_after
+                errors.append(f"{record.url}: {e!r}")
+                break
+
+            if not tags:
+                self._selector.record_post(chosen)
+                self._record_outcome(chosen, "post")
             await self._sent.add(record)
+            await self._advance_feed(chosen or [], img)
 
             await self._ws.broadcast("new_image", {"record": record.to_dict()})
             await self._ws.broadcast("toast", {"type": "ok", "message": "Картинка отправлена ✅"})
-        except Exception as e:
-            await self._ws.broadcast("toast", {"type": "error", "message": f"Ошибка отправки: {e}"})
+            return
+
+        if errors:
+            await self._ws.broadcast("toast", {"type": "error", "message": f"Ошибка отправки: {errors[-1]}"})
+        else:
+            await self._ws.broadcast("toast", {"type": "warn", "message": f"Нет свежих картинок для: {tags or tried}"})
@@ -0,0 +1,74 @@
+from __future__ import annotations
+import asyncio
+import re
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.models import ImageRecord
+from app.services.derpi import DerpiClient, pick_url, to_record
+
+# максимум per_page у Derpibooru
+ID_BATCH = 50
+
+# 12345 | https://derpibooru.org/images/12345 | https://derpibooru.org/12345?q=...
+# | https://derpicdn.net/img/2024/5/1/12345/large.png | .../img/view/2024/5/1/12345__safe_pony.png
+_PAGE_RE = re.compile(r"/(?:images/)?(\d+)(?:[/?#]|$)")
+_CDN_RE = re.compile(r"/img/(?:view/|download/)?\d{4}/\d{1,2}/\d{1,2}/(\d+)")
+
+
+def parse_ref(raw: str) -> Optional[int]:
+    ref = raw.strip()
+    if not ref or ref.startswith("#"):
+        return None
+    if ref.isdigit():
+        return int(ref)
+    m = _CDN_RE.search(ref) or _PAGE_RE.search(ref)
+    return int(m.group(1)) if m else None
+
+
+def id_query(ids: List[int]) -> str:
+    return " || ".join(f"id:{i}" for i in ids)
+
+
+async def resolve_batches(
+    derpi: DerpiClient,
+    batches: List[List[int]],
+    *,
+    concurrency: int,
+    filter_id: Optional[int],
+) -> AsyncIterator[Tuple[int, List[ImageRecord], List[int]]]:
+    # пачки id -> (номер пачки, записи, не найденные id); выдаёт в порядке завершения,
+    # одновременно в полёте не больше concurrency запросов
+    queue: asyncio.Queue = asyncio.Queue()
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(index: int, ids: List[int]) -> None:
+        async with sem:
+            try:
+                page = await derpi.search_query(id_query(ids), per_page=ID_BATCH, filter_id=filter_id)
+            except Exception as e:
+                await queue.put((index, None, e))
+                return
+        await queue.put((index, page, None))
+
+    tasks = [asyncio.create_task(one(i, ids)) for i, ids in enumerate(batches)]
+    try:
+        for _ in range(len(tasks)):
+            index, page, error = await queue.get()
+            if error is not None:
+                raise error
+            if page is None:
+                raise RuntimeError(f"Derpibooru search failed for batch {index}")
+            found: Dict[int, ImageRecord] = {}
+            for img in page.images:
+                url = pick_url(img)
+                if url and img.get("id") is not None:
+                    record = to_record(img, url)
+                    # когда картинку постили, неизвестно
+                    record.posted_at = None
+                    found[int(img["id"])] = record
+            wanted = batches[index]
+            yield index, [found[i] for i in wanted if i in found], [i for i in wanted if i not in found]
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,49 @@
+from __future__ import annotations
+import random
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from app.services.tag_selector import GroupKey, group_key
+
+CANDIDATE_TTL_S = 30 * 60
+
+
+class CandidatePool:
+    def __init__(self, *, ttl_s: float = CANDIDATE_TTL_S):
+        self._ttl_s = ttl_s
+        self._pools: Dict[GroupKey, Deque[Tuple[float, Dict[str, Any]]]] = {}
+
+    def put(self, tags: Sequence[str], images: List[Dict[str, Any]], *, shuffle: bool = True, expires: bool = True) -> None:
+        # в режиме ленты порядок важен и кандидаты не устаревают — это очередь на публикацию
+        if shuffle:
+            images = list(images)
+            random.shuffle(images)
+        expires_at = time.monotonic() + self._ttl_s if expires else float("inf")
+        pool = self._pools.setdefault(group_key(tags), deque())
+        pool.extend((expires_at, img) for img in images)
+
+    def take(self, tags: Sequence[str], *, accept: Callable[[Dict[str, Any]], bool]) -> Optional[Dict[str, Any]]:
+        pool = self._pools.get(group_key(tags))
+        if not pool:
+            return None
+        now = time.monotonic()
+        while pool:
+            expires_at, img = pool.popleft()
+            if expires_at >= now and accept(img):
+                return img
+        return None
+
+    def put_back(self, tags: Sequence[str], img: Dict[str, Any], *, expires: bool = True) -> None:
+        # кандидат не отправлен не по своей вине — он первым пойдёт в следующем слоте
+        expires_at = time.monotonic() + self._ttl_s if expires else float("inf")
+        self._pools.setdefault(group_key(tags), deque()).appendleft((expires_at, img))
+
+    def size(self, tags: Sequence[str]) -> int:
+        return len(self._pools.get(group_key(tags), ()))
+
+    def clear(self) -> None:
+        self._pools.clear()
+
+    def depth(self) -> Dict[str, int]:
+        return {", ".join(key): len(pool) for key, pool in self._pools.items()}
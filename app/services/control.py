@@ -0,0 +1,187 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+from contextlib import suppress
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.storage.sent_store import SentImageStore
+from app.storage.settings_store import POST_MODES, SettingsStore, parse_tag_lines
+
+log = logging.getLogger(__name__)
+
+# запрос:  {"id": 1, "method": "set", "params": {...}}
+# ответ:   {"id": 1, "ok": true, "result": ...} | {"id": 1, "ok": false, "error": "..."}
+LINE_LIMIT = 1024 * 1024
+
+
+class ControlError(Exception):
+    pass
+
+
+def _peer_uid(writer: asyncio.StreamWriter) -> Optional[int]:
+    sock = writer.get_extra_info("socket")
+    if sock is None or not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    _, uid, _ = struct.unpack("3i", creds)
+    return uid
+
+
+class ControlService:
+    # методы RPC поверх того же SettingsStore/AutoPoster, что и веб-панель
+    def __init__(
+        self,
+        *,
+        settings: SettingsStore,
+        autoposter,
+        metrics: Callable[[], Dict[str, Any]],
+        sent: Optional[SentImageStore] = None,
+        on_settings_changed: Optional[Callable[[], Awaitable[None]]] = None,
+    ):
+        self._settings = settings
+        self._autoposter = autoposter
+        self._metrics = metrics
+        self._sent = sent
+        self._on_settings_changed = on_settings_changed
+
+    async def call(self, method: str, params: Dict[str, Any]) -> Any:
+        handler = getattr(self, f"rpc_{method.replace('-', '_')}", None)
+        if handler is None:
+            raise ControlError(f"unknown method: {method}")
+        return await handler(**params)
+
+    async def rpc_show(self) -> Dict[str, Any]:
+        return self._settings.settings.to_dict()
+
+    async def rpc_set(
+        self,
+        *,
+        interval: Optional[int] = None,
+        filter_id: Any = "keep",
+        tags: Optional[str] = None,
+        mode: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        if mode is not None and mode not in POST_MODES:
+            raise ControlError(f"mode must be one of {POST_MODES}")
+        if tags is not None and not parse_tag_lines(tags):
+            raise ControlError("no tag groups in text")
+        # "keep" — не трогать; None — выключить фильтр
+        fid = self._settings.settings.filter_id if filter_id == "keep" else filter_id
+        if fid is not None:
+            fid = int(fid)
+        await self._settings.update(
+            tags_raw=tags,
+            interval=None if interval is None else int(interval),
+            filter_id=fid,
+            mode=mode,
+        )
+        self._autoposter.notify_settings_changed()
+        if self._on_settings_changed:
+            await self._on_settings_changed()
+        return self._settings.settings.to_dict()
+
+    async def rpc_post_now(self, *, tags: Optional[str] = None) -> Dict[str, Any]:
+        if not self._autoposter.running:
+            raise ControlError("autoposter is not running on this instance (not the leader?)")
+        parsed = parse_tag_lines(tags) if tags else []
+        await self._autoposter.post_now(parsed[0] if parsed else None)
+        return {"queued": True}
+
+    async def rpc_stats(self) -> Dict[str, Any]:
+        return self._metrics()
+
+    async def rpc_compact(self, *, keep_days: int = 0, keep_entries: int = 0) -> Dict[str, Any]:
+        # файл истории переписывает постящая реплика, иначе её следующий add() вернёт всё назад
+        if self._sent is None or not self._autoposter.running:
+            raise ControlError("history is owned by the posting instance (not the leader?)")
+        return await self._sent.compact(keep_days=int(keep_days), keep_entries=int(keep_entries))
+
+    async def rpc_history_stats(self, *, top: int = 20, days: int = 30) -> Dict[str, Any]:
+        if self._sent is None or self._sent.stats is None:
+            raise ControlError("stats are disabled")
+        return self._sent.stats.summary(top=int(top), days=int(days))
+
+    async def rpc_queue(self) -> Dict[str, Any]:
+        return {
+            **self._autoposter.queue_info(),
+            "group_stats": self._autoposter.group_stats(),
+        }
+
+
+class ControlServer:
+    def __init__(self, path: Path, service: ControlService):
+        self._path = path
+        self._service = service
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        with suppress(FileNotFoundError):
+            self._path.unlink()
+        # права на сокет выставляем до listen(): umask закрывает окно между bind и chmod
+        old_umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(self._handle, path=str(self._path), limit=LINE_LIMIT)
+        finally:
+            os.umask(old_umask)
+
+    async def close(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        with suppress(FileNotFoundError):
+            self._path.unlink()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        uid = _peer_uid(writer)
+        if uid is not None and uid not in (0, os.getuid()):
+            log.warning("control socket: rejected peer uid %s", uid)
+            writer.close()
+            return
+        try:
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    break
+                reply: Dict[str, Any] = {"id": None, "ok": False}
+                try:
+                    msg = json.loads(raw)
+                    reply["id"] = msg.get("id")
+                    params = msg.get("params") or {}
+                    if not isinstance(params, dict):
+                        raise ControlError("params must be an object")
+                    reply["result"] = await self._service.call(str(msg.get("method")), params)
+                    reply["ok"] = True
+                except (ControlError, TypeError, ValueError) as e:
+                    reply["error"] = str(e)
+                except Exception as e:
+                    log.warning("control call failed: %r", e)
+                    reply["error"] = repr(e)
+                writer.write(json.dumps(reply, ensure_ascii=False).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+
+async def call(path: Path, method: str, **params: Any) -> Any:
+    # клиент для CLI; ConnectionError/FileNotFoundError — процесс не запущен
+    reader, writer = await asyncio.open_unix_connection(str(path), limit=LINE_LIMIT)
+    try:
+        writer.write(json.dumps({"id": 1, "method": method, "params": params}).encode() + b"\n")
+        await writer.drain()
+        raw = await reader.readline()
+    finally:
+        writer.close()
+    if not raw:
+        raise ConnectionError("control socket closed the connection")
+    reply = json.loads(raw)
+    if not reply.get("ok"):
+        raise ControlError(reply.get("error") or "control call failed")
+    return reply.get("result")
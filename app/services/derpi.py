@@ -1,29 +1,77 @@
 from __future__ import annotations
 import aiohttp
 import asyncio
-import random
-from typing import Any, Dict, List, Optional, Set
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from app import codec
 from app.models import ImageRecord, now_iso
+from app.services.hedging import FirstByte, Hedger
+from app.services.query_planner import group_query
+from app.services.transport import API, Transport
+from app.services.representations import choose_media
+
+
+# маркер "использовать filter_id клиента по умолчанию" (None — искать без фильтра)
+DEFAULT_FILTER: Any = object()
+
+
+@dataclass
+class SearchPage:
+    images: List[Dict[str, Any]]
+    total: int
+
+
+def pick_url(img: Dict[str, Any]) -> Optional[str]:
+    reps = img.get("representations", {}) or {}
+    return reps.get("large") or reps.get("full") or reps.get("medium")
+
+
+def to_record(img: Dict[str, Any], url: str) -> ImageRecord:
+    media = choose_media(img)
+    return ImageRecord(
+        url=url,
+        author=img.get("uploader"),
+        source=img.get("view_url"),
+        tags=img.get("tags", []) or [],
+        posted_at=now_iso(),
+        image_id=img.get("id"),
+        media_kind=media.kind if media else "photo",
+        media_url=media.url if media else url,
+    )
 
 
 class DerpiClient:
-    def __init__(self, *, token: str, search_url: str, filter_id: int, http_pool_limit: int):
+    def __init__(
+        self,
+        *,
+        token: str,
+        search_url: str,
+        filter_id: int,
+        http_pool_limit: int,
+        hedger: Optional[Hedger] = None,
+        transport: Optional[Transport] = None,
+    ):
         self._token = token
         self._search_url = search_url
         self._filter_id = filter_id
         self._http_pool_limit = http_pool_limit
         self._session: aiohttp.ClientSession | None = None
+        self._hedger = hedger
+        self._transport = transport
 
     async def start(self) -> None:
         if self._session:
             return
+        timeout = aiohttp.ClientTimeout(total=20)
+        if self._transport:
+            self._session = self._transport.session(API, timeout=timeout)
+            return
         connector = aiohttp.TCPConnector(
             limit=self._http_pool_limit,
             ttl_dns_cache=300,
             enable_cleanup_closed=True,
             keepalive_timeout=30,
         )
-        timeout = aiohttp.ClientTimeout(total=20)
         self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
 
     async def close(self) -> None:
@@ -31,49 +79,114 @@ class DerpiClient:
             await self._session.close()
             self._session = None
 
-    async def fetch_random_image(self, tags: List[str], *, skip_urls: Set[str]) -> Optional[ImageRecord]:
+    @property
+    def default_filter_id(self) -> Optional[int]:
+        return self._filter_id
+
+    async def search(
+        self,
+        tags: List[str],
+        *,
+        page: int = 1,
+        per_page: int = 50,
+        filter_id: Optional[int] = DEFAULT_FILTER,
+    ) -> Optional[SearchPage]:
+        return await self.search_query(group_query(tags), page=page, per_page=per_page, filter_id=filter_id)
+
+    async def fetch_new(
+        self,
+        tags: List[str],
+        *,
+        since_id: Optional[int],
+        per_page: int = 20,
+        filter_id: Optional[int] = DEFAULT_FILTER,
+    ) -> Optional[SearchPage]:
+        # режим ленты: только загрузки новее high-water mark, по возрастанию id
+        if since_id is None:
+            # первый запуск — берём последнюю страницу, а не весь каталог с начала
+            page = await self.search_query(
+                group_query(tags), per_page=per_page, sort_field="id", sort_direction="desc", filter_id=filter_id,
+            )
+            if page is not None:
+                page.images.reverse()
+            return page
+        query = f"({group_query(tags)}), id.gt:{since_id}"
+        return await self.search_query(
+            query, per_page=per_page, sort_field="id", sort_direction="asc", filter_id=filter_id,
+        )
+
+    async def fetch_filter(self, filter_id: int) -> Optional[Dict[str, Any]]:
         if not self._session:
             raise RuntimeError("DerpiClient not started")
+        url = self._search_url.replace("/search/images", f"/filters/{filter_id}")
+        try:
+            async with self._session.get(url, params={"key": self._token}) as resp:
+                if resp.status != 200:
+                    return None
+                payload = codec.loads(await resp.read())
+                return payload.get("filter")
+        except (aiohttp.ClientError, ValueError):
+            return None
 
+    async def search_query(
+        self,
+        query: str,
+        *,
+        page: int = 1,
+        per_page: int = 50,
+        sort_field: Optional[str] = None,
+        sort_direction: Optional[str] = None,
+        filter_id: Optional[int] = DEFAULT_FILTER,
+    ) -> Optional[SearchPage]:
+        if not self._session:
+            raise RuntimeError("DerpiClient not started")
+
+        if filter_id is DEFAULT_FILTER:
+            filter_id = self._filter_id
         params: Dict[str, Any] = {
-            "q": " ".join(tags),
-            "per_page": 50,
-            "page": 1,
+            "q": query,
+            "per_page": per_page,
+            "page": page,
             "key": self._token,
-            "filter_id": self._filter_id,
         }
+        if filter_id is not None:
+            params["filter_id"] = filter_id
+        if sort_field:
+            params["sf"] = sort_field
+        if sort_direction:
+            params["sd"] = sort_direction
 
         backoff = 1
         for _ in range(6):
             try:
-                async with self._session.get(self._search_url, params=params) as resp:
-                    if resp.status == 200:
-                        payload = await resp.json()
-                        images = payload.get("images", [])
-                        random.shuffle(images)
-                        for img in images:
-                            reps = img.get("representations", {}) or {}
-                            url = reps.get("large") or reps.get("full") or reps.get("medium")
-                            if not url or url in skip_urls:
-                                continue
-                            return ImageRecord(
-                                url=url,
-                                author=img.get("uploader"),
-                                source=img.get("view_url"),
-                                tags=img.get("tags", []) or [],
-                                posted_at=now_iso(),
-                            )
-                        return None
-
-                    if resp.status in (429, 500, 502, 503, 504):
-                        await asyncio.sleep(backoff)
-                        backoff = min(backoff * 2, 30)
-                        continue
+                if self._hedger:
+                    status, payload = await self._hedger.run(lambda _i, fb: self._request(params, fb))
+                else:
+                    status, payload = await self._request(params)
 
-                    return None
+                if status == 200 and payload is not None:
+                    return payload
+
+                if status in (429, 500, 502, 503, 504):
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 30)
+                    continue
 
-            except aiohttp.ClientError:
+                return None
+
+            except (aiohttp.ClientError, ValueError):
+                # ValueError — 200 с не-JSON телом (страница Cloudflare/техработ), тоже повторяем
                 await asyncio.sleep(backoff)
                 backoff = min(backoff * 2, 30)
 
         return None
+
+    async def _request(self, params: Dict[str, Any], fb: Optional[FirstByte] = None) -> Tuple[int, Optional[SearchPage]]:
+        async with self._session.get(self._search_url, params=params) as resp:
+            if fb:
+                fb.mark()
+            if resp.status != 200:
+                return resp.status, None
+            # из выдачи берём только нужные поля (см. codec.IMAGE_FIELDS)
+            images, total = codec.decode_search(await resp.read())
+            return resp.status, SearchPage(images=images, total=total)
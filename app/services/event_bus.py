@@ -0,0 +1,146 @@
+from __future__ import annotations
+import asyncio
+import logging
+import os
+from contextlib import suppress
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from app import codec
+
+log = logging.getLogger(__name__)
+
+# одна строка JSON на сообщение:
+#   {"type": "event", "event": ..., "data": {...}}   постер -> веб-воркеры
+#   {"type": "command", "cmd": ..., "args": {...}}   веб-воркер -> постер
+LINE_LIMIT = 4 * 1024 * 1024
+# подписчик, который не успевает читать, отключается, а не тормозит постинг
+MAX_BUFFERED = 8 * 1024 * 1024
+RECONNECT_S = 1.0
+
+CommandHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+EventHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+def _encode(msg: Dict[str, Any]) -> bytes:
+    return codec.dumps(msg) + b"\n"
+
+
+class EventBusServer:
+    # сторона постера; broadcast() совместим с WsHub, поэтому AutoPoster публикует в шину как в хаб
+    def __init__(self, path: Path):
+        self._path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._subscribers: Set[asyncio.StreamWriter] = set()
+        self._on_command: Optional[CommandHandler] = None
+
+    async def start(self, on_command: CommandHandler) -> None:
+        self._on_command = on_command
+        with suppress(FileNotFoundError):
+            self._path.unlink()
+        self._server = await asyncio.start_unix_server(self._handle, path=str(self._path), limit=LINE_LIMIT)
+        # только процессы того же пользователя
+        os.chmod(self._path, 0o600)
+
+    async def close(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for w in list(self._subscribers):
+            w.close()
+        self._subscribers.clear()
+        with suppress(FileNotFoundError):
+            self._path.unlink()
+
+    async def broadcast(self, event: str, data: Dict[str, Any]) -> None:
+        line = _encode({"type": "event", "event": event, "data": data})
+        for w in list(self._subscribers):
+            if w.is_closing() or w.transport.get_write_buffer_size() > MAX_BUFFERED:
+                self._subscribers.discard(w)
+                w.close()
+                continue
+            w.write(line)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._subscribers.add(writer)
+        try:
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    break
+                try:
+                    msg = codec.loads(raw)
+                except ValueError:
+                    continue
+                if isinstance(msg, dict) and msg.get("type") == "command" and self._on_command:
+                    try:
+                        await self._on_command(str(msg.get("cmd")), msg.get("args") or {})
+                    except Exception as e:
+                        log.warning("bus command %r failed: %r", msg.get("cmd"), e)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            self._subscribers.discard(writer)
+            writer.close()
+
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+
+class EventBusClient:
+    # сторона веб-воркера: держит соединение с постером и переподключается, если он перезапустился
+    def __init__(self, path: Path, on_event: EventHandler):
+        self._path = path
+        self._on_event = on_event
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if not self._task:
+            self._task = asyncio.create_task(self._loop(), name="event-bus-client")
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def command(self, cmd: str, **args: Any) -> None:
+        if not self.connected:
+            raise ConnectionError("event bus is not connected")
+        self._writer.write(_encode({"type": "command", "cmd": cmd, "args": args}))
+        await self._writer.drain()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(str(self._path), limit=LINE_LIMIT)
+            except OSError:
+                await asyncio.sleep(RECONNECT_S)
+                continue
+            try:
+                while True:
+                    raw = await reader.readline()
+                    if not raw:
+                        break
+                    try:
+                        msg = codec.loads(raw)
+                    except ValueError:
+                        continue
+                    if isinstance(msg, dict) and msg.get("type") == "event":
+                        try:
+                            await self._on_event(str(msg.get("event")), msg.get("data") or {})
+                        except Exception as e:
+                            log.warning("bus event %r failed: %r", msg.get("event"), e)
+            except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+                pass
+            finally:
+                writer, self._writer = self._writer, None
+                writer.close()
+            await asyncio.sleep(RECONNECT_S)
@@ -0,0 +1,218 @@
+from __future__ import annotations
+import fnmatch
+import re
+import sys
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
+
+from app.services.query_planner import SEARCH_FIELDS, normalize_tag
+
+NUMERIC_FIELDS = {
+    "aspect_ratio", "comment_count", "downvotes", "duration", "faves", "height", "id",
+    "score", "size", "tag_count", "upvotes", "width", "wilson_score",
+}
+_RANGE = re.compile(r"^([a-z_]+)(?:\.(gt|gte|lt|lte))?:(.+)$")
+_KEYWORD = re.compile(r"\s+(OR|AND)\s+|^(NOT)\s+")
+
+
+class UnsupportedQuery(ValueError):
+    pass
+
+
+@dataclass
+class ImageView:
+    img: Dict[str, Any]
+    tags: FrozenSet[str]
+    tag_ids: FrozenSet[int]
+
+    @classmethod
+    def of(cls, img: Dict[str, Any]) -> "ImageView":
+        return cls(
+            img=img,
+            tags=frozenset(sys.intern(normalize_tag(t)) for t in img.get("tags", []) or []),
+            tag_ids=frozenset(img.get("tag_ids", []) or []),
+        )
+
+
+Matcher = Callable[[ImageView], bool]
+
+
+def _tokenize(query: str) -> List[str]:
+    tokens: List[str] = []
+    i, n = 0, len(query)
+    while i < n:
+        c = query[i]
+        if c.isspace():
+            i += 1
+        elif c in "(),":
+            tokens.append(c)
+            i += 1
+        elif query.startswith("||", i) or query.startswith("&&", i):
+            tokens.append(query[i:i + 2])
+            i += 2
+        elif c in "-!":
+            tokens.append("NOT")
+            i += 1
+        else:
+            # имя тега само может содержать скобки: "oc:selena (reddthebat)"
+            j, depth = i, 0
+            while j < n:
+                ch = query[j]
+                if ch == "(":
+                    depth += 1
+                elif ch == ")":
+                    if depth == 0:
+                        break
+                    depth -= 1
+                elif depth == 0 and (ch == "," or query.startswith("||", j) or query.startswith("&&", j)):
+                    break
+                j += 1
+            word = query[i:j].strip()
+            pos = 0
+            for m in _KEYWORD.finditer(word):
+                if m.start() > pos:
+                    tokens.append(word[pos:m.start()].strip())
+                tokens.append(m.group(1) or m.group(2))
+                pos = m.end()
+            if word[pos:].strip():
+                tokens.append(word[pos:].strip())
+            i = j
+    return tokens
+
+
+def _term(raw: str) -> Matcher:
+    if "^" in raw or "~" in raw or raw.startswith('"'):
+        raise UnsupportedQuery(raw)
+
+    m = _RANGE.match(raw.strip().lower())
+    if m and m.group(1) in NUMERIC_FIELDS:
+        field, op = m.group(1), m.group(2)
+        try:
+            value = float(m.group(3))
+        except ValueError:
+            raise UnsupportedQuery(raw) from None
+        cmp = {
+            None: lambda a: a == value,
+            "gt": lambda a: a > value,
+            "gte": lambda a: a >= value,
+            "lt": lambda a: a < value,
+            "lte": lambda a: a <= value,
+        }[op]
+        return lambda v: isinstance(v.img.get(field), (int, float)) and cmp(v.img[field])
+    if m and (m.group(2) or m.group(1) in SEARCH_FIELDS):
+        raise UnsupportedQuery(raw)
+
+    tag = sys.intern(normalize_tag(raw))
+    if "*" in tag or "?" in tag:
+        return lambda v: any(fnmatch.fnmatchcase(t, tag) for t in v.tags)
+    return lambda v: tag in v.tags
+
+
+class _Parser:
+    def __init__(self, tokens: List[str]):
+        self._tokens = tokens
+        self._pos = 0
+
+    def _peek(self) -> Optional[str]:
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else None
+
+    def _next(self) -> str:
+        tok = self._peek()
+        if tok is None:
+            raise UnsupportedQuery("unexpected end of query")
+        self._pos += 1
+        return tok
+
+    def parse(self) -> Matcher:
+        node = self._or()
+        if self._peek() is not None:
+            raise UnsupportedQuery(f"unexpected token {self._peek()!r}")
+        return node
+
+    def _or(self) -> Matcher:
+        parts = [self._and()]
+        while self._peek() in ("||", "OR"):
+            self._next()
+            parts.append(self._and())
+        return parts[0] if len(parts) == 1 else (lambda v: any(p(v) for p in parts))
+
+    def _and(self) -> Matcher:
+        parts = [self._not()]
+        while self._peek() in (",", "&&", "AND"):
+            self._next()
+            parts.append(self._not())
+        return parts[0] if len(parts) == 1 else (lambda v: all(p(v) for p in parts))
+
+    def _not(self) -> Matcher:
+        if self._peek() == "NOT":
+            self._next()
+            inner = self._not()
+            return lambda v: not inner(v)
+        return self._atom()
+
+    def _atom(self) -> Matcher:
+        tok = self._next()
+        if tok == "(":
+            node = self._or()
+            if self._next() != ")":
+                raise UnsupportedQuery("unbalanced parentheses")
+            return node
+        if tok in (")", ",", "||", "&&", "OR", "AND"):
+            raise UnsupportedQuery(f"unexpected token {tok!r}")
+        return _term(tok)
+
+
+def compile_query(query: str) -> Matcher:
+    return _Parser(_tokenize(query)).parse()
+
+
+@dataclass
+class CompiledFilter:
+    filter_id: int
+    hidden_tag_ids: FrozenSet[int]
+    hidden_complex: Optional[Matcher]
+
+    def hides(self, view: ImageView) -> bool:
+        if not self.hidden_tag_ids.isdisjoint(view.tag_ids):
+            return True
+        return bool(self.hidden_complex and self.hidden_complex(view))
+
+
+def compile_filter(payload: Dict[str, Any]) -> CompiledFilter:
+    # в Philomena строки complex-фильтра объединяются через OR.
+    # spoilered_* на выдачу поиска не влияют, поэтому для отбора не нужны
+    lines = [ln.strip() for ln in (payload.get("hidden_complex") or "").splitlines() if ln.strip()]
+    complex_ = compile_query(" || ".join(f"({ln})" for ln in lines)) if lines else None
+    return CompiledFilter(
+        filter_id=int(payload.get("id", 0) or 0),
+        hidden_tag_ids=frozenset(int(x) for x in payload.get("hidden_tag_ids", []) or []),
+        hidden_complex=complex_,
+    )
+
+
+class FilterEngine:
+    def __init__(self, fetch: Callable[[int], Any]):
+        # fetch: async (filter_id) -> payload фильтра из API или None
+        self._fetch = fetch
+        self._compiled: Dict[int, Optional[CompiledFilter]] = {}
+
+    async def get(self, filter_id: int) -> Optional[CompiledFilter]:
+        if filter_id in self._compiled:
+            return self._compiled[filter_id]
+        payload = await self._fetch(filter_id)
+        if payload is None:
+            # не кэшируем: сеть могла просто моргнуть
+            return None
+        try:
+            compiled: Optional[CompiledFilter] = compile_filter(payload)
+        except UnsupportedQuery:
+            compiled = None
+        self._compiled[filter_id] = compiled
+        return compiled
+
+    def invalidate(self, filter_id: Optional[int] = None) -> None:
+        if filter_id is None:
+            self._compiled.clear()
+        else:
+            self._compiled.pop(filter_id, None)
+
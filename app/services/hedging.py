@@ -0,0 +1,104 @@
+from __future__ import annotations
+import asyncio
+from collections import deque
+from contextlib import suppress
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class FirstByte:
+    # попытка вызывает mark(), как только получены заголовки/первые байты ответа
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._started = loop.time()
+        self.event = asyncio.Event()
+        self.latency: Optional[float] = None
+
+    def elapsed(self) -> float:
+        return self._loop.time() - self._started
+
+    def mark(self) -> None:
+        if self.latency is None:
+            self.latency = self._loop.time() - self._started
+            self.event.set()
+
+
+Attempt = Callable[[int, FirstByte], Awaitable[T]]
+
+
+class Hedger:
+    def __init__(
+        self,
+        name: str,
+        *,
+        percentile: float = 0.95,
+        default_delay_s: float = 2.0,
+        min_delay_s: float = 0.2,
+        window: int = 256,
+        min_samples: int = 20,
+    ):
+        self.name = name
+        self._percentile = percentile
+        self._default_delay_s = default_delay_s
+        self._min_delay_s = min_delay_s
+        self._min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.fired = 0
+        self.won = 0
+
+    def delay(self) -> float:
+        if len(self._samples) < self._min_samples:
+            return self._default_delay_s
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(len(ordered) * self._percentile))
+        return max(self._min_delay_s, ordered[idx])
+
+    async def run(self, attempt: Attempt) -> T:
+        # если первая попытка не дала первый байт за p-й перцентиль времени ответа,
+        # запускаем вторую и берём ту, что закончится раньше; проигравшую отменяем
+        loop = asyncio.get_running_loop()
+        self.requests += 1
+        marks = [FirstByte(loop)]
+        tasks = [asyncio.create_task(attempt(0, marks[0]))]
+        waiter = asyncio.create_task(marks[0].event.wait())
+        try:
+            await asyncio.wait({tasks[0], waiter}, timeout=self.delay(), return_when=asyncio.FIRST_COMPLETED)
+            if tasks[0].done() or marks[0].event.is_set():
+                return await tasks[0]
+
+            self.fired += 1
+            marks.append(FirstByte(loop))
+            tasks.append(asyncio.create_task(attempt(1, marks[1])))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.cancelled():
+                        continue
+                    if t.exception() is None:
+                        if t is tasks[1]:
+                            self.won += 1
+                        return t.result()
+                    error = t.exception()
+            raise error or asyncio.CancelledError()
+        finally:
+            waiter.cancel()
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+                    with suppress(asyncio.CancelledError, Exception):
+                        await t
+            # у зависшей попытки первого байта так и не было — считаем время до отмены
+            for m in marks:
+                self._samples.append(m.latency if m.latency is not None else m.elapsed())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "fired": self.fired,
+            "won": self.won,
+            "delay_s": round(self.delay(), 3),
+        }
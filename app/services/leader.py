@@ -0,0 +1,274 @@
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import time
+from contextlib import suppress
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+log = logging.getLogger(__name__)
+
+LEASE_NAME = "autoposter"
+
+
+def default_holder() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass(frozen=True)
+class LeaseInfo:
+    holder: str
+    expires_at: float
+    # растёт при каждой смене владельца — годится как fencing token
+    term: int
+
+
+class Lease:
+    # интерфейс хранилища аренды: sqlite/файл из коробки, внешнее (redis, etcd, БД) — своим классом
+    async def acquire(self, holder: str, ttl_s: float) -> Optional[LeaseInfo]:
+        # захватить свободную/просроченную аренду или продлить свою; None — занята другим
+        raise NotImplementedError
+
+    async def release(self, holder: str) -> None:
+        raise NotImplementedError
+
+    async def current(self) -> Optional[LeaseInfo]:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class SqliteLease(Lease):
+    # одна строка на аренду; BEGIN IMMEDIATE сериализует конкурентов через блокировку файла БД.
+    # срок считается по wall clock, поэтому реплики на разных хостах должны синхронизировать время
+    def __init__(self, path: Path, *, name: str = LEASE_NAME):
+        self._path = path
+        self._name = name
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS lease ("
+            "name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL, term INTEGER NOT NULL)"
+        )
+        return conn
+
+    def _acquire_sync(self, holder: str, ttl_s: float) -> Optional[LeaseInfo]:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT holder, expires_at, term FROM lease WHERE name = ?", (self._name,),
+            ).fetchone()
+            now = time.time()
+            if row and row[0] != holder and row[1] > now:
+                conn.execute("ROLLBACK")
+                return None
+            term = row[2] if row else 0
+            if not row or row[0] != holder:
+                term += 1
+            info = LeaseInfo(holder=holder, expires_at=now + ttl_s, term=term)
+            conn.execute(
+                "INSERT INTO lease (name, holder, expires_at, term) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, "
+                "expires_at = excluded.expires_at, term = excluded.term",
+                (self._name, info.holder, info.expires_at, info.term),
+            )
+            conn.execute("COMMIT")
+            return info
+        finally:
+            conn.close()
+
+    def _release_sync(self, holder: str) -> None:
+        conn = self._connect()
+        try:
+            # term оставляем — следующий владелец получит term + 1
+            conn.execute(
+                "UPDATE lease SET expires_at = 0 WHERE name = ? AND holder = ?", (self._name, holder),
+            )
+        finally:
+            conn.close()
+
+    def _current_sync(self) -> Optional[LeaseInfo]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT holder, expires_at, term FROM lease WHERE name = ?", (self._name,),
+            ).fetchone()
+        finally:
+            conn.close()
+        if not row or row[1] <= time.time():
+            return None
+        return LeaseInfo(holder=row[0], expires_at=row[1], term=row[2])
+
+    async def acquire(self, holder: str, ttl_s: float) -> Optional[LeaseInfo]:
+        return await asyncio.to_thread(self._acquire_sync, holder, ttl_s)
+
+    async def release(self, holder: str) -> None:
+        await asyncio.to_thread(self._release_sync, holder)
+
+    async def current(self) -> Optional[LeaseInfo]:
+        return await asyncio.to_thread(self._current_sync)
+
+
+class FileLockLease(Lease):
+    # flock на файле: ядро снимает блокировку при смерти процесса, так что failover мгновенный.
+    # работает только для реплик на одном хосте (или ФС с рабочим flock)
+    def __init__(self, path: Path):
+        self._path = path
+        self._fd: Optional[int] = None
+        self._term = 0
+
+    def _try_lock_sync(self, holder: str) -> bool:
+        import fcntl
+
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        raw = os.pread(fd, 64, 0).decode(errors="replace").split("\n")
+        with suppress(ValueError, IndexError):
+            self._term = int(raw[1])
+        self._term += 1
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, f"{holder}\n{self._term}\n".encode(), 0)
+        self._fd = fd
+        return True
+
+    async def acquire(self, holder: str, ttl_s: float) -> Optional[LeaseInfo]:
+        if self._fd is None and not await asyncio.to_thread(self._try_lock_sync, holder):
+            return None
+        return LeaseInfo(holder=holder, expires_at=time.time() + ttl_s, term=self._term)
+
+    async def release(self, holder: str) -> None:
+        if self._fd is not None:
+            fd, self._fd = self._fd, None
+            # закрытие дескриптора снимает flock
+            os.close(fd)
+
+    async def current(self) -> Optional[LeaseInfo]:
+        with suppress(OSError, ValueError, IndexError):
+            holder, term = self._path.read_text(encoding="utf-8").split("\n")[:2]
+            if self._fd is not None or await asyncio.to_thread(self._locked_sync):
+                return LeaseInfo(holder=holder, expires_at=float("inf"), term=int(term))
+        return None
+
+    def _locked_sync(self) -> bool:
+        import fcntl
+
+        fd = os.open(self._path, os.O_RDONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        finally:
+            os.close(fd)
+        return False
+
+    async def close(self) -> None:
+        await self.release("")
+
+
+def make_lease(kind: str, path: Path) -> Lease:
+    if kind == "sqlite":
+        return SqliteLease(path)
+    if kind == "file":
+        return FileLockLease(path)
+    raise ValueError(f"Unknown lease backend: {kind}")
+
+
+Callback = Callable[[LeaseInfo], Awaitable[None]]
+
+
+class LeaderElector:
+    def __init__(
+        self,
+        lease: Lease,
+        *,
+        holder: str,
+        ttl_s: float = 15.0,
+        on_elected: Callback,
+        on_demoted: Callback,
+    ):
+        self._lease = lease
+        self.holder = holder
+        self._ttl_s = ttl_s
+        # продлеваем трижды за срок аренды: пара пропущенных продлений ещё не теряет лидерство
+        self._renew_s = ttl_s / 3
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+        self.info: Optional[LeaseInfo] = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.info is not None
+
+    async def start(self) -> None:
+        if not self._task:
+            self._task = asyncio.create_task(self._loop(), name="leader-election")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self.info is not None:
+            info, self.info = self.info, None
+            await self._on_demoted(info)
+            with suppress(Exception):
+                await self._lease.release(self.holder)
+        await self._lease.close()
+
+    async def _loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        # момент (по монотонным часам), после которого наша аренда могла уже истечь
+        valid_until = 0.0
+        while True:
+            started = loop.time()
+            try:
+                info = await asyncio.wait_for(self._lease.acquire(self.holder, self._ttl_s), timeout=self._renew_s)
+            except Exception as e:
+                log.warning("lease renew failed: %r", e)
+                info = None
+                # хранилище недоступно: лидерство держим, пока аренда гарантированно не истекла
+                if self.info is not None and loop.time() < valid_until - self._renew_s:
+                    await asyncio.sleep(self._renew_s)
+                    continue
+
+            if info is not None:
+                valid_until = started + self._ttl_s
+                if self.info is None:
+                    self.info = info
+                    log.info("elected leader %s (term %s)", self.holder, info.term)
+                    await self._on_elected(info)
+                else:
+                    self.info = info
+            elif self.info is not None:
+                old, self.info = self.info, None
+                log.warning("lost leadership %s (term %s)", self.holder, old.term)
+                await self._on_demoted(old)
+
+            await asyncio.sleep(self._renew_s)
+
+    async def leader(self) -> Optional[LeaseInfo]:
+        if self.info is not None:
+            return self.info
+        with suppress(Exception):
+            return await self._lease.current()
+        return None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "holder": self.holder,
+            "is_leader": self.is_leader,
+            "term": self.info.term if self.info else None,
+        }
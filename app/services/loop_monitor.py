@@ -0,0 +1,193 @@
+from __future__ import annotations
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import deque
+from contextlib import suppress
+from typing import Any, Deque, Dict, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# границы корзин гистограммы, мс; последняя корзина — всё, что больше
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+TOP_OFFENDERS = 20
+MAX_STALLS = 20
+
+
+class Histogram:
+    def __init__(self, bounds_ms=BUCKETS_MS):
+        self._bounds = bounds_ms
+        self.counts = [0] * (len(bounds_ms) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float) -> None:
+        self.counts[bisect_left(self._bounds, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q: float) -> Optional[float]:
+        # верхняя граница корзины, в которую попадает q-й перцентиль
+        if not self.total:
+            return None
+        need = q * self.total
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= need:
+                return float(self._bounds[i]) if i < len(self._bounds) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"<={b}" for b in self._bounds] + [f">{self._bounds[-1]}"]
+        return {
+            "buckets_ms": dict(zip(labels, self.counts)),
+            "count": self.total,
+            "mean_ms": round(self.sum_ms / self.total, 3) if self.total else None,
+            "p50_ms": self.percentile(0.5),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+def _callback_name(handle: asyncio.Handle) -> str:
+    cb = getattr(handle, "_callback", None)
+    owner = getattr(cb, "__self__", None)
+    # шаг задачи: показываем имя задачи и корутину, а не Task.__step
+    if isinstance(owner, asyncio.Task):
+        coro = owner.get_coro()
+        return f"{owner.get_name()} ({getattr(coro, '__qualname__', type(coro).__name__)})"
+    if isinstance(owner, asyncio.Future):
+        return f"{type(owner).__name__} callback"
+    return getattr(cb, "__qualname__", None) or repr(cb)
+
+
+class LoopMonitor:
+    def __init__(
+        self,
+        *,
+        interval_s: float = 0.1,
+        slow_callback_s: float = 0.1,
+        stall_stack_s: Optional[float] = None,
+    ):
+        self._interval_s = interval_s
+        self._slow_callback_s = slow_callback_s
+        self._stall_stack_s = stall_stack_s
+        self.lag = Histogram()
+        self.callbacks = Histogram()
+        # имя колбэка -> (число, суммарно мс, максимум мс)
+        self._offenders: Dict[str, Tuple[int, float, float]] = {}
+        self.stalls: Deque[Dict[str, Any]] = deque(maxlen=MAX_STALLS)
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+        self._heartbeat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._orig_run = None
+
+    def start(self) -> None:
+        if self._task:
+            return
+        self._loop_thread = threading.get_ident()
+        self._task = asyncio.create_task(self._sample_loop(), name="loop-monitor")
+        if self._slow_callback_s > 0:
+            self._patch_handles()
+        if self._stall_stack_s:
+            self._stopped.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._orig_run is not None:
+            asyncio.events.Handle._run = self._orig_run
+            self._orig_run = None
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _sample_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self._interval_s
+            await asyncio.sleep(self._interval_s)
+            self._heartbeat = time.monotonic()
+            self.lag.add(max(0.0, loop.time() - expected) * 1000)
+
+    def _patch_handles(self) -> None:
+        # все колбэки цикла (шаги задач, call_soon, таймеры) проходят через Handle._run;
+        # цена замера — два perf_counter на колбэк
+        orig = asyncio.events.Handle._run
+        threshold = self._slow_callback_s
+        monitor = self
+
+        def _timed_run(handle):
+            started = time.perf_counter()
+            try:
+                return orig(handle)
+            finally:
+                took = time.perf_counter() - started
+                if took >= threshold:
+                    monitor._record_slow(handle, took)
+
+        self._orig_run = orig
+        asyncio.events.Handle._run = _timed_run
+
+    def _record_slow(self, handle: asyncio.Handle, took: float) -> None:
+        ms = took * 1000
+        self.callbacks.add(ms)
+        name = _callback_name(handle)
+        count, total, worst = self._offenders.get(name, (0, 0.0, 0.0))
+        self._offenders[name] = (count + 1, total + ms, max(worst, ms))
+        if len(self._offenders) > TOP_OFFENDERS * 5:
+            keep = sorted(self._offenders.items(), key=lambda kv: kv[1][1], reverse=True)[:TOP_OFFENDERS]
+            self._offenders = dict(keep)
+
+    def _watch(self) -> None:
+        # отдельный поток: если цикл не отметился дольше порога, снимаем стек его потока
+        reported = 0.0
+        while not self._stopped.wait(self._stall_stack_s / 2):
+            stalled = time.monotonic() - self._heartbeat - self._interval_s
+            if stalled < self._stall_stack_s or self._heartbeat == reported:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            reported = self._heartbeat
+            stack = "".join(traceback.format_stack(frame))
+            self.stalls.append({"at": time.time(), "stalled_ms": round(stalled * 1000, 1), "stack": stack})
+            log.warning("event loop stalled for %.0f ms, stack:\n%s", stalled * 1000, stack)
+
+    def snapshot(self) -> Dict[str, Any]:
+        offenders = sorted(self._offenders.items(), key=lambda kv: kv[1][1], reverse=True)[:TOP_OFFENDERS]
+        return {
+            "interval_ms": self._interval_s * 1000,
+            "slow_callback_ms": self._slow_callback_s * 1000 if self._slow_callback_s > 0 else None,
+            "stall_stack_ms": self._stall_stack_s * 1000 if self._stall_stack_s else None,
+            "lag": self.lag.to_dict(),
+            "slow_callbacks": self.callbacks.to_dict(),
+            "offenders": [
+                {"name": name, "count": c, "total_ms": round(t, 1), "max_ms": round(m, 1)}
+                for name, (c, t, m) in offenders
+            ],
+            "stalls": list(self.stalls),
+        }
+
+
+def monitor_from_config(cfg) -> Optional[LoopMonitor]:
+    # общий конструктор для главного процесса и веб-воркеров
+    if not cfg.loop_monitor:
+        return None
+    return LoopMonitor(
+        interval_s=cfg.loop_lag_interval_ms / 1000,
+        slow_callback_s=cfg.slow_callback_ms / 1000,
+        stall_stack_s=cfg.loop_stall_stack_ms / 1000 or None,
+    )
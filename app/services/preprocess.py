@@ -0,0 +1,153 @@
+from __future__ import annotations
+import asyncio
+import importlib.util
+import io
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from app.services.representations import PHOTO_MAX_BYTES, PHOTO_MAX_DIM_SUM
+
+# Telegram хранит фото максимум 2560px по длинной стороне — больше отправлять незачем
+MAX_LONG_SIDE = 2560
+JPEG_QUALITIES = (90, 82, 74, 66, 58)
+# сколько ключей "обработка не нужна" помним (байты не храним: оригинал лежит в кэше загрузок)
+PASSTHROUGH_KEYS = 4096
+
+log = logging.getLogger(__name__)
+
+
+def pillow_available() -> bool:
+    return importlib.util.find_spec("PIL") is not None
+
+
+def _init_worker(mem_limit_mb: int) -> None:
+    # лимит адресного пространства на процесс: "бомба" из пикселей упадёт MemoryError в воркере,
+    # а не съест память всего хоста
+    if mem_limit_mb <= 0:
+        return
+    from PIL import Image
+
+    limit = mem_limit_mb * 1024 * 1024
+    # RGBA — 4 байта на пиксель, плюс запас под копию при ресайзе
+    Image.MAX_IMAGE_PIXELS = limit // 8
+    try:
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def _process(data: bytes, max_bytes: int, max_dim_sum: int, max_long_side: int) -> Optional[bytes]:
+    # None — отправлять оригинал: он и так укладывается в лимиты или его не удалось обработать
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            w, h = im.size
+            fits = w + h <= max_dim_sum and max(w, h) <= max_long_side and len(data) <= max_bytes
+            if im.format == "JPEG" and fits and not im.info.get("exif"):
+                return None
+
+            scale = min(1.0, max_dim_sum / (w + h), max_long_side / max(w, h))
+            if scale < 1.0:
+                size = (max(1, int(w * scale)), max(1, int(h * scale)))
+                im.draft("RGB", size)
+                im = im.resize(size, Image.LANCZOS)
+
+            if im.mode in ("RGBA", "LA", "P"):
+                rgba = im.convert("RGBA")
+                im = Image.new("RGB", rgba.size, (255, 255, 255))
+                im.paste(rgba, mask=rgba.getchannel("A"))
+            elif im.mode != "RGB":
+                im = im.convert("RGB")
+
+            for quality in JPEG_QUALITIES:
+                out = io.BytesIO()
+                # exif не передаём — метаданные отбрасываются при перекодировании
+                im.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+                if out.tell() <= max_bytes:
+                    return out.getvalue()
+            return None
+    except (MemoryError, OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+class ImagePreprocessor:
+    def __init__(self, *, workers: int, mem_limit_mb: int, cache_mb: int):
+        self._workers = max(1, workers)
+        self._mem_limit_mb = mem_limit_mb
+        self._cache_budget = cache_mb * 1024 * 1024
+        self._cache: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()
+        self._cache_bytes = 0
+        # картинки, которые _process отдал как есть: повторный слот не гоняет их через пул снова
+        self._passthrough: "OrderedDict[str, None]" = OrderedDict()
+        self._pool: ProcessPoolExecutor | None = None
+
+    def start(self) -> None:
+        if self._pool:
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self._workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._mem_limit_mb,),
+        )
+
+    async def close(self) -> None:
+        if self._pool:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, True, cancel_futures=True)
+
+    def cached(self, key: str) -> Optional[Tuple[bytes, str]]:
+        hit = self._cache.get(key)
+        if hit is not None:
+            self._cache.move_to_end(key)
+        return hit
+
+    def _remember(self, key: str, value: Tuple[bytes, str]) -> None:
+        size = len(value[0])
+        if size > self._cache_budget:
+            return
+        old = self._cache.pop(key, None)
+        if old is not None:
+            self._cache_bytes -= len(old[0])
+        self._cache[key] = value
+        self._cache_bytes += size
+        while self._cache_bytes > self._cache_budget:
+            _, (data, _) = self._cache.popitem(last=False)
+            self._cache_bytes -= len(data)
+
+    async def prepare(self, key: str, data: bytes, filename: str) -> Tuple[bytes, str]:
+        hit = self.cached(key)
+        if hit is not None:
+            return hit
+        if key in self._passthrough:
+            self._passthrough.move_to_end(key)
+            return data, filename
+        if not self._pool:
+            return data, filename
+
+        loop = asyncio.get_running_loop()
+        try:
+            out = await loop.run_in_executor(
+                self._pool, _process, data, PHOTO_MAX_BYTES, PHOTO_MAX_DIM_SUM, MAX_LONG_SIDE,
+            )
+        except Exception as e:
+            # упавший воркер (например, по лимиту памяти) ломает пул — пересоздаём
+            log.warning("preprocess failed for %s: %r", key, e)
+            await self.close()
+            self.start()
+            return data, filename
+
+        if out is None:
+            self._passthrough[key] = None
+            while len(self._passthrough) > PASSTHROUGH_KEYS:
+                self._passthrough.popitem(last=False)
+            return data, filename
+        result = (out, "image.jpg")
+        self._remember(key, result)
+        return result
@@ -0,0 +1,151 @@
+from __future__ import annotations
+import asyncio
+import cProfile
+import linecache
+import marshal
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, Optional
+
+# верхние пределы, чтобы профилирование в проде не стоило дороже, чем проблема
+MAX_SECONDS = 60.0
+MIN_INTERVAL_S = 0.001
+MAX_HEAP_FRAMES = 25
+SAMPLE_SWITCH_INTERVAL_S = 0.0002
+
+# профиль за раз только один: два cProfile в одном потоке не уживаются
+_busy = asyncio.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _sample_sync(
+    loop: asyncio.AbstractEventLoop,
+    loop_thread: int,
+    seconds: float,
+    interval_s: float,
+    all_threads: bool,
+) -> Counter:
+    # семплер в отдельном потоке: снимает стек потока цикла (и по желанию остальных)
+    # и помечает корень текущей asyncio-задачей — так видно, какая задача грела CPU
+    stacks: Counter = Counter()
+    names: Dict[int, str] = {}
+    me = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    # семплер получает GIL в основном там, где поток цикла его отпускает (select, I/O), и
+    # без этого почти не видит CPU-код; на время замера чаще переключаем потоки
+    switch = sys.getswitchinterval()
+    sys.setswitchinterval(min(switch, SAMPLE_SWITCH_INTERVAL_S))
+    try:
+        while time.monotonic() < deadline:
+            if all_threads:
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me or (tid != loop_thread and not all_threads):
+                    continue
+                parts = []
+                f = frame
+                while f is not None:
+                    parts.append(_frame_label(f))
+                    f = f.f_back
+                parts.reverse()
+                if tid == loop_thread:
+                    task = asyncio.current_task(loop)
+                    parts.insert(0, f"task:{task.get_name()}" if task else "task:<none>")
+                if all_threads:
+                    parts.insert(0, f"thread:{names.get(tid, tid)}")
+                stacks[";".join(parts)] += 1
+            time.sleep(interval_s)
+    finally:
+        sys.setswitchinterval(switch)
+    return stacks
+
+
+async def sample_collapsed(seconds: float, *, interval_s: float = 0.01, all_threads: bool = False) -> str:
+    # формат collapsed stacks: "root;...;leaf count" — вход для flamegraph.pl/speedscope
+    if _busy.locked():
+        raise ProfilerBusy()
+    async with _busy:
+        loop = asyncio.get_running_loop()
+        stacks = await asyncio.to_thread(
+            _sample_sync,
+            loop,
+            threading.get_ident(),
+            min(seconds, MAX_SECONDS),
+            max(interval_s, MIN_INTERVAL_S),
+            all_threads,
+        )
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+async def cprofile_stats(seconds: float) -> bytes:
+    # детерминированный профиль потока цикла (все задачи) в формате pstats (marshal);
+    # открывается через pstats.Stats(path) или snakeviz
+    if _busy.locked():
+        raise ProfilerBusy()
+    async with _busy:
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            await asyncio.sleep(min(seconds, MAX_SECONDS))
+        finally:
+            prof.disable()
+    prof.create_stats()
+    return marshal.dumps(prof.stats)
+
+
+async def heap_diff(seconds: float, *, limit: int = 40, frames: int = 1, group_by: str = "lineno") -> str:
+    # два снимка tracemalloc с интервалом; если трассировка не была включена — включаем на время замера
+    if _busy.locked():
+        raise ProfilerBusy()
+    async with _busy:
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start(max(1, min(frames, MAX_HEAP_FRAMES)))
+        try:
+            before = tracemalloc.take_snapshot()
+            await asyncio.sleep(min(seconds, MAX_SECONDS))
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started_here:
+                tracemalloc.stop()
+
+    # сами снимки и служебные файлы в отчёт не включаем
+    noise = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, linecache.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    )
+    after = after.filter_traces(noise)
+    before = before.filter_traces(noise)
+    stats = after.compare_to(before, group_by)
+
+    lines = [
+        f"# tracemalloc diff over {min(seconds, MAX_SECONDS):.1f}s, grouped by {group_by}",
+        f"# traced now: {current / 1024:.1f} KiB, peak: {peak / 1024:.1f} KiB",
+    ]
+    for stat in stats[:limit]:
+        lines.append(str(stat))
+        if group_by == "traceback":
+            lines.extend("    " + line for line in stat.traceback.format())
+    return "\n".join(lines) + "\n"
+
+
+def parse_seconds(raw: Optional[str], default: float) -> float:
+    try:
+        value = float(raw) if raw is not None else default
+    except ValueError:
+        value = default
+    return max(0.1, min(value, MAX_SECONDS))
@@ -0,0 +1,115 @@
+from __future__ import annotations
+import re
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from app.services.tag_selector import GroupKey, group_key
+
+MAX_QUERY_LEN = 1000
+MAX_GROUPS_PER_QUERY = 8
+# если одна группа находит в SKEW_RATIO раз больше другой, общая выдача
+# будет забита первой — такие группы в один запрос не объединяем
+SKEW_RATIO = 20.0
+
+# поля поиска Derpibooru: термы вида "score.gt:100" локально не проверить
+SEARCH_FIELDS = {
+    "aspect_ratio", "animated", "body_type_tag_count", "character_tag_count", "comment_count",
+    "content_fanmade_tag_count", "content_official_tag_count", "created_at", "description",
+    "downvotes", "duration", "error_tag_count", "faved_by", "faved_by_id", "faves", "first_seen_at",
+    "gallery_id", "height", "id", "mime_type", "my", "oc_tag_count", "orig_sha512_hash",
+    "original_format", "pixels", "rating_tag_count", "score", "sha512_hash", "size", "source_count",
+    "source_url", "species_tag_count", "spoiler_tag_count", "tag_count", "updated_at", "uploader",
+    "uploader_id", "upvotes", "width", "wilson_score",
+}
+_NON_LOCAL = re.compile(r"[()*?~^\"]|\|\||&&|\bOR\b|\bAND\b|\bNOT\b")
+
+Term = Tuple[str, bool]  # (тег, отрицание)
+
+
+def normalize_tag(tag: str) -> str:
+    return " ".join(tag.strip().lower().split())
+
+
+def group_query(tags: Sequence[str]) -> str:
+    return " ".join(tags)
+
+
+def local_terms(tags: Sequence[str]) -> Optional[List[Term]]:
+    query = group_query(tags)
+    if not query.strip() or _NON_LOCAL.search(query):
+        return None
+
+    terms: List[Term] = []
+    for raw in query.split(","):
+        term = raw.strip()
+        negated = term[:1] in {"-", "!"}
+        if negated:
+            term = term[1:].strip()
+        if not term:
+            return None
+        field, sep, _ = term.partition(":")
+        if sep and (field.lower() in SEARCH_FIELDS or "." in field):
+            return None
+        terms.append((normalize_tag(term), negated))
+    return terms
+
+
+def matches(terms: Sequence[Term], image_tags: Iterable[str]) -> bool:
+    tagset = image_tags if isinstance(image_tags, (set, frozenset)) else {normalize_tag(t) for t in image_tags}
+    return all((tag in tagset) != negated for tag, negated in terms)
+
+
+def merged_query(groups: Sequence[Sequence[str]]) -> str:
+    if len(groups) == 1:
+        return group_query(groups[0])
+    return " || ".join(f"({group_query(g)})" for g in groups)
+
+
+def plan_batches(
+    groups: Sequence[List[str]],
+    *,
+    hits: Mapping[GroupKey, int],
+    max_query_len: int = MAX_QUERY_LEN,
+    max_groups: int = MAX_GROUPS_PER_QUERY,
+    skew_ratio: float = SKEW_RATIO,
+) -> List[List[List[str]]]:
+    mergeable: List[List[str]] = []
+    batches: List[List[List[str]]] = []
+    for g in groups:
+        if local_terms(g) is None:
+            batches.append([g])
+        else:
+            mergeable.append(g)
+
+    # группы с похожим числом находок кладём рядом, чтобы проще соблюсти SKEW_RATIO
+    mergeable.sort(key=lambda g: hits.get(group_key(g), 0))
+
+    current: List[List[str]] = []
+    low = high = 0
+    for g in mergeable:
+        n = max(1, hits.get(group_key(g), 0))
+        if current:
+            fits = (
+                len(current) < max_groups
+                and len(merged_query(current + [g])) <= max_query_len
+                and max(high, n) <= skew_ratio * min(low, n)
+            )
+            if fits:
+                current.append(g)
+                low, high = min(low, n), max(high, n)
+                continue
+            batches.append(current)
+        current, low, high = [g], n, n
+    if current:
+        batches.append(current)
+    return batches
+
+
+def partition(images: Sequence[Dict[str, Any]], groups: Sequence[Sequence[str]]) -> Dict[GroupKey, List[Dict[str, Any]]]:
+    compiled = [(group_key(g), local_terms(g) or []) for g in groups]
+    out: Dict[GroupKey, List[Dict[str, Any]]] = {key: [] for key, _ in compiled}
+    for img in images:
+        tagset = {normalize_tag(t) for t in img.get("tags", []) or []}
+        for key, terms in compiled:
+            if terms and matches(terms, tagset):
+                out[key].append(img)
+    return out
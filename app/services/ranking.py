@@ -0,0 +1,65 @@
+from __future__ import annotations
+import random
+from typing import Any, Dict, List, Sequence
+
+from app.storage.settings_store import CandidateRules
+
+# страница выдачи — максимум 50 картинок, поэтому считаем по колонкам обычными списками:
+# один проход на ограничение по всей странице, без зависимостей вроде NumPy
+
+# нижняя граница веса: степень от малого score не должна уйти в 0 (деление в ключе)
+MIN_WEIGHT = 1e-12
+
+
+def _column(images: Sequence[Dict[str, Any]], key: str, default: Any = 0) -> List[Any]:
+    out = []
+    for img in images:
+        v = img.get(key)
+        out.append(default if v is None else v)
+    return out
+
+
+def candidate_mask(images: Sequence[Dict[str, Any]], rules: CandidateRules) -> List[bool]:
+    width = _column(images, "width")
+    height = _column(images, "height")
+    size = _column(images, "size")
+    fmt = _column(images, "format", "")
+    animated = _column(images, "animated", False)
+
+    max_bytes = rules.max_size_mb * 1024 * 1024
+    formats = set(rules.formats)
+    keep = [
+        w >= rules.min_width
+        and h >= rules.min_height
+        and (not w or not h or max(w, h) / min(w, h) <= rules.max_aspect_ratio)
+        and (not sz or sz <= max_bytes)
+        and (not formats or str(f).lower() in formats)
+        and (rules.allow_animated or not a)
+        for w, h, sz, f, a in zip(width, height, size, fmt, animated)
+    ]
+
+    if rules.min_score is not None:
+        keep = [k and s >= rules.min_score for k, s in zip(keep, _column(images, "score"))]
+    if rules.min_wilson_score is not None:
+        keep = [k and s >= rules.min_wilson_score for k, s in zip(keep, _column(images, "wilson_score"))]
+    return keep
+
+
+def rank(images: Sequence[Dict[str, Any]], rules: CandidateRules, *, ordered: bool = False) -> List[Dict[str, Any]]:
+    if not images:
+        return []
+    keep = candidate_mask(images, rules)
+    if ordered:
+        return [img for img, k in zip(images, keep) if k]
+
+    # взвешенная случайная перестановка (Efraimidis–Spirakis): ключ u ** (1 / w)
+    weights = [
+        max(MIN_WEIGHT, (max(0.0, float(s)) + 0.01) ** rules.score_sharpness)
+        for s in _column(images, "wilson_score", 0.0)
+    ]
+    keyed = [
+        (random.random() ** (1.0 / w), i)
+        for i, (w, k) in enumerate(zip(weights, keep)) if k
+    ]
+    keyed.sort(reverse=True)
+    return [images[i] for _, i in keyed]
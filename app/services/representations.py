@@ -0,0 +1,100 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+# лимиты Bot API для загрузки файлом
+PHOTO_MAX_BYTES = 10 * 1024 * 1024
+PHOTO_MAX_DIM_SUM = 10000
+PHOTO_MAX_RATIO = 20.0
+UPLOAD_MAX_BYTES = 50 * 1024 * 1024
+
+# Telegram всё равно пережимает фото до 2560px, больше качать смысла нет
+TARGET_LONG_SIDE = 1280
+
+# рамки, в которые Philomena вписывает представления (без увеличения)
+REPRESENTATION_BOXES: List[Tuple[str, int, int]] = [
+    ("small", 320, 240),
+    ("medium", 800, 600),
+    ("large", 1280, 1024),
+    ("tall", 1024, 4096),
+]
+
+ANIMATION_FORMATS = {"gif"}
+VIDEO_FORMATS = {"webm", "mp4"}
+
+
+@dataclass(frozen=True)
+class MediaChoice:
+    kind: str  # "photo" | "animation" | "video" | "document"
+    url: str
+    est_bytes: Optional[int] = None
+
+
+def _fit(width: int, height: int, box_w: int, box_h: int) -> Tuple[int, int]:
+    scale = min(1.0, box_w / width, box_h / height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _photo_ok(w: int, h: int, est: Optional[int]) -> bool:
+    if w + h > PHOTO_MAX_DIM_SUM or max(w, h) / min(w, h) > PHOTO_MAX_RATIO:
+        return False
+    return est is None or est <= PHOTO_MAX_BYTES
+
+
+def _swap_ext(url: str, ext: str) -> str:
+    base, dot, _ = url.rpartition(".")
+    return f"{base}.{ext}" if dot else url
+
+
+def choose_media(img: Dict[str, Any], *, target_long_side: int = TARGET_LONG_SIDE) -> Optional[MediaChoice]:
+    reps = img.get("representations", {}) or {}
+    full = reps.get("full")
+    fmt = str(img.get("format") or "").lower()
+    size = img.get("size") or None
+    width = int(img.get("width") or 0)
+    height = int(img.get("height") or 0)
+
+    if fmt in ANIMATION_FORMATS and full:
+        if size is None or size <= UPLOAD_MAX_BYTES:
+            return MediaChoice("animation", full, size)
+        small = reps.get("medium") or reps.get("small")
+        return MediaChoice("animation", small, None) if small else None
+
+    if fmt in VIDEO_FORMATS and full:
+        # для видео Philomena рядом с .webm кладёт .mp4, который Telegram проигрывает inline
+        if size is None or size <= UPLOAD_MAX_BYTES:
+            return MediaChoice("video", _swap_ext(full, "mp4"), size)
+        return None
+
+    if not width or not height:
+        url = reps.get("large") or full or reps.get("medium")
+        return MediaChoice("photo", url, None) if url else None
+
+    pixels_full = width * height
+    want = min(target_long_side, max(width, height))
+    options: List[Tuple[int, str, int, int]] = []
+    for name, box_w, box_h in REPRESENTATION_BOXES:
+        url = reps.get(name)
+        if not url:
+            continue
+        w, h = _fit(width, height, box_w, box_h)
+        options.append((w * h, url, w, h))
+    # у svg full — сам вектор, растровые представления — png
+    if full and fmt != "svg":
+        options.append((pixels_full, full, width, height))
+    options.sort()
+
+    for pixels, url, w, h in options:
+        est = int(size * pixels / pixels_full) if size else None
+        if max(w, h) >= want and _photo_ok(w, h, est):
+            return MediaChoice("photo", url, est)
+
+    # ни одно представление не дотягивает до цели — берём самое большое, что ещё проходит как фото
+    for pixels, url, w, h in reversed(options):
+        est = int(size * pixels / pixels_full) if size else None
+        if _photo_ok(w, h, est):
+            return MediaChoice("photo", url, est)
+
+    if full and (size is None or size <= UPLOAD_MAX_BYTES):
+        return MediaChoice("document", full, size)
+    return None
@@ -0,0 +1,48 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict
+
+log = logging.getLogger(__name__)
+
+
+class Startup:
+    # фазы запуска с таймингами; /readyz зелёный только после mark_ready()
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.ready = False
+
+    async def phase(self, name: str, aw: Awaitable[Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            return await aw
+        except Exception as e:
+            self.errors[name] = repr(e)
+            raise
+        finally:
+            self.phases[name] = round(time.perf_counter() - started, 3)
+
+    async def run(self, phases: Dict[str, Awaitable[Any]]) -> Dict[str, Any]:
+        # независимые шаги — одновременно; ошибка любого прерывает запуск, как и раньше
+        names = list(phases)
+        results = await asyncio.gather(*(self.phase(n, phases[n]) for n in names))
+        return dict(zip(names, results))
+
+    def elapsed(self) -> float:
+        return round(time.perf_counter() - self._t0, 3)
+
+    def mark_ready(self) -> None:
+        self.ready = True
+        self.phases["total"] = self.elapsed()
+        log.info("Startup: %s", ", ".join(f"{k}={v:.3f}s" for k, v in self.phases.items()))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "uptime_s": self.elapsed(),
+            "phases": dict(self.phases),
+            "errors": dict(self.errors),
+        }
@@ -0,0 +1,123 @@
+from __future__ import annotations
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+GroupKey = Tuple[str, ...]
+
+# старые наблюдения постепенно "забываются", чтобы выборка подстраивалась под свежие данные
+DECAY = 0.9
+COOLDOWN_BASE_S = 10 * 60
+COOLDOWN_MAX_S = 12 * 3600
+
+
+def group_key(tags: Sequence[str]) -> GroupKey:
+    return tuple(t.strip().lower() for t in tags)
+
+
+@dataclass
+class GroupStats:
+    picks: int = 0
+    searches: int = 0
+    posts: int = 0
+    total_hits: int = 0
+    seen: float = 0.0
+    fresh: float = 0.0
+    consecutive_empties: int = 0
+    last_success_at: Optional[float] = None
+    cooldown_until: float = 0.0
+
+    @property
+    def fresh_ratio(self) -> Optional[float]:
+        if self.seen <= 0:
+            return None
+        return self.fresh / self.seen
+
+    def sample(self) -> float:
+        # Thompson sampling по доле свежих кандидатов (Beta(fresh+1, stale+1))
+        return random.betavariate(self.fresh + 1.0, max(0.0, self.seen - self.fresh) + 1.0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        ratio = self.fresh_ratio
+        return {
+            "picks": self.picks,
+            "searches": self.searches,
+            "posts": self.posts,
+            "total_hits": self.total_hits,
+            "fresh_ratio": round(ratio, 3) if ratio is not None else None,
+            "consecutive_empties": self.consecutive_empties,
+            "last_success_at": self.last_success_at,
+            "cooldown_until": self.cooldown_until or None,
+        }
+
+
+class TagGroupSelector:
+    def __init__(self, *, cooldown_base_s: float = COOLDOWN_BASE_S, cooldown_max_s: float = COOLDOWN_MAX_S):
+        self._stats: Dict[GroupKey, GroupStats] = {}
+        self._cooldown_base_s = cooldown_base_s
+        self._cooldown_max_s = cooldown_max_s
+
+    def stats_for(self, tags: Sequence[str]) -> GroupStats:
+        key = group_key(tags)
+        st = self._stats.get(key)
+        if st is None:
+            st = self._stats[key] = GroupStats()
+        return st
+
+    def _sync(self, groups: Sequence[Sequence[str]]) -> None:
+        keys = {group_key(g) for g in groups}
+        for key in list(self._stats):
+            if key not in keys:
+                del self._stats[key]
+
+    def pick(self, groups: Sequence[List[str]], *, exclude: Sequence[Sequence[str]] = ()) -> Optional[List[str]]:
+        self._sync(groups)
+        excluded = {group_key(g) for g in exclude}
+        candidates = [g for g in groups if group_key(g) not in excluded]
+        if not candidates:
+            return None
+
+        now = time.time()
+        ready = [g for g in candidates if self.stats_for(g).cooldown_until <= now]
+        if ready:
+            chosen = max(ready, key=lambda g: self.stats_for(g).sample())
+        else:
+            # все группы "остывают" — берём ту, что освободится раньше всех
+            chosen = min(candidates, key=lambda g: self.stats_for(g).cooldown_until)
+
+        self.stats_for(chosen).picks += 1
+        return chosen
+
+    def record_search(self, tags: Sequence[str], *, total: Optional[int], returned: int, fresh: int) -> None:
+        st = self.stats_for(tags)
+        st.searches += 1
+        if total is not None:
+            st.total_hits = total
+        st.seen = st.seen * DECAY + returned
+        st.fresh = st.fresh * DECAY + fresh
+
+        if fresh > 0:
+            st.consecutive_empties = 0
+            st.cooldown_until = 0.0
+            return
+
+        st.consecutive_empties += 1
+        delay = min(self._cooldown_max_s, self._cooldown_base_s * (2 ** (st.consecutive_empties - 1)))
+        st.cooldown_until = time.time() + delay
+
+    def record_post(self, tags: Sequence[str]) -> None:
+        st = self.stats_for(tags)
+        st.posts += 1
+        st.last_success_at = time.time()
+
+    def reset_cooldowns(self) -> None:
+        for st in self._stats.values():
+            st.consecutive_empties = 0
+            st.cooldown_until = 0.0
+
+    def known_hits(self) -> Dict[GroupKey, int]:
+        return {key: st.total_hits for key, st in self._stats.items() if st.searches}
+
+    def snapshot(self, groups: Sequence[Sequence[str]]) -> List[Dict[str, Any]]:
+        return [{"tags": list(g), **self.stats_for(g).to_dict()} for g in groups]
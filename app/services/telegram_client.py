@@ -1,15 +1,32 @@
 from __future__ import annotations
-
-from aiogram import Bot
-from aiogram.client.session.aiohttp import AiohttpSession
-from aiogram.types import BufferedInputFile
+from typing import Any, Optional
 
 import aiohttp
+import asyncio
+import hashlib
+import importlib
+import os
+import re
+from contextlib import suppress
+from pathlib import Path, PurePosixPath
 
 from app.models import ImageRecord
+from app.services.hedging import FirstByte, Hedger
+from app.services.preprocess import ImagePreprocessor
+from app.services.transport import CDN, Transport
+from app.storage.blob_cache import BlobCache
 
 
 MAX_CAPTION = 1024
+DL_CHUNK = 256 * 1024
+# 400 от Telegram, который говорит о канале/боте, а не о картинке
+CHANNEL_BAD_REQUEST = re.compile(r"rights|chat not found|chat_write_forbidden|kicked", re.IGNORECASE)
+
+
+class CandidateRejected(Exception):
+    # отправка упала из-за самой картинки (4xx на CDN, Telegram не принял файл) —
+    # её можно пропустить и взять следующую; остальные ошибки касаются всех кандидатов
+    pass
 
 
 def _clip_caption(text: str) -> str:
@@ -19,22 +36,138 @@ def _clip_caption(text: str) -> str:
     return text[: MAX_CAPTION - 1] + "…"
 
 
+def blob_key(record: ImageRecord, url: str) -> str:
+    # одна картинка — несколько представлений: "3729955-large.png", "3729955-full.png"
+    name = PurePosixPath(url).name
+    if record.image_id:
+        return f"{record.image_id}-{name}"
+    return hashlib.sha1(url.encode()).hexdigest() + PurePosixPath(url).suffix
+
+
 class TelegramClient:
-    def __init__(self, token: str, channel_id: int, *, http_limit: int = 64):
-        # AiohttpSession — стандартная сессия aiogram, можно увеличить лимит коннектов
-        # для скорости и стабильности. :contentReference[oaicite:3]{index=3}
-        self._session = AiohttpSession(limit=http_limit)
-        self._bot = Bot(token=token, session=self._session)
+    def __init__(
+        self,
+        token: str,
+        channel_id: int,
+        *,
+        http_limit: int = 64,
+        preprocessor: Optional[ImagePreprocessor] = None,
+        blobs: Optional[BlobCache] = None,
+        hedger: Optional[Hedger] = None,
+        transport: Optional[Transport] = None,
+    ):
+        self._token = token
+        self._http_limit = http_limit
+        self._transport = transport
+        # Bot создаётся в start(): импорт aiogram долгий и не должен задерживать запуск веб-сервера
+        self._bot: Any = None
+        self._session: Any = None
         self._channel_id = channel_id
 
         # отдельная сессия для скачивания картинок (можно и общую сделать, но так проще/чище)
-        self._dl = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=25))
+        dl_timeout = aiohttp.ClientTimeout(total=25)
+        self._dl = transport.session(CDN, timeout=dl_timeout) if transport else aiohttp.ClientSession(timeout=dl_timeout)
+        self._prep = preprocessor
+        self._blobs = blobs
+        self._hedger = hedger
+
+    async def start(self) -> None:
+        if self._bot is not None:
+            return
+        # импорт — в потоке, чтобы цикл событий в это время обслуживал запросы
+        tg_session = await asyncio.to_thread(importlib.import_module, "app.services.tg_session")
+        self._bot, self._session = tg_session.make_bot(
+            self._token, transport=self._transport, http_limit=self._http_limit,
+        )
+
+    async def get_chat(self) -> Any:
+        return await self._bot.get_chat(self._channel_id)
+
+    async def send_text(self, chat_id: int, text: str) -> None:
+        await self._bot.send_message(chat_id=chat_id, text=text)
+
+    async def set_webhook(self, url: str, secret: str) -> None:
+        # апдейты админ-бота приходят POST-ом на веб-сервер; в канал бот по-прежнему только пишет
+        await self._bot.set_webhook(url=url, secret_token=secret, allowed_updates=["message"])
 
     async def close(self) -> None:
+        if self._prep:
+            await self._prep.close()
+        if self._blobs:
+            await self._blobs.close()
         await self._dl.close()
-        await self._session.close()
+        if self._session:
+            await self._session.close()
+
+    async def _stream_to(self, url: str, path: Path, fb: Optional[FirstByte] = None) -> Path:
+        async with self._dl.get(url) as r:
+            r.raise_for_status()
+            with open(path, "wb") as f:
+                async for chunk in r.content.iter_chunked(DL_CHUNK):
+                    if fb:
+                        fb.mark()
+                    f.write(chunk)
+        return path
+
+    async def _read(self, url: str, fb: Optional[FirstByte] = None) -> bytes:
+        async with self._dl.get(url) as r:
+            r.raise_for_status()
+            chunks = []
+            async for chunk in r.content.iter_chunked(DL_CHUNK):
+                if fb:
+                    fb.mark()
+                chunks.append(chunk)
+            return b"".join(chunks)
+
+    async def _fetch_to(self, url: str, path: Path) -> None:
+        if not self._hedger:
+            await self._stream_to(url, path)
+            return
+        # у дублирующей попытки свой временный файл, победитель переезжает на место
+        spare = path.with_name(path.name + ".hedge")
+        try:
+            winner = await self._hedger.run(lambda i, fb: self._stream_to(url, path if i == 0 else spare, fb))
+            if winner != path:
+                await asyncio.to_thread(os.replace, winner, path)
+        finally:
+            with suppress(OSError):
+                spare.unlink()
+
+    async def _download(self, url: str, key: str) -> bytes:
+        if self._blobs is None:
+            if self._hedger:
+                return await self._hedger.run(lambda _i, fb: self._read(url, fb))
+            return await self._read(url)
+
+        # промах: качаем прямо в кэш, дальше ретраи и повторы читают файл с диска
+        for _ in range(2):
+            path = await self._blobs.fetch(key, lambda tmp: self._fetch_to(url, tmp))
+            try:
+                return await asyncio.to_thread(path.read_bytes)
+            except FileNotFoundError:
+                # файл успели вытеснить между fetch и чтением
+                self._blobs.forget(key)
+        raise FileNotFoundError(key)
 
     async def send_image(self, record: ImageRecord) -> None:
+        from aiogram.exceptions import TelegramBadRequest, TelegramEntityTooLarge
+
+        try:
+            await self._send_image(record)
+        except aiohttp.ClientResponseError as e:
+            # 408/429 — перегрузка CDN, а не битая ссылка
+            if 400 <= e.status < 500 and e.status not in (408, 429):
+                raise CandidateRejected(f"CDN {e.status}: {e.request_info.real_url}") from e
+            raise
+        except (TelegramBadRequest, TelegramEntityTooLarge) as e:
+            if CHANNEL_BAD_REQUEST.search(e.message):
+                raise
+            raise CandidateRejected(e.message) from e
+
+    async def _send_image(self, record: ImageRecord) -> None:
+        from aiogram.exceptions import TelegramBadRequest
+        from aiogram.types import BufferedInputFile
+
         caption_parts = []
         if record.author:
             caption_parts.append(f"Автор: {record.author}")
@@ -43,17 +176,30 @@ class TelegramClient:
         if record.tags:
             caption_parts.append(f"Теги: {', '.join(record.tags[:20])}")
 
-        caption = _clip_caption("\n".join(caption_parts))
-
-        # Скачиваем сами -> отправляем буфером (максимально надёжно)
-        async with self._dl.get(record.url) as r:
-            r.raise_for_status()
-            data = await r.read()
-
-        photo = BufferedInputFile(data, filename="image.jpg")
-
-        await self._bot.send_photo(
-            chat_id=self._channel_id,
-            photo=photo,
-            caption=caption or None,
-        )
+        caption = _clip_caption("\n".join(caption_parts)) or None
+        url = record.media_url or record.url
+
+        filename = "image" + (PurePosixPath(url).suffix.lower() or ".jpg")
+        prepared = self._prep.cached(url) if self._prep and record.media_kind == "photo" else None
+        if prepared:
+            data, filename = prepared
+        else:
+            # Скачиваем сами -> отправляем буфером (максимально надёжно)
+            data = await self._download(url, blob_key(record, url))
+            if self._prep and record.media_kind == "photo":
+                data, filename = await self._prep.prepare(url, data, filename)
+
+        media = BufferedInputFile(data, filename=filename)
+
+        if record.media_kind == "animation":
+            await self._bot.send_animation(chat_id=self._channel_id, animation=media, caption=caption)
+        elif record.media_kind == "video":
+            await self._bot.send_video(chat_id=self._channel_id, video=media, caption=caption)
+        elif record.media_kind == "document":
+            await self._bot.send_document(chat_id=self._channel_id, document=media, caption=caption)
+        else:
+            try:
+                await self._bot.send_photo(chat_id=self._channel_id, photo=media, caption=caption)
+            except TelegramBadRequest:
+                # фото не прошло по размерам/весу — отправляем тем же файлом без пережатия
+                await self._bot.send_document(chat_id=self._channel_id, document=media, caption=caption)
@@ -0,0 +1,31 @@
+from __future__ import annotations
+import aiogram
+from aiogram.client.session.aiohttp import AiohttpSession
+
+import aiohttp
+
+from app.services.transport import TELEGRAM, Transport
+
+
+# модуль тянет aiogram (секунды на импорт), поэтому TelegramClient подгружает его лениво в start()
+class SharedAiohttpSession(AiohttpSession):
+    # сессия aiogram поверх общего коннектора: DNS-кэш, keepalive и лимиты из Transport
+    def __init__(self, transport: Transport, **kwargs):
+        super().__init__(**kwargs)
+        self._transport = transport
+
+    async def create_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = self._transport.session(
+                TELEGRAM, headers={"User-Agent": f"aiogram/{aiogram.__version__}"},
+            )
+        return self._session
+
+
+def make_bot(token: str, *, transport: Transport | None, http_limit: int):
+    from aiogram import Bot
+
+    # AiohttpSession — стандартная сессия aiogram, можно увеличить лимит коннектов
+    # для скорости и стабильности. :contentReference[oaicite:3]{index=3}
+    session = SharedAiohttpSession(transport) if transport else AiohttpSession(limit=http_limit)
+    return Bot(token=token, session=session), session
@@ -0,0 +1,133 @@
+from __future__ import annotations
+import asyncio
+import socket
+import ssl
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import DefaultResolver
+
+# пулы по назначению: у каждого свой лимит на хост, DNS-кэш общий
+API = "api"  # derpibooru.org JSON API
+CDN = "cdn"  # derpicdn.net, скачивание картинок
+TELEGRAM = "telegram"  # api.telegram.org (aiogram)
+
+
+class CachingResolver(AbstractResolver):
+    def __init__(self, *, ttl_s: float = 300.0):
+        self._inner = DefaultResolver()
+        self._ttl_s = ttl_s
+        self._cache: Dict[Tuple[str, int, int], Tuple[float, List[Dict[str, Any]]]] = {}
+        self._inflight: Dict[Tuple[str, int, int], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_INET) -> List[Dict[str, Any]]:
+        key = (host, port, int(family))
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self.hits += 1
+            return cached[1]
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            result = await self._inner.resolve(host, port, family)
+            self._cache[key] = (time.monotonic() + self._ttl_s, result)
+            fut.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def close(self) -> None:
+        await self._inner.close()
+
+
+def _ssl_context() -> Any:
+    # как в aiogram: корни certifi, если пакет есть (он приезжает вместе с aiogram)
+    try:
+        import certifi
+    except ImportError:
+        return True
+    return ssl.create_default_context(cafile=certifi.where())
+
+
+class Transport:
+    def __init__(
+        self,
+        *,
+        total_limit: int,
+        per_host: Dict[str, int],
+        keepalive_s: float = 30.0,
+        dns_ttl_s: float = 300.0,
+    ):
+        self._total_limit = total_limit
+        self._per_host = per_host
+        self._keepalive_s = keepalive_s
+        self.resolver = CachingResolver(ttl_s=dns_ttl_s)
+        self._connectors: Dict[str, aiohttp.TCPConnector] = {}
+
+    def connector(self, pool: str) -> aiohttp.TCPConnector:
+        conn = self._connectors.get(pool)
+        if conn is None or conn.closed:
+            conn = aiohttp.TCPConnector(
+                limit=self._total_limit,
+                limit_per_host=self._per_host.get(pool, 0),
+                resolver=self.resolver,
+                # кэш — в общем резолвере, а не в каждом коннекторе
+                use_dns_cache=False,
+                keepalive_timeout=self._keepalive_s,
+                enable_cleanup_closed=True,
+                ssl=_ssl_context(),
+            )
+            self._connectors[pool] = conn
+        return conn
+
+    def session(self, pool: str, *, timeout: Optional[aiohttp.ClientTimeout] = None, **kwargs: Any) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(
+            connector=self.connector(pool),
+            connector_owner=False,
+            timeout=timeout or aiohttp.client.DEFAULT_TIMEOUT,
+            **kwargs,
+        )
+
+    async def close(self) -> None:
+        for conn in self._connectors.values():
+            await conn.close()
+        self._connectors.clear()
+        await self.resolver.close()
+
+    def metrics(self) -> Dict[str, Any]:
+        # aiohttp не отдаёт состояние пула публично — читаем внутренние поля аккуратно
+        pools: Dict[str, Any] = {}
+        for name, conn in self._connectors.items():
+            acquired = getattr(conn, "_acquired", ())
+            per_host = getattr(conn, "_acquired_per_host", {})
+            idle = getattr(conn, "_conns", {})
+            in_use = len(acquired)
+            pools[name] = {
+                "limit": conn.limit,
+                "limit_per_host": conn.limit_per_host,
+                "in_use": in_use,
+                "idle": sum(len(v) for v in idle.values()),
+                "saturation": round(in_use / conn.limit, 3) if conn.limit else None,
+                "per_host": {f"{key.host}:{key.port}": len(v) for key, v in per_host.items() if v},
+            }
+        return {
+            "pools": pools,
+            "dns": {"hits": self.resolver.hits, "misses": self.resolver.misses},
+        }
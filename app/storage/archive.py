@@ -0,0 +1,156 @@
+from __future__ import annotations
+import gzip
+import hashlib
+import json
+import os
+import re
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.models import ImageRecord
+
+# сегменты: <root>/YYYY-MM.jsonl.gz (по месяцу posted_at), записи без даты — undated.jsonl.gz.
+# дозапись — новым gzip-членом в конец файла, gzip читает такие файлы как один поток
+KEYS_FILE = "keys.u64"
+UNDATED = "undated"
+SEGMENT_SUFFIX = ".jsonl.gz"
+SEGMENT_RE = re.compile(r"\d{4}-\d{2}|undated")
+
+
+def url_key(url: str) -> int:
+    # 8 байт вместо строки URL; коллизия означает лишь пропуск одной картинки
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def segment_name(posted_at: Optional[str]) -> str:
+    try:
+        return datetime.fromisoformat(posted_at).strftime("%Y-%m")
+    except (TypeError, ValueError):
+        return UNDATED
+
+
+class HistoryArchive:
+    def __init__(self, root: Path):
+        self.root = root
+        # отсортированные ключи всех заархивированных URL — единственное, что держим в памяти
+        self._keys = array("Q")
+        self._keys_mtime: Optional[int] = None
+
+    def load_keys_sync(self) -> None:
+        keys = array("Q")
+        try:
+            with open(self.root / KEYS_FILE, "rb") as f:
+                self._keys_mtime = os.fstat(f.fileno()).st_mtime_ns
+                keys.frombytes(f.read())
+        except (OSError, ValueError):
+            pass
+        self._keys = keys
+
+    def _refresh_keys_sync(self) -> None:
+        # веб-воркер архив не пишет: подхватываем ключи, если постер что-то вынес
+        try:
+            mtime = (self.root / KEYS_FILE).stat().st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._keys_mtime:
+            self.load_keys_sync()
+
+    def __contains__(self, url: str) -> bool:
+        keys = self._keys
+        key = url_key(url)
+        i = bisect_left(keys, key)
+        return i < len(keys) and keys[i] == key
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def append_sync(self, records: List[ImageRecord]) -> int:
+        # сначала сегменты, потом ключи: после сбоя между ними запись лишь повторится в архиве
+        fresh: Dict[str, List[ImageRecord]] = {}
+        added = set()
+        for r in records:
+            key = url_key(r.url)
+            if key in added or r.url in self:
+                continue
+            added.add(key)
+            fresh.setdefault(segment_name(r.posted_at), []).append(r)
+        if not fresh:
+            return 0
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        for name, items in fresh.items():
+            payload = "".join(json.dumps(r.to_dict(), ensure_ascii=False) + "\n" for r in items)
+            with open(self.root / f"{name}{SEGMENT_SUFFIX}", "ab") as f:
+                f.write(gzip.compress(payload.encode("utf-8")))
+                f.flush()
+                os.fsync(f.fileno())
+
+        keys = array("Q", sorted([*self._keys, *added]))
+        tmp = self.root / (KEYS_FILE + ".tmp")
+        with open(tmp, "wb") as f:
+            keys.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.root / KEYS_FILE)
+        self._keys = keys
+        self._keys_mtime = (self.root / KEYS_FILE).stat().st_mtime_ns
+        return len(added)
+
+    def segments(self) -> List[Dict[str, Any]]:
+        if not self.root.is_dir():
+            return []
+        out = []
+        for p in self.root.glob(f"*{SEGMENT_SUFFIX}"):
+            out.append({"segment": p.name[:-len(SEGMENT_SUFFIX)], "size_bytes": p.stat().st_size})
+        # новые месяцы первыми, undated — в конце
+        out.sort(key=lambda s: (s["segment"] != UNDATED, s["segment"]), reverse=True)
+        return out
+
+    def read_segment(self, segment: str) -> Iterator[Dict[str, Any]]:
+        path = self.root / f"{segment}{SEGMENT_SUFFIX}"
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except (OSError, EOFError):
+            return
+
+    def query_sync(
+        self,
+        *,
+        segment: Optional[str] = None,
+        tag: Optional[str] = None,
+        url: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        # читаем по запросу: сегменты распаковываются потоково и в памяти не остаются
+        if url is not None:
+            self._refresh_keys_sync()
+            if url not in self:
+                return []
+        # имя сегмента приходит из запроса — в путь попадает только YYYY-MM или undated
+        if segment is not None and not SEGMENT_RE.fullmatch(segment):
+            return []
+        names = [segment] if segment else [s["segment"] for s in self.segments()]
+        found: List[Dict[str, Any]] = []
+        for name in names:
+            matched = [
+                item for item in self.read_segment(name)
+                if (url is None or item.get("url") == url) and (tag is None or tag in (item.get("tags") or []))
+            ]
+            found.extend(reversed(matched))
+            if len(found) >= limit:
+                break
+        return found[:limit]
+
+    def iter_urls_sync(self) -> Iterator[str]:
+        for s in self.segments():
+            for item in self.read_segment(s["segment"]):
+                if item.get("url"):
+                    yield item["url"]
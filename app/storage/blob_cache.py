@@ -0,0 +1,153 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from contextlib import suppress
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional
+
+Fetcher = Callable[[Path], Awaitable[None]]
+# временные файлы загрузки: .part — сама загрузка, .hedge — дублирующая попытка (TelegramClient)
+TEMP_SUFFIXES = (".part", ".hedge")
+
+
+class BlobCache:
+    def __init__(self, root: Path, *, max_bytes: int):
+        self._root = root
+        self._max_bytes = max_bytes
+        # LRU-индекс: ключ -> размер файла, самые старые в начале
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._evict_needed = asyncio.Event()
+        self._evictor: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+
+    async def start(self) -> None:
+        if self._evictor:
+            return
+        await asyncio.to_thread(self._scan_sync)
+        self._evictor = asyncio.create_task(self._evict_loop(), name="blob-cache-evict")
+        self._evict_needed.set()
+
+    async def close(self) -> None:
+        if self._evictor:
+            self._evictor.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._evictor
+            self._evictor = None
+
+    def _scan_sync(self) -> None:
+        self._root.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for p in self._root.glob("*/*"):
+            if p.name.endswith(TEMP_SUFFIXES):
+                # недописанный файл после падения
+                with suppress(OSError):
+                    p.unlink()
+                continue
+            with suppress(OSError):
+                st = p.stat()
+                entries.append((st.st_atime, p.name, st.st_size))
+        entries.sort()
+        for _, name, size in entries:
+            self._index[name] = size
+            self._total += size
+
+    def _path(self, key: str) -> Path:
+        return self._root / hashlib.sha1(key.encode()).hexdigest()[:2] / key
+
+    def get(self, key: str) -> Optional[Path]:
+        if key not in self._index:
+            return None
+        self._index.move_to_end(key)
+        return self._path(key)
+
+    def forget(self, key: str) -> None:
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._total -= size
+
+    async def fetch(self, key: str, fetcher: Fetcher) -> Path:
+        path = self.get(key)
+        if path is not None:
+            self.hits += 1
+            return path
+
+        # одновременные запросы одной и той же картинки ждут одну загрузку
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            path = await self._fill(key, fetcher)
+            fut.set_result(path)
+            return path
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            # исключение уже передано ждущим; помечаем его прочитанным, чтобы не было warning
+            fut.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _fill(self, key: str, fetcher: Fetcher) -> Path:
+        path = self._path(key)
+        tmp = path.with_name(path.name + f".{os.getpid()}.part")
+        await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+        try:
+            await fetcher(tmp)
+            size = await asyncio.to_thread(self._commit_sync, tmp, path)
+        except BaseException:
+            with suppress(OSError):
+                tmp.unlink()
+            raise
+
+        self.forget(key)
+        self._index[key] = size
+        self._total += size
+        if self._total > self._max_bytes:
+            self._evict_needed.set()
+        return path
+
+    @staticmethod
+    def _commit_sync(tmp: Path, path: Path) -> int:
+        # атомарная замена: читатели видят либо старый файл, либо полностью записанный новый
+        size = tmp.stat().st_size
+        os.replace(tmp, path)
+        return size
+
+    async def _evict_loop(self) -> None:
+        while True:
+            await self._evict_needed.wait()
+            self._evict_needed.clear()
+            victims = []
+            while self._total > self._max_bytes and len(self._index) > 1:
+                key, size = self._index.popitem(last=False)
+                self._total -= size
+                victims.append(self._path(key))
+            if victims:
+                await asyncio.to_thread(self._unlink_sync, victims)
+
+    @staticmethod
+    def _unlink_sync(paths) -> None:
+        for p in paths:
+            with suppress(OSError):
+                p.unlink()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._index),
+            "bytes": self._total,
+            "max_bytes": self._max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,142 @@
+from __future__ import annotations
+import hashlib
+import math
+import mmap
+import os
+import struct
+from contextlib import suppress
+from pathlib import Path
+from typing import Any, Dict, Iterable
+
+# файл: заголовок + битовый массив; страницы подгружает ядро, резидентно — только то, что читали
+MAGIC = b"DBLM"
+VERSION = 2
+# magic, version, k, m (бит), count (разных ключей), synced (записей истории учтено), capacity,
+# marker (xor ключей учтённых записей — по нему видно, что история менялась без фильтра)
+_HEADER = struct.Struct("<4sHHQQQQQ")
+HEADER_SIZE = 64
+
+
+def _params(capacity: int, fp_rate: float):
+    # m = -n·ln p / ln²2, k = m/n·ln 2
+    capacity = max(capacity, 1)
+    m = max(64, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+    k = max(1, round(m / capacity * math.log(2)))
+    return m, k
+
+
+def _hashes(key: str):
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+class BloomFilter:
+    # ответ "нет" — точно не постили; "да" — надо проверить основное хранилище
+    def __init__(self, path: Path, capacity: int, fp_rate: float):
+        self.path = path
+        self.fp_rate = fp_rate
+        fresh = True
+        with suppress(OSError, struct.error):
+            with open(path, "rb") as f:
+                magic, version, k0, m0, _, _, cap0, _ = _HEADER.unpack(f.read(_HEADER.size))
+            # уже выросший файл берём как есть; с другой вероятностью ошибки — строим заново
+            # (synced=0 -> полная досинхронизация с историей)
+            if (magic, version) == (MAGIC, VERSION) and cap0 >= capacity and (m0, k0) == _params(cap0, fp_rate):
+                capacity = cap0
+                fresh = path.stat().st_size != HEADER_SIZE + (m0 + 7) // 8
+        m, k = _params(capacity, fp_rate)
+        size = HEADER_SIZE + (m + 7) // 8
+        if fresh:
+            self._create(path, size)
+        self._fd = os.open(path, os.O_RDWR)
+        self._mm = mmap.mmap(self._fd, size)
+        if fresh:
+            _HEADER.pack_into(self._mm, 0, MAGIC, VERSION, k, m, 0, 0, capacity, 0)
+        self.m, self.k, self.capacity = m, k, capacity
+        header = _HEADER.unpack_from(self._mm, 0)
+        self.count, self.synced, self.marker = header[4], header[5], header[7]
+        self.negatives = 0
+        self.positives = 0
+        self.false_positives = 0
+
+    @staticmethod
+    def _create(path: Path, size: int) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            f.truncate(size)
+
+    def _bits(self, key: str):
+        h1, h2 = _hashes(key)
+        m = self.m
+        for i in range(self.k):
+            yield (h1 + i * h2) % m
+
+    def add(self, key: str) -> None:
+        mm = self._mm
+        new = False
+        for bit in self._bits(key):
+            pos = HEADER_SIZE + (bit >> 3)
+            mask = 1 << (bit & 7)
+            if not mm[pos] & mask:
+                mm[pos] |= mask
+                new = True
+        # ложноположительный ключ счётчик не двигает, поэтому count — оценка снизу
+        if new:
+            self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        mm = self._mm
+        for bit in self._bits(key):
+            if not mm[HEADER_SIZE + (bit >> 3)] & (1 << (bit & 7)):
+                self.negatives += 1
+                return False
+        self.positives += 1
+        return True
+
+    def mark_synced(self, records: int, marker: int) -> None:
+        self.synced, self.marker = records, marker
+        _HEADER.pack_into(self._mm, 0, MAGIC, VERSION, self.k, self.m, self.count, records, self.capacity, marker)
+
+    def reset(self) -> None:
+        # обнуляем биты на месте: размер и параметры файла те же
+        self._mm[HEADER_SIZE:] = bytes(len(self._mm) - HEADER_SIZE)
+        self.count = 0
+        self.mark_synced(0, 0)
+
+    @property
+    def full(self) -> bool:
+        return self.count > self.capacity
+
+    def flush(self) -> None:
+        self._mm.flush()
+
+    def close(self) -> None:
+        if not self._mm.closed:
+            self._mm.flush()
+            self._mm.close()
+            os.close(self._fd)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "keys": self.count,
+            "capacity": self.capacity,
+            "size_kb": round((HEADER_SIZE + self.m / 8) / 1024, 1),
+            "hashes": self.k,
+            "target_fp_rate": self.fp_rate,
+            # (1 - e^(-k·n/m))^k
+            "estimated_fp_rate": round((1 - math.exp(-self.k * self.count / self.m)) ** self.k, 6),
+            "negatives": self.negatives,
+            "positives": self.positives,
+            "false_positives": self.false_positives,
+        }
+
+
+def build(path: Path, keys: Iterable[str], capacity: int, fp_rate: float) -> BloomFilter:
+    # полная пересборка в соседний файл; вызывающий подменяет основной, когда досинхронизирует хвост
+    with suppress(FileNotFoundError):
+        path.unlink()
+    bloom = BloomFilter(path, capacity, fp_rate)
+    for key in keys:
+        bloom.add(key)
+    return bloom
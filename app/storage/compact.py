@@ -0,0 +1,99 @@
+from __future__ import annotations
+import sys
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from app.models import ImageRecord
+
+# запись истории в памяти: без __dict__, теги — номера в общей таблице, время — int.
+# ImageRecord/dict собираются только на границе (API, WS, запись файла)
+
+
+class TagTable:
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+
+    def encode(self, tags: List[str]) -> array:
+        ids = array("I")
+        for tag in tags:
+            tid = self._ids.get(tag)
+            if tid is None:
+                tid = len(self._names)
+                tag = sys.intern(str(tag))
+                self._ids[tag] = tid
+                self._names.append(tag)
+            ids.append(tid)
+        return ids
+
+    def decode(self, ids: array) -> List[str]:
+        names = self._names
+        return [names[i] for i in ids]
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+def to_epoch(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    # время без смещения (импорт NDJSON/CSV) считаем UTC, а не локальным временем хоста
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def from_epoch(ts: Optional[int]) -> Optional[str]:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts is not None else None
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class CompactRecord:
+    __slots__ = ("url", "author", "source", "tag_ids", "posted_at", "image_id", "media_kind", "media_url")
+
+    def __init__(self, url, author, source, tag_ids, posted_at, image_id, media_kind, media_url):
+        self.url = url
+        self.author = author
+        self.source = source
+        self.tag_ids = tag_ids
+        self.posted_at = posted_at
+        self.image_id = image_id
+        self.media_kind = media_kind
+        self.media_url = media_url
+
+    @classmethod
+    def pack(cls, record: ImageRecord, tags: TagTable) -> "CompactRecord":
+        # автор и тип медиа повторяются тысячами — храним одну копию строки
+        return cls(
+            record.url,
+            _intern(record.author),
+            record.source,
+            tags.encode(record.tags or []),
+            to_epoch(record.posted_at),
+            record.image_id,
+            _intern(record.media_kind),
+            record.media_url,
+        )
+
+    def unpack(self, tags: TagTable) -> ImageRecord:
+        return ImageRecord(
+            url=self.url,
+            author=self.author,
+            source=self.source,
+            tags=tags.decode(self.tag_ids),
+            posted_at=from_epoch(self.posted_at),
+            image_id=self.image_id,
+            media_kind=self.media_kind,
+            media_url=self.media_url,
+        )
+
+    def to_dict(self, tags: TagTable) -> Dict[str, Any]:
+        return self.unpack(tags).to_dict()
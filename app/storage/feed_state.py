@@ -0,0 +1,53 @@
+from __future__ import annotations
+import asyncio
+import json
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+
+def _key(tags: Sequence[str]) -> str:
+    return ", ".join(t.strip().lower() for t in tags)
+
+
+# high-water mark (последний увиденный id) для каждой группы тегов в режиме ленты
+class FeedStateStore:
+    def __init__(self, path: Path):
+        self._path = path
+        self._lock = asyncio.Lock()
+        self._marks: Dict[str, int] = {}
+        self._load_sync()
+
+    def _load_sync(self) -> None:
+        if not self._path.exists():
+            return
+        try:
+            raw = json.loads(self._path.read_text(encoding="utf-8"))
+        except Exception:
+            return
+        if isinstance(raw, dict):
+            self._marks.clear()
+            for k, v in raw.items():
+                if isinstance(v, int):
+                    self._marks[k] = v
+
+    async def reload(self) -> None:
+        # новый лидер продолжает с отметок, которые сохранил предыдущий
+        async with self._lock:
+            await asyncio.to_thread(self._load_sync)
+
+    def get(self, tags: Sequence[str]) -> Optional[int]:
+        return self._marks.get(_key(tags))
+
+    async def advance(self, tags: Sequence[str], image_id: int) -> None:
+        key = _key(tags)
+        if image_id <= self._marks.get(key, 0):
+            return
+        self._marks[key] = image_id
+        async with self._lock:
+            await asyncio.to_thread(self._persist_sync)
+
+    def _persist_sync(self) -> None:
+        self._path.write_text(json.dumps(self._marks, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    def snapshot(self) -> Dict[str, int]:
+        return dict(self._marks)
@@ -0,0 +1,196 @@
+from __future__ import annotations
+import csv
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from app.models import ImageRecord
+from app.storage.archive import HistoryArchive
+
+FORMATS = ("ndjson", "csv")
+CSV_FIELDS = ("url", "author", "source", "tags", "posted_at", "image_id", "media_kind", "media_url")
+# в тегах Derpibooru запятых не бывает — в CSV склеиваем через ", ", как в поиске
+TAG_SEPARATOR = ", "
+READ_CHUNK = 64 * 1024
+
+
+def iter_json_array(f: TextIO) -> Iterator[Any]:
+    # sent_images.json — один JSON-массив; читаем его поэлементно, не держа весь файл в памяти
+    decoder = json.JSONDecoder()
+    buf = ""
+    started = False
+    eof = False
+    while True:
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if not started and pos < len(buf):
+                if buf[pos] != "[":
+                    raise ValueError("expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # элемент не дочитан — нужен следующий кусок
+                if eof:
+                    raise
+                break
+            # число могло оборваться на границе куска: дочитываем, пока за ним ничего нет
+            if end == len(buf) and not eof:
+                break
+            yield item
+            pos = end
+        buf = buf[pos:]
+        if eof:
+            return
+        chunk = f.read(READ_CHUNK)
+        if not chunk:
+            eof = True
+        buf += chunk
+
+
+def record_from(item: Any) -> Optional[ImageRecord]:
+    if not isinstance(item, dict) or not item.get("url"):
+        return None
+    tags = item.get("tags") or []
+    if isinstance(tags, str):
+        tags = [t.strip() for t in tags.split(",") if t.strip()]
+    image_id = item.get("image_id")
+    try:
+        image_id = int(image_id) if image_id not in (None, "") else None
+    except (TypeError, ValueError):
+        image_id = None
+    return ImageRecord(
+        url=item["url"],
+        author=item.get("author") or None,
+        source=item.get("source") or None,
+        tags=list(tags),
+        posted_at=item.get("posted_at") or None,
+        image_id=image_id,
+        media_kind=item.get("media_kind") or "photo",
+        media_url=item.get("media_url") or None,
+    )
+
+
+def iter_history(sent_file: Path, archive: Optional[HistoryArchive]) -> Iterator[Dict[str, Any]]:
+    # сначала архив (старое), потом горячая история — порядок публикации сохраняется
+    if archive is not None:
+        for s in reversed(archive.segments()):
+            yield from archive.read_segment(s["segment"])
+    if sent_file.exists():
+        with open(sent_file, encoding="utf-8") as f:
+            yield from iter_json_array(f)
+
+
+def iter_input(f: TextIO, fmt: str) -> Iterator[Dict[str, Any]]:
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+        return
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield {}
+
+
+def write_records(out: TextIO, fmt: str, items: Iterator[Dict[str, Any]], progress: "Progress") -> int:
+    n = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+    for item in items:
+        record = record_from(item)
+        if record is None:
+            continue
+        row = record.to_dict()
+        if fmt == "csv":
+            row["tags"] = TAG_SEPARATOR.join(row["tags"])
+            writer.writerow(row)
+        else:
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        n += 1
+        progress.tick(done=n)
+    return n
+
+
+class Checkpoint:
+    # сколько элементов входа уже обработано и сохранено; пишется атомарно после каждой пачки
+    def __init__(self, path: Path):
+        self.path = path
+        self.state: Dict[str, Any] = {}
+
+    def load(self, source: str) -> int:
+        try:
+            state = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return 0
+        # чекпоинт от другого входного файла не применяем
+        if not isinstance(state, dict) or state.get("source") != source:
+            return 0
+        self.state = state
+        return int(state.get("position", 0))
+
+    def save(self, source: str, position: int, **extra: Any) -> None:
+        self.state = {**self.state, **extra, "source": source, "position": position}
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(self.state, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        for p in (self.path, self.path.with_name(self.path.name + ".tmp")):
+            if p.exists():
+                p.unlink()
+
+
+class Progress:
+    # одна перезаписываемая строка в stderr, не чаще раза в INTERVAL_S
+    INTERVAL_S = 0.5
+
+    def __init__(self, label: str, total: Optional[int] = None, stream: TextIO = sys.stderr):
+        self._label = label
+        self._total = total
+        self._stream = stream
+        self._started = time.monotonic()
+        self._shown = 0.0
+        self._counters: Dict[str, int] = {}
+
+    def tick(self, force: bool = False, **counters: int) -> None:
+        self._counters.update(counters)
+        now = time.monotonic()
+        if not force and now - self._shown < self.INTERVAL_S:
+            return
+        self._shown = now
+        done = self._counters.get("done", 0)
+        rate = done / max(now - self._started, 1e-9)
+        parts = [f"{k}={v}" for k, v in self._counters.items()]
+        if self._total:
+            parts.insert(0, f"{done}/{self._total} ({done * 100 / self._total:.1f}%)")
+        self._stream.write(f"\r{self._label}: {' '.join(parts)} {rate:.0f}/s ")
+        self._stream.flush()
+
+    def finish(self) -> Tuple[int, float]:
+        self.tick(force=True)
+        self._stream.write("\n")
+        return self._counters.get("done", 0), time.monotonic() - self._started
+
+
+def batches(items: Iterator[Any], size: int) -> Iterator[List[Any]]:
+    batch: List[Any] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -1,57 +1,322 @@
 from __future__ import annotations
 import asyncio
 import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from itertools import chain
 from pathlib import Path
-from typing import Any, Dict, List, Set
+from typing import Any, Dict, List, Optional, Set
 from app.models import ImageRecord
+from app.storage.archive import HistoryArchive, url_key
+from app.storage.bloom import BloomFilter, build
+from app.storage.compact import CompactRecord, TagTable
+from app.storage.stats import HistoryStats
+
+log = logging.getLogger(__name__)
+
+
+def _record_from(item: Any) -> Optional[ImageRecord]:
+    if not isinstance(item, dict) or not item.get("url"):
+        return None
+    return ImageRecord(
+        url=item["url"],
+        author=item.get("author"),
+        source=item.get("source"),
+        tags=item.get("tags", []) or [],
+        posted_at=item.get("posted_at"),
+        image_id=item.get("image_id"),
+        media_kind=item.get("media_kind") or "photo",
+        media_url=item.get("media_url"),
+    )
 
 
 class SentImageStore:
-    def __init__(self, path: Path):
+    def __init__(
+        self,
+        path: Path,
+        bloom: Optional[BloomFilter] = None,
+        archive: Optional[HistoryArchive] = None,
+        stats: Optional[HistoryStats] = None,
+    ):
         self._path = path
+        # агрегаты для /api/stats: грузятся из снимка и досчитываются по хвосту истории
+        self.stats = stats
+        # старые записи уезжают в архив; в памяти от них остаются только 8-байтовые ключи
+        self.archive = archive
+        # необязательный префильтр дедупликации: отрицательный ответ не трогает основное хранилище
+        self._bloom = bloom
         self._lock = asyncio.Lock()
-        self._records: List[ImageRecord] = []
+        self._tags = TagTable()
+        self._records: List[CompactRecord] = []
         self._known: Set[str] = set()
-        self._load_sync()
+        # xor ключей всех URL в self._records: отметка синхронизации фильтра по содержимому
+        self._digest = 0
+        self._mtime: Optional[int] = None
+
+    async def load(self) -> None:
+        # разбор всей истории — в потоке, не на цикле событий
+        async with self._lock:
+            await asyncio.to_thread(self._load_all_sync)
+            await self._maybe_grow_bloom()
+
+    def _load_all_sync(self) -> None:
+        if self.archive is not None:
+            self.archive.load_keys_sync()
+        if self.stats is not None:
+            self.stats.load_sync()
+        self._refresh_sync()
+
+    def _refresh_sync(self) -> List[ImageRecord]:
+        added = self._load_sync()
+        if self._bloom is not None:
+            self._sync_bloom()
+        if self.stats is not None:
+            self._sync_stats()
+        return added
+
+    def _sync_stats(self) -> None:
+        # снимок помнит url последней учтённой записи: досчитываем только то, что после неё.
+        # нет снимка или записи уже нет в горячей истории — пересчёт по архиву и истории целиком
+        stats = self.stats
+        records = self._records
+        start = None
+        if stats.total and stats.last_url is not None:
+            for i in range(len(records) - 1, -1, -1):
+                if records[i].url == stats.last_url:
+                    start = i + 1
+                    break
+        if start is None:
+            stats.reset_history()
+            if self.archive is not None:
+                for s in reversed(self.archive.segments()):
+                    for item in self.archive.read_segment(s["segment"]):
+                        stats.observe_item(item)
+            start = 0
+        for r in records[start:]:
+            self._observe(r)
+
+    def _observe(self, r: CompactRecord) -> None:
+        self.stats.observe(self._tags.decode(r.tag_ids), r.author, r.posted_at)
+        self.stats.last_url = r.url
 
-    def _load_sync(self) -> None:
+    def _load_sync(self) -> List[ImageRecord]:
         if not self._path.exists():
-            return
+            return []
         try:
+            mtime = self._path.stat().st_mtime_ns
             raw = json.loads(self._path.read_text(encoding="utf-8"))
         except Exception:
-            return
+            return []
 
         if not isinstance(raw, list):
-            return
+            return []
 
+        self._mtime = mtime
+        added: List[ImageRecord] = []
         for item in raw:
-            if isinstance(item, dict) and item.get("url"):
-                r = ImageRecord(
-                    url=item["url"],
-                    author=item.get("author"),
-                    source=item.get("source"),
-                    tags=item.get("tags", []) or [],
-                    posted_at=item.get("posted_at"),
-                )
-                if r.url not in self._known:
-                    self._known.add(r.url)
-                    self._records.append(r)
+            r = _record_from(item)
+            if r is not None and r.url not in self._known:
+                self._remember(r)
+                added.append(r)
+        return added
+
+    def _prefix_digest(self, n: int) -> int:
+        digest = self._digest
+        for r in self._records[n:]:
+            digest ^= url_key(r.url)
+        return digest
+
+    def _sync_bloom(self) -> None:
+        # досыпаем в фильтр только записи после отметки synced, если первые synced записей —
+        # те же, что учтены в фильтре. иначе историю меняли без него (compact/импорт офлайн):
+        # позиция уже ничего не значит, и фильтр собирается заново по архиву и истории
+        bloom = self._bloom
+        start = bloom.synced
+        if start > len(self._records) or self._prefix_digest(start) != bloom.marker:
+            bloom.reset()
+            start = 0
+        if bloom.count == 0 and self.archive is not None and len(self.archive):
+            # новый файл фильтра: архивные URL тоже должны давать "да"
+            for url in self.archive.iter_urls_sync():
+                bloom.add(url)
+        for r in self._records[start:]:
+            bloom.add(r.url)
+        bloom.mark_synced(len(self._records), self._digest)
+
+    async def _maybe_grow_bloom(self) -> None:
+        # сверх расчётной ёмкости ложные срабатывания растут — пересобираем вдвое больший
+        # фильтр в потоке, а подменяем на цикле, чтобы проверки не попали на закрытый mmap
+        bloom = self._bloom
+        if bloom is None or not bloom.full:
+            return
+        urls = [r.url for r in self._records]
+        keys = chain(self.archive.iter_urls_sync(), urls) if self.archive is not None else urls
+        tmp = bloom.path.with_name(bloom.path.name + ".new")
+        grown = await asyncio.to_thread(build, tmp, keys, bloom.capacity * 2, bloom.fp_rate)
+        for r in self._records[len(urls):]:
+            grown.add(r.url)
+        grown.mark_synced(len(self._records), self._digest)
+        grown.flush()
+        os.replace(tmp, bloom.path)
+        grown.path = bloom.path
+        self._bloom = grown
+        bloom.close()
+        log.info("dedupe filter grown to %s keys", grown.capacity)
+
+    def _remember(self, record: ImageRecord) -> CompactRecord:
+        packed = CompactRecord.pack(record, self._tags)
+        self._known.add(packed.url)
+        self._records.append(packed)
+        self._digest ^= url_key(packed.url)
+        return packed
+
+    def observe(self, item: Dict[str, Any]) -> None:
+        # веб-воркер узнаёт о новой записи из шины событий; файл пишет только постер
+        r = _record_from(item)
+        if r is not None and r.url not in self._known:
+            self._remember(r)
+
+    async def reload_if_changed(self) -> List[ImageRecord]:
+        # реплика-последователь подхватывает записи, которые добавил лидер; возвращает новые
+        try:
+            mtime = self._path.stat().st_mtime_ns
+        except OSError:
+            return []
+        if mtime == self._mtime:
+            return []
+        async with self._lock:
+            added = await asyncio.to_thread(self._refresh_sync)
+            await self._maybe_grow_bloom()
+            return added
 
     @property
     def known_urls(self) -> Set[str]:
         return self._known
 
+    def contains(self, url: str) -> bool:
+        bloom = self._bloom
+        if bloom is not None and url not in bloom:
+            return False
+        if url in self._known or (self.archive is not None and url in self.archive):
+            return True
+        if bloom is not None:
+            bloom.false_positives += 1
+        return False
+
     async def add(self, record: ImageRecord) -> None:
         if record.url in self._known:
             return
-        self._known.add(record.url)
-        self._records.append(record)
-        await asyncio.to_thread(self._persist_sync)
+        packed = self._remember(record)
+        if self._bloom is not None:
+            self._bloom.add(record.url)
+            self._bloom.mark_synced(len(self._records), self._digest)
+        if self.stats is not None:
+            self._observe(packed)
+        async with self._lock:
+            await asyncio.to_thread(self._persist_sync)
+            await self._maybe_grow_bloom()
+            if self.stats is not None:
+                await self.stats.save()
+
+    async def add_many(self, records: List[ImageRecord], *, persist: bool = True) -> int:
+        # импорт/бэкфилл: одна перезапись файла на пачку вместо записи на каждую картинку;
+        # persist=False — только в память, файл пишет save() в конце
+        fresh = []
+        for record in records:
+            if self.contains(record.url):
+                continue
+            packed = self._remember(record)
+            if self._bloom is not None:
+                self._bloom.add(record.url)
+            if self.stats is not None:
+                self._observe(packed)
+            fresh.append(record)
+        if not fresh:
+            return 0
+        if self._bloom is not None:
+            self._bloom.mark_synced(len(self._records), self._digest)
+        if persist:
+            await self.save()
+        return len(fresh)
+
+    async def save(self) -> None:
+        async with self._lock:
+            await asyncio.to_thread(self._persist_sync)
+            await self._maybe_grow_bloom()
+            if self.stats is not None:
+                await self.stats.save()
+
+    async def archive_many(self, records: List[ImageRecord]) -> int:
+        # импорт прямо в архив: URL попадают и в фильтр, иначе после рестарта он ответит "не постили"
+        if self.archive is None:
+            raise RuntimeError("history archive is not configured")
+        fresh = [r for r in records if not self.contains(r.url)]
+        if not fresh:
+            return 0
+        async with self._lock:
+            archived = await asyncio.to_thread(self.archive.append_sync, fresh)
+            if self._bloom is not None:
+                for r in fresh:
+                    self._bloom.add(r.url)
+                self._bloom.flush()
+                await self._maybe_grow_bloom()
+        return archived
 
     def _persist_sync(self) -> None:
-        payload = [r.to_dict() for r in self._records]
+        payload = [r.to_dict(self._tags) for r in self._records]
         self._path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        self._mtime = self._path.stat().st_mtime_ns
+        if self._bloom is not None:
+            self._bloom.flush()
+
+    def _expired(self, keep_days: int, keep_entries: int) -> List[bool]:
+        # по числу — всё, кроме последних keep_entries; по возрасту — старше keep_days и без даты
+        # (импортированные записи могут стоять не по порядку, поэтому проверяем каждую)
+        n = len(self._records)
+        first_kept = max(0, n - keep_entries) if keep_entries > 0 else 0
+        border = int((datetime.now(timezone.utc) - timedelta(days=keep_days)).timestamp()) if keep_days > 0 else None
+        return [
+            i < first_kept or (border is not None and (r.posted_at is None or r.posted_at < border))
+            for i, r in enumerate(self._records)
+        ]
+
+    async def compact(self, *, keep_days: int = 0, keep_entries: int = 0) -> Dict[str, Any]:
+        if self.archive is None:
+            raise RuntimeError("history archive is not configured")
+        async with self._lock:
+            expired = self._expired(keep_days, keep_entries)
+            moved = [r for r, old in zip(self._records, expired) if old]
+            archived = 0
+            if moved:
+                archived = await asyncio.to_thread(self.archive.append_sync, [r.unpack(self._tags) for r in moved])
+                # add() мог дописать записи в хвост, пока писался архив, — они остаются
+                kept = [r for r, old in zip(self._records, expired) if not old]
+                self._records = kept + self._records[len(expired):]
+                for r in moved:
+                    self._known.discard(r.url)
+                    self._digest ^= url_key(r.url)
+                await asyncio.to_thread(self._persist_sync)
+                if self._bloom is not None:
+                    # вынесенные URL в фильтре остаются, досинхронизировать нечего
+                    self._bloom.mark_synced(len(self._records), self._digest)
+        return {"archived": archived, "moved": len(moved), "kept": len(self._records), "archive_keys": len(self.archive)}
 
     def recent(self, limit: int) -> List[Dict[str, Any]]:
-        return [r.to_dict() for r in self._records[-limit:]][::-1]
+        return [r.to_dict(self._tags) for r in self._records[-limit:]][::-1]
+
+    def bloom_stats(self) -> Optional[Dict[str, Any]]:
+        return self._bloom.stats() if self._bloom is not None else None
+
+    async def rebuild_stats(self) -> None:
+        # полный пересчёт агрегатов по архиву и истории (снимок потерян или испорчен)
+        if self.stats is None:
+            return
+        async with self._lock:
+            self.stats.reset_history()
+            await asyncio.to_thread(self._sync_stats)
+            await self.stats.save()
+
+    def close(self) -> None:
+        if self._bloom is not None:
+            self._bloom.close()
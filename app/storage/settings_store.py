@@ -3,12 +3,18 @@ import asyncio
 import json
 import random
 import re
-from dataclasses import dataclass, asdict
+from contextlib import suppress
+from dataclasses import dataclass, asdict, field
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+from app.config import flag
 
 DEFAULT_TAG_GROUPS = [["penis"], ["anal"], ["female"], ["vulva"], ["creampie"]]
+# random — случайные картинки по группе; feed — только новые загрузки по порядку
+POST_MODES = ("random", "feed")
+# выше этого веса (0.01..1.01) ** sharpness уже неотличимы от "только лучшие"
+MAX_SCORE_SHARPNESS = 20.0
 
 
 def parse_tag_lines(raw_text: str) -> List[List[str]]:
@@ -20,11 +26,58 @@ def parse_tag_lines(raw_text: str) -> List[List[str]]:
     return groups
 
 
+@dataclass
+class CandidateRules:
+    # ограничения по метаданным выдачи: отсекаем кандидатов ещё до скачивания
+    min_width: int = 400
+    min_height: int = 400
+    max_aspect_ratio: float = 20.0
+    max_size_mb: float = 50.0
+    formats: List[str] = field(default_factory=lambda: ["jpg", "jpeg", "png", "webp", "svg", "gif", "webm"])
+    allow_animated: bool = True
+    min_score: Optional[int] = None
+    min_wilson_score: Optional[float] = None
+    # вес кандидата = (wilson_score + 0.01) ** score_sharpness; 0 — равновероятный выбор
+    score_sharpness: float = 1.0
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "CandidateRules":
+        rules = cls()
+        if not isinstance(data, dict):
+            return rules
+        for name, cast in _RULE_CASTS.items():
+            if name not in data:
+                continue
+            value = data[name]
+            if value is None and name in _OPTIONAL_RULES:
+                setattr(rules, name, None)
+                continue
+            with suppress(Exception):
+                setattr(rules, name, cast(value))
+        return rules
+
+
+_RULE_CASTS = {
+    "min_width": int,
+    "min_height": int,
+    "max_aspect_ratio": float,
+    "max_size_mb": float,
+    "formats": lambda v: [str(x).strip().lower() for x in v if str(x).strip()],
+    "allow_animated": flag,
+    "min_score": int,
+    "min_wilson_score": float,
+    "score_sharpness": lambda v: max(0.0, min(MAX_SCORE_SHARPNESS, float(v))),
+}
+_OPTIONAL_RULES = {"min_score", "min_wilson_score"}
+
+
 @dataclass
 class Settings:
     tags: List[List[str]]
     post_interval_minutes: int
     filter_id: Optional[int]
+    mode: str = "random"
+    candidate_rules: CandidateRules = field(default_factory=CandidateRules)
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any], *, fallback_interval: int, fallback_filter: int) -> "Settings":
@@ -54,7 +107,17 @@ class Settings:
         except Exception:
             filter_id = fallback_filter
 
-        return cls(tags=tags, post_interval_minutes=interval, filter_id=filter_id)
+        mode = data.get("mode")
+        if mode not in POST_MODES:
+            mode = "random"
+
+        return cls(
+            tags=tags,
+            post_interval_minutes=interval,
+            filter_id=filter_id,
+            mode=mode,
+            candidate_rules=CandidateRules.from_dict(data.get("candidate_rules")),
+        )
 
     def to_dict(self) -> Dict[str, Any]:
         return asdict(self)
@@ -73,6 +136,7 @@ class SettingsStore:
         self.default_interval = default_interval
         self.default_filter_id = default_filter_id
         self.settings = Settings(tags=DEFAULT_TAG_GROUPS, post_interval_minutes=default_interval, filter_id=default_filter_id)
+        self._mtime: Optional[int] = None
 
     async def load(self) -> Settings:
         if not self._path.exists():
@@ -80,6 +144,7 @@ class SettingsStore:
             return self.settings
 
         try:
+            self._mtime = self._path.stat().st_mtime_ns
             raw = json.loads(self._path.read_text(encoding="utf-8"))
             if isinstance(raw, dict):
                 self.settings = Settings.from_dict(
@@ -92,14 +157,46 @@ class SettingsStore:
 
         return self.settings
 
+    async def reload_if_changed(self) -> bool:
+        # настройки могла поменять другая реплика; True — если что-то перечитали
+        try:
+            mtime = self._path.stat().st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            raw = json.loads(self._path.read_text(encoding="utf-8"))
+        except Exception:
+            # файл в процессе записи — попробуем в следующий раз
+            return False
+        self._mtime = mtime
+        if not isinstance(raw, dict):
+            return False
+        self.settings = Settings.from_dict(
+            raw,
+            fallback_interval=self.default_interval,
+            fallback_filter=self.default_filter_id,
+        )
+        return True
+
     async def save(self) -> None:
         async with self._lock:
             self._path.write_text(
                 json.dumps(self.settings.to_dict(), ensure_ascii=False, indent=2),
                 encoding="utf-8",
             )
-
-    async def update(self, *, tags_raw: Optional[str], interval: Optional[int], filter_id: Optional[int]) -> Settings:
+            self._mtime = self._path.stat().st_mtime_ns
+
+    async def update(
+        self,
+        *,
+        tags_raw: Optional[str],
+        interval: Optional[int],
+        filter_id: Optional[int],
+        mode: Optional[str] = None,
+        candidate_rules: Optional[Dict[str, Any]] = None,
+    ) -> Settings:
         if tags_raw is not None:
             parsed = parse_tag_lines(tags_raw)
             if parsed:
@@ -110,5 +207,12 @@ class SettingsStore:
 
         self.settings.filter_id = filter_id
 
+        if mode in POST_MODES:
+            self.settings.mode = mode
+
+        if isinstance(candidate_rules, dict):
+            merged = {**asdict(self.settings.candidate_rules), **candidate_rules}
+            self.settings.candidate_rules = CandidateRules.from_dict(merged)
+
         await self.save()
         return self.settings
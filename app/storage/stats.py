@@ -0,0 +1,182 @@
+from __future__ import annotations
+import asyncio
+import heapq
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.storage.compact import to_epoch
+
+# почасовая лента — только за последнюю неделю, по дням — за всё время
+HOURLY_WINDOW_H = 7 * 24
+GROUP_OUTCOMES = ("post", "empty", "failed")
+SNAPSHOT_VERSION = 1
+
+
+def _day(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _hour(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H")
+
+
+class HistoryStats:
+    # агрегаты обновляются на каждой записи истории; чтение — без прохода по истории
+    def __init__(self, snapshot_path: Optional[Path] = None, *, read_only: bool = False):
+        self._path = snapshot_path
+        self.read_only = read_only
+        self._mtime: Optional[int] = None
+        self.reset_history()
+        # результаты слотов по группам тегов из истории не восстановить — живут только в снимке
+        self.groups: Dict[str, Dict[str, Any]] = {}
+
+    def reset_history(self) -> None:
+        self.total = 0
+        self.undated = 0
+        self.tags: Counter = Counter()
+        self.authors: Counter = Counter()
+        self.per_day: Counter = Counter()
+        self.per_hour: Counter = Counter()
+        self.hour_of_day = [0] * 24
+        # url последней учтённой записи горячей истории — с неё досчитываем после загрузки
+        self.last_url: Optional[str] = None
+        self._top: Dict[Tuple[str, int], List[Tuple[str, int]]] = {}
+
+    def observe(self, tags: Sequence[str], author: Optional[str], ts: Optional[int]) -> None:
+        self.total += 1
+        self.tags.update(tags)
+        if author:
+            self.authors[author] += 1
+        if ts is None:
+            self.undated += 1
+        else:
+            self.per_day[_day(ts)] += 1
+            self.hour_of_day[datetime.fromtimestamp(ts, timezone.utc).hour] += 1
+            if ts >= time.time() - HOURLY_WINDOW_H * 3600:
+                self.per_hour[_hour(ts)] += 1
+        self._top.clear()
+
+    def observe_item(self, item: Dict[str, Any]) -> None:
+        self.observe(item.get("tags") or [], item.get("author"), to_epoch(item.get("posted_at")))
+
+    def record_group(self, group: Sequence[str], outcome: str) -> None:
+        g = self.groups.setdefault(", ".join(group), {"attempts": 0, **{o: 0 for o in GROUP_OUTCOMES}})
+        g["attempts"] += 1
+        g[outcome] = g.get(outcome, 0) + 1
+        # серия неудач подряд — признак того, что группа "пересыхает"
+        if outcome == "post":
+            g["streak_without_post"] = 0
+            g["last_post_at"] = int(time.time())
+        else:
+            g["streak_without_post"] = g.get("streak_without_post", 0) + 1
+
+    def _prune_hours(self) -> None:
+        border = _hour(int(time.time()) - HOURLY_WINDOW_H * 3600)
+        for key in [k for k in self.per_hour if k < border]:
+            del self.per_hour[key]
+
+    def top(self, name: str, k: int) -> List[Tuple[str, int]]:
+        # топ считается один раз после изменения, дальше отдаётся из кэша
+        cached = self._top.get((name, k))
+        if cached is None:
+            counter = self.tags if name == "tags" else self.authors
+            cached = self._top[(name, k)] = heapq.nlargest(k, counter.items(), key=lambda kv: kv[1])
+        return cached
+
+    def summary(self, *, top: int = 20, days: int = 30) -> Dict[str, Any]:
+        self._prune_hours()
+        today = datetime.now(timezone.utc).date()
+        day_keys = [(today - timedelta(days=i)).isoformat() for i in range(days - 1, -1, -1)]
+        groups = []
+        for name, g in self.groups.items():
+            attempts = g.get("attempts", 0)
+            groups.append({
+                "group": name,
+                **g,
+                "success_rate": round(g.get("post", 0) / attempts, 3) if attempts else None,
+            })
+        groups.sort(key=lambda g: (g["success_rate"] is None, g["success_rate"] or 0))
+        return {
+            "total": self.total,
+            "undated": self.undated,
+            "distinct_tags": len(self.tags),
+            "distinct_authors": len(self.authors),
+            "top_tags": [{"tag": t, "count": c} for t, c in self.top("tags", top)],
+            "top_authors": [{"author": a, "count": c} for a, c in self.top("authors", top)],
+            "per_day": {d: self.per_day.get(d, 0) for d in day_keys},
+            "per_hour": dict(sorted(self.per_hour.items())),
+            "hour_of_day": self.hour_of_day,
+            "groups": groups,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        self._prune_hours()
+        return {
+            "version": SNAPSHOT_VERSION,
+            "total": self.total,
+            "undated": self.undated,
+            "tags": self.tags,
+            "authors": self.authors,
+            "per_day": self.per_day,
+            "per_hour": self.per_hour,
+            "hour_of_day": self.hour_of_day,
+            "last_url": self.last_url,
+            "groups": self.groups,
+        }
+
+    def load_sync(self) -> bool:
+        if self._path is None:
+            return False
+        try:
+            mtime = self._path.stat().st_mtime_ns
+            raw = json.loads(self._path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        if not isinstance(raw, dict) or raw.get("version") != SNAPSHOT_VERSION:
+            return False
+        self.reset_history()
+        self.total = int(raw.get("total", 0))
+        self.undated = int(raw.get("undated", 0))
+        self.tags = Counter(raw.get("tags") or {})
+        self.authors = Counter(raw.get("authors") or {})
+        self.per_day = Counter(raw.get("per_day") or {})
+        self.per_hour = Counter(raw.get("per_hour") or {})
+        hod = raw.get("hour_of_day") or []
+        self.hour_of_day = list(hod) if len(hod) == 24 else [0] * 24
+        self.last_url = raw.get("last_url")
+        self.groups = raw.get("groups") or {}
+        self._mtime = mtime
+        return True
+
+    def reload_if_changed_sync(self) -> None:
+        # веб-воркер только читает снимок, который пишет постер
+        if self._path is None:
+            return
+        try:
+            mtime = self._path.stat().st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.load_sync()
+
+    def _write_sync(self, data: str) -> None:
+        tmp = self._path.with_name(self._path.name + ".tmp")
+        tmp.write_text(data, encoding="utf-8")
+        os.replace(tmp, self._path)
+        self._mtime = self._path.stat().st_mtime_ns
+
+    def save_sync(self) -> None:
+        if self._path is None or self.read_only:
+            return
+        self._write_sync(json.dumps(self.to_dict(), ensure_ascii=False))
+
+    async def save(self) -> None:
+        # сериализуем на цикле (счётчики меняются только здесь), пишем в потоке
+        if self._path is None or self.read_only:
+            return
+        await asyncio.to_thread(self._write_sync, json.dumps(self.to_dict(), ensure_ascii=False))
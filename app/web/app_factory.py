@@ -1,15 +1,21 @@
 from __future__ import annotations
 from aiohttp import web
 from pathlib import Path
+from urllib.parse import urlsplit
+from app.web.assets import compression_middleware
+from app.web.health import readiness_middleware
 from app.web.auth import session_middleware, require_login_middleware, require_role_middleware, make_session_cookie
 from app.web.routes import setup_routes
 
 
-def create_web_app(*, cfg, settings_store, sent_store, autoposter, ws_hub) -> web.Application:
+def create_web_app(*, cfg, settings_store, sent_store, autoposter, ws_hub, metrics=None, elector=None, startup=None, loop_monitor=None, admin_updates=None) -> web.Application:
     tpl_dir = Path(__file__).parent / "templates"
     static_dir = Path(__file__).parent / "static"
 
     app = web.Application(middlewares=[
+        compression_middleware(cfg.http_compress_min_bytes),
+        # пока не загружены хранилища и клиенты, отвечаем 503 (кроме /healthz и /readyz)
+        readiness_middleware(startup),
         session_middleware(secret=cfg.session_secret),
         # viewer/admin must be logged-in to access /viewer
         require_login_middleware(protected_prefixes=("/viewer",)),
@@ -18,6 +24,11 @@ def create_web_app(*, cfg, settings_store, sent_store, autoposter, ws_hub) -> we
             "/settings": "admin",
             "/api/settings": "admin",
             "/api/post-now": "admin",
+            "/api/metrics": "admin",
+            "/api/stats": "admin",
+            "/debug": "admin",
+            "/api/debug": "admin",
+            "/api/archive": "admin",
         }),
     ])
 
@@ -26,8 +37,15 @@ def create_web_app(*, cfg, settings_store, sent_store, autoposter, ws_hub) -> we
     app["sent"] = sent_store
     app["autoposter"] = autoposter
     app["ws"] = ws_hub
+    app["metrics"] = metrics or (lambda: {})
+    app["elector"] = elector
+    app["startup"] = startup
+    app["loop_monitor"] = loop_monitor
     app["tpl_dir"] = tpl_dir
     app["static_dir"] = static_dir
+    # приёмник апдейтов админ-бота: async (update) -> bool, False — не принят, Telegram повторит
+    app["admin_updates"] = admin_updates if cfg.telegram_webhook_url else None
+    app["webhook_path"] = urlsplit(cfg.telegram_webhook_url).path or "/telegram/webhook"
     app["make_session"] = lambda user, role: make_session_cookie(
         secret=cfg.session_secret,
         user=user,
@@ -0,0 +1,190 @@
+from __future__ import annotations
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_PREFIX = "/static/"
+IMMUTABLE = "public, max-age=31536000, immutable"
+# страницы и файлы под исходными именами — с проверкой по ETag: после деплоя подхватятся новые хэши
+REVALIDATE = "no-cache"
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# меньше этого сжатие не окупает заголовки и работу
+MIN_COMPRESS_BYTES = 256
+# тела больше этого сжимаем в потоке, чтобы не держать цикл событий
+THREAD_COMPRESS_BYTES = 256 * 1024
+
+_REF_RE = re.compile(r"/static/([\w./-]+)")
+
+
+def compressors() -> Tuple[str, ...]:
+    # в порядке предпочтения
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def accepted(header: str) -> set:
+    # Accept-Encoding: "gzip, deflate, br;q=0" -> {"gzip", "deflate"}
+    result = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            result.add(name)
+    return result
+
+
+def negotiate(request: web.Request, available) -> Optional[str]:
+    offered = accepted(request.headers.get("Accept-Encoding", ""))
+    for enc in compressors():
+        if enc in available and (enc in offered or "*" in offered):
+            return enc
+    return None
+
+
+def compress(data: bytes, encoding: str, *, static: bool = False) -> bytes:
+    # статику сжимаем один раз при старте — максимальный уровень; ответы API — быстрый
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if static else 4)
+    return gzip.compress(data, compresslevel=9 if static else 5, mtime=0)
+
+
+@dataclass
+class Asset:
+    body: bytes
+    content_type: str
+    etag: str
+    cache_control: str
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+    def response(self, request: web.Request) -> web.Response:
+        enc = negotiate(request, self.variants)
+        etag = f'"{self.etag}-{enc}"' if enc else f'"{self.etag}"'
+        headers = {"Cache-Control": self.cache_control, "ETag": etag, "Vary": "Accept-Encoding"}
+        if etag in request.headers.get("If-None-Match", ""):
+            return web.Response(status=304, headers=headers)
+        if enc:
+            headers["Content-Encoding"] = enc
+        body = self.variants[enc] if enc else self.body
+        return web.Response(body=body, headers=headers, content_type=self.content_type)
+
+
+def _asset(data: bytes, name: str, cache_control: str) -> Asset:
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    asset = Asset(
+        body=data,
+        content_type=content_type,
+        etag=hashlib.blake2b(data, digest_size=8).hexdigest(),
+        cache_control=cache_control,
+    )
+    if len(data) >= MIN_COMPRESS_BYTES and content_type.startswith(COMPRESSIBLE):
+        for enc in compressors():
+            packed = compress(data, enc, static=True)
+            if len(packed) < len(data):
+                asset.variants[enc] = packed
+    return asset
+
+
+def fingerprinted(name: str, data: bytes) -> str:
+    # style.css -> style.3f2a9c1b0d4e.css
+    digest = hashlib.blake2b(data, digest_size=6).hexdigest()
+    stem, dot, ext = name.rpartition(".")
+    return f"{stem}.{digest}.{ext}" if dot else f"{name}.{digest}"
+
+
+class AssetPipeline:
+    # статика и шаблоны читаются, хэшируются и сжимаются один раз при старте, дальше — из памяти
+    def __init__(self, static_dir: Path, tpl_dir: Path):
+        self.static_dir = static_dir
+        self.tpl_dir = tpl_dir
+        self.static: Dict[str, Asset] = {}
+        self.pages: Dict[str, Asset] = {}
+        # исходное имя -> имя с хэшем
+        self.manifest: Dict[str, str] = {}
+
+    def build_sync(self) -> "AssetPipeline":
+        for path in sorted(p for p in self.static_dir.rglob("*") if p.is_file()):
+            name = path.relative_to(self.static_dir).as_posix()
+            data = path.read_bytes()
+            hashed = fingerprinted(name, data)
+            self.manifest[name] = hashed
+            self.static[hashed] = _asset(data, name, IMMUTABLE)
+            # старые ссылки (закэшированные страницы, закладки) продолжают работать
+            self.static[name] = _asset(data, name, REVALIDATE)
+        for path in sorted(self.tpl_dir.glob("*.html")):
+            html = self.rewrite(path.read_text(encoding="utf-8"))
+            self.pages[path.name] = _asset(html.encode("utf-8"), path.name, REVALIDATE)
+        return self
+
+    def rewrite(self, html: str) -> str:
+        def sub(m: re.Match) -> str:
+            hashed = self.manifest.get(m.group(1))
+            return STATIC_PREFIX + hashed if hashed else m.group(0)
+        return _REF_RE.sub(sub, html)
+
+
+def setup_assets(app: web.Application) -> None:
+    async def build(app: web.Application) -> None:
+        pipeline = AssetPipeline(app["static_dir"], app["tpl_dir"])
+        app["assets"] = await asyncio.to_thread(pipeline.build_sync)
+
+    # AppRunner.setup() дожидается сборки до того, как сайт начнёт принимать соединения
+    app.on_startup.append(build)
+    app.router.add_get(STATIC_PREFIX + "{name:.+}", static_asset)
+
+
+async def static_asset(request: web.Request) -> web.Response:
+    asset = request.app["assets"].static.get(request.match_info["name"])
+    if asset is None:
+        raise web.HTTPNotFound()
+    return asset.response(request)
+
+
+def page(request: web.Request, name: str) -> web.Response:
+    return request.app["assets"].pages[name].response(request)
+
+
+def compression_middleware(min_bytes: int):
+    # JSON-ответы API сжимаются, если клиент это принимает; 0 — выключено
+    @web.middleware
+    async def mw(request: web.Request, handler):
+        resp = await handler(request)
+        if (
+            min_bytes <= 0
+            or type(resp) is not web.Response
+            or resp.content_type != "application/json"
+            or "Content-Encoding" in resp.headers
+            or not isinstance(resp.body, bytes)
+            or len(resp.body) < max(min_bytes, MIN_COMPRESS_BYTES)
+        ):
+            return resp
+        enc = negotiate(request, compressors())
+        if enc is None:
+            return resp
+        body = resp.body
+        if len(body) >= THREAD_COMPRESS_BYTES:
+            packed = await asyncio.to_thread(compress, body, enc)
+        else:
+            packed = compress(body, enc)
+        resp.body = packed
+        resp.headers["Content-Encoding"] = enc
+        resp.headers.add("Vary", "Accept-Encoding")
+        return resp
+    return mw
@@ -0,0 +1,16 @@
+from __future__ import annotations
+from aiohttp import web
+
+# доступны, пока сервис ещё запускается
+ALWAYS_OPEN = ("/healthz", "/readyz", "/static/")
+
+
+def readiness_middleware(startup):
+    @web.middleware
+    async def mw(request: web.Request, handler):
+        if startup is None or startup.ready or request.path.startswith(ALWAYS_OPEN):
+            return await handler(request)
+        if request.path.startswith("/api/") or request.path == "/ws":
+            return web.json_response({"ok": False, "error": "starting"}, status=503, headers={"Retry-After": "1"})
+        return web.Response(text="Starting…", status=503, headers={"Retry-After": "1"})
+    return mw
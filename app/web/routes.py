@@ -1,49 +1,79 @@
 from __future__ import annotations
-import json
+import asyncio
+import hmac
 from contextlib import suppress
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
 from aiohttp import web
+from app import codec
+from app.services import profiler
 from app.storage.settings_store import parse_tag_lines
+from app.web.assets import page, setup_assets
 
 MAX_IMAGES_EXPOSE = 200
 
 
+def json_response(data: Any, *, status: int = 200, headers: Optional[Dict[str, str]] = None) -> web.Response:
+    # как web.json_response, но через общий кодек (orjson/msgspec, если установлены)
+    return web.Response(body=codec.dumps(data), status=status, headers=headers, content_type="application/json")
+
+
 def setup_routes(app: web.Application) -> None:
     # pages
     app.router.add_get("/", index)
     app.router.add_get("/viewer", viewer_page)
     app.router.add_get("/settings", settings_page)
     app.router.add_get("/login", login_page)
+    app.router.add_get("/debug", debug_page)
     app.router.add_post("/auth/login", do_login)
     app.router.add_post("/auth/logout", do_logout)
 
+    # health
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+
     # ws
     app.router.add_get("/ws", ws_handler)
 
     # api
     app.router.add_get("/api/images", api_images)
+    app.router.add_get("/api/archive", api_archive)
     app.router.add_get("/api/status", api_status)
     app.router.add_get("/api/settings", api_get_settings)
     app.router.add_post("/api/settings", api_update_settings)
     app.router.add_post("/api/post-now", api_post_now)
+    app.router.add_get("/api/metrics", api_metrics)
+    app.router.add_get("/api/stats", api_stats)
+    app.router.add_get("/api/debug/loop", api_debug_loop)
+    app.router.add_get("/api/debug/profile", api_debug_profile)
+    app.router.add_get("/api/debug/heap", api_debug_heap)
+
+    # Telegram: вебхук админ-бота (путь из TELEGRAM_WEBHOOK_URL)
+    if app["admin_updates"] is not None:
+        app.router.add_post(app["webhook_path"], telegram_webhook)
 
-    # static
-    app.router.add_static("/static/", app["static_dir"], show_index=False)
+    # static: имена с хэшем содержимого и заранее сжатые варианты
+    setup_assets(app)
 
 
 async def index(request: web.Request) -> web.Response:
-    return web.FileResponse(request.app["tpl_dir"] / "index.html")
+    return page(request, "index.html")
 
 
 async def viewer_page(request: web.Request) -> web.Response:
-    return web.FileResponse(request.app["tpl_dir"] / "viewer.html")
+    return page(request, "viewer.html")
 
 
 async def settings_page(request: web.Request) -> web.Response:
-    return web.FileResponse(request.app["tpl_dir"] / "settings.html")
+    return page(request, "settings.html")
+
+
+async def debug_page(request: web.Request) -> web.Response:
+    return page(request, "debug.html")
 
 
 async def login_page(request: web.Request) -> web.Response:
-    return web.FileResponse(request.app["tpl_dir"] / "login.html")
+    return page(request, "login.html")
 
 
 async def do_login(request: web.Request) -> web.Response:
@@ -77,6 +107,19 @@ async def do_logout(request: web.Request) -> web.Response:
     return resp
 
 
+async def healthz(request: web.Request) -> web.Response:
+    # процесс жив и цикл событий отвечает
+    return json_response({"ok": True})
+
+
+async def readyz(request: web.Request) -> web.Response:
+    startup = request.app["startup"]
+    if startup is None:
+        return json_response({"ok": True, "ready": True})
+    status = startup.status()
+    return json_response({"ok": status["ready"], **status}, status=200 if status["ready"] else 503)
+
+
 async def ws_handler(request: web.Request) -> web.StreamResponse:
     ws = web.WebSocketResponse(heartbeat=25)
     await ws.prepare(request)
@@ -107,16 +150,44 @@ async def api_images(request: web.Request) -> web.Response:
         limit = min(MAX_IMAGES_EXPOSE, max(1, int(request.query.get("limit", "120"))))
     except Exception:
         limit = 120
-    return web.json_response({"ok": True, "images": sent.recent(limit)})
+    return json_response({"ok": True, "images": sent.recent(limit)})
+
+
+async def api_archive(request: web.Request) -> web.Response:
+    archive = request.app["sent"].archive
+    if archive is None:
+        return json_response({"ok": False, "error": "archive is not configured"}, status=404)
+    q = request.query
+    if not any(k in q for k in ("segment", "tag", "url")):
+        return json_response({"ok": True, "keys": len(archive), "segments": archive.segments()})
+    try:
+        limit = min(MAX_IMAGES_EXPOSE, max(1, int(q.get("limit", "50"))))
+    except ValueError:
+        limit = 50
+    # сегменты распаковываются в потоке
+    images = await asyncio.to_thread(
+        archive.query_sync,
+        segment=q.get("segment") or None,
+        tag=q.get("tag") or None,
+        url=q.get("url") or None,
+        limit=limit,
+    )
+    return json_response({"ok": True, "images": images})
 
 
 async def api_status(request: web.Request) -> web.Response:
     autoposter = request.app["autoposter"]
     settings = request.app["settings"].settings
-    return web.json_response({
+    elector = request.app["elector"]
+    leader = None
+    if elector:
+        # эндпоинт публичный: holder (hostname:pid) отдаём только в /api/metrics для admin
+        leader = {k: v for k, v in elector.status().items() if k != "holder"}
+    return json_response({
         "ok": True,
         "next_run_at": autoposter.next_run_at.isoformat() if autoposter.next_run_at else None,
         "interval_minutes": settings.post_interval_minutes,
+        "leader": leader,
     })
 
 
@@ -126,14 +197,15 @@ async def api_get_settings(request: web.Request) -> web.Response:
     payload = settings.to_dict()
     payload["next_run_at"] = autoposter.next_run_at.isoformat() if autoposter.next_run_at else None
     payload["tags_text"] = settings.tags_text()
-    return web.json_response({"ok": True, "settings": payload})
+    payload["group_stats"] = autoposter.group_stats()
+    return json_response({"ok": True, "settings": payload})
 
 
 async def api_update_settings(request: web.Request) -> web.Response:
     store = request.app["settings"]
     autoposter = request.app["autoposter"]
 
-    payload = await request.json()
+    payload = codec.loads(await request.read())
     interval_raw = payload.get("post_interval_minutes")
     filter_raw = payload.get("filter_id")
     tags_raw = payload.get("tags_raw", "")
@@ -150,23 +222,135 @@ async def api_update_settings(request: web.Request) -> web.Response:
         with suppress(Exception):
             filter_id = int(filter_raw)
 
-    await store.update(tags_raw=tags_raw, interval=interval, filter_id=filter_id)
+    await store.update(
+        tags_raw=tags_raw,
+        interval=interval,
+        filter_id=filter_id,
+        mode=payload.get("mode"),
+        candidate_rules=payload.get("candidate_rules"),
+    )
     autoposter.notify_settings_changed()
 
-    return web.json_response({"ok": True})
+    return json_response({"ok": True})
 
 
 async def api_post_now(request: web.Request) -> web.Response:
     autoposter = request.app["autoposter"]
     payload = {}
     if request.can_read_body:
-        with suppress(json.JSONDecodeError):
-            payload = await request.json()
+        with suppress(ValueError):
+            payload = codec.loads(await request.read())
 
     tags_override = None
     if isinstance(payload, dict) and payload.get("tags_raw"):
         parsed = parse_tag_lines(payload["tags_raw"])
         tags_override = parsed[0] if parsed else None
 
-    await autoposter.post_now(tags_override)
-    return web.json_response({"ok": True})
+    elector = request.app["elector"]
+    if elector and not elector.is_leader:
+        # очередь постинга есть только у лидера
+        leader = await elector.leader()
+        return json_response(
+            {"ok": False, "error": "not leader", "leader": leader.holder if leader else None},
+            status=409,
+        )
+
+    try:
+        await autoposter.post_now(tags_override)
+    except ConnectionError:
+        # веб-воркер потерял связь с процессом постера
+        return json_response({"ok": False, "error": "poster unavailable"}, status=503)
+    return json_response({"ok": True})
+
+
+async def telegram_webhook(request: web.Request) -> web.Response:
+    # Telegram присылает секрет из setWebhook в заголовке; без него апдейт не наш
+    secret = request.app["config"].telegram_webhook_secret
+    got = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(got.encode(), secret.encode()):
+        return json_response({"ok": False, "error": "forbidden"}, status=403)
+    try:
+        update = codec.loads(await request.read())
+    except ValueError:
+        return json_response({"ok": False, "error": "bad json"}, status=400)
+    # обработка — в воркерах админ-бота; здесь только ставим в очередь и сразу отвечаем
+    if not await request.app["admin_updates"](update):
+        return json_response({"ok": False, "error": "busy"}, status=503, headers={"Retry-After": "1"})
+    return json_response({"ok": True})
+
+
+async def api_metrics(request: web.Request) -> web.Response:
+    return json_response({"ok": True, "metrics": request.app["metrics"]()})
+
+
+def _int_param(request: web.Request, name: str, default: int, upper: int) -> int:
+    try:
+        return min(upper, max(1, int(request.query.get(name, default))))
+    except ValueError:
+        return default
+
+
+async def api_stats(request: web.Request) -> web.Response:
+    stats = request.app["sent"].stats
+    if stats is None:
+        return json_response({"ok": False, "error": "stats are disabled"}, status=404)
+    if stats.read_only:
+        await asyncio.to_thread(stats.reload_if_changed_sync)
+    top = _int_param(request, "top", 20, MAX_IMAGES_EXPOSE)
+    days = _int_param(request, "days", 30, 366)
+    return json_response({"ok": True, "stats": stats.summary(top=top, days=days)})
+
+
+async def api_debug_loop(request: web.Request) -> web.Response:
+    monitor = request.app["loop_monitor"]
+    return json_response({"ok": True, "loop": monitor.snapshot() if monitor else None})
+
+
+def _attachment(body, filename: str, content_type: str) -> web.Response:
+    return web.Response(
+        body=body if isinstance(body, bytes) else body.encode(),
+        content_type=content_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+async def api_debug_profile(request: web.Request) -> web.Response:
+    # ?seconds=10&format=collapsed|pstats&interval_ms=10&threads=all
+    seconds = profiler.parse_seconds(request.query.get("seconds"), 10)
+    fmt = request.query.get("format", "collapsed")
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    try:
+        if fmt == "pstats":
+            data = await profiler.cprofile_stats(seconds)
+            return _attachment(data, f"profile-{stamp}.pstats", "application/octet-stream")
+        if fmt != "collapsed":
+            return json_response({"ok": False, "error": "format must be collapsed or pstats"}, status=400)
+        interval_ms = 10.0
+        with suppress(ValueError):
+            interval_ms = float(request.query.get("interval_ms", interval_ms))
+        text = await profiler.sample_collapsed(
+            seconds,
+            interval_s=interval_ms / 1000,
+            all_threads=request.query.get("threads") == "all",
+        )
+        return _attachment(text, f"profile-{stamp}.collapsed", "text/plain")
+    except profiler.ProfilerBusy:
+        return json_response({"ok": False, "error": "another profile is running"}, status=409)
+
+
+async def api_debug_heap(request: web.Request) -> web.Response:
+    # ?seconds=30&limit=40&frames=1&group_by=lineno|filename|traceback
+    seconds = profiler.parse_seconds(request.query.get("seconds"), 30)
+    group_by = request.query.get("group_by", "lineno")
+    if group_by not in ("lineno", "filename", "traceback"):
+        return json_response({"ok": False, "error": "group_by must be lineno, filename or traceback"}, status=400)
+    limit, frames = 40, 1
+    with suppress(ValueError):
+        limit = max(1, min(500, int(request.query.get("limit", limit))))
+        frames = int(request.query.get("frames", 10 if group_by == "traceback" else frames))
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    try:
+        text = await profiler.heap_diff(seconds, limit=limit, frames=frames, group_by=group_by)
+    except profiler.ProfilerBusy:
+        return json_response({"ok": False, "error": "another profile is running"}, status=409)
+    return _attachment(text, f"heap-{stamp}.txt", "text/plain")
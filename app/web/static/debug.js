@@ -0,0 +1,48 @@
+const lagEl = document.getElementById("lag");
+const slowEl = document.getElementById("slow");
+const offendersEl = document.getElementById("offenders");
+const stallsEl = document.getElementById("stalls");
+
+document.getElementById("reload").addEventListener("click", load);
+
+function escapeHtml(s){
+  return String(s).replace(/[&<>"]/g, c => ({"&":"&amp;","<":"&lt;",">":"&gt;","\"":"&quot;"}[c]));
+}
+function renderHistogram(el, h){
+  if(!h || !h.count){ el.innerHTML = `<div class="chip">нет данных</div>`; return; }
+  const max = Math.max(...Object.values(h.buckets_ms), 1);
+  const bars = Object.entries(h.buckets_ms).map(([label, n]) => `
+    <div class="row">
+      <div class="chip">${label} мс</div>
+      <div class="bar" style="width:${Math.max(1, Math.round(n / max * 60))}%"></div>
+      <div class="chip">${n}</div>
+    </div>
+  `).join("");
+  el.innerHTML = `
+    <div class="chip">замеров: ${h.count} · среднее: ${h.mean_ms} мс · p50: ${h.p50_ms} · p99: ${h.p99_ms} · max: ${h.max_ms} мс</div>
+    ${bars}
+  `;
+}
+
+async function load(){
+  const r = await fetch("/api/debug/loop");
+  if(r.status === 401 || r.status === 403){ location.href="/login"; return; }
+  const j = await r.json();
+  const s = j.loop;
+  if(!s){ lagEl.innerHTML = `<div class="chip">монитор выключен (LOOP_MONITOR=0)</div>`; return; }
+  renderHistogram(lagEl, s.lag);
+  renderHistogram(slowEl, s.slow_callbacks);
+  offendersEl.innerHTML = (s.offenders||[]).map(o => `
+    <div class="row">
+      <div class="tags"><span class="badge">${escapeHtml(o.name)}</span></div>
+      <div class="chip">раз: ${o.count} · всего: ${o.total_ms} мс · max: ${o.max_ms} мс</div>
+    </div>
+  `).join("");
+  stallsEl.innerHTML = (s.stalls||[]).slice().reverse().map(st => `
+    <div class="chip">${new Date(st.at * 1000).toLocaleString()} · ${st.stalled_ms} мс</div>
+    <pre class="stack">${escapeHtml(st.stack)}</pre>
+  `).join("") || `<div class="chip">${s.stall_stack_ms ? "не было" : "снимки стеков выключены (LOOP_STALL_STACK_MS=0)"}</div>`;
+}
+
+load();
+setInterval(load, 5000);
@@ -1,8 +1,10 @@
 const intervalEl = document.getElementById("interval");
 const filterEl = document.getElementById("filterId");
 const tagsEl = document.getElementById("tags");
+const modeEl = document.getElementById("mode");
 const nextChip = document.getElementById("next-run-chip");
 const toast = document.getElementById("toast");
+const groupStatsEl = document.getElementById("group-stats");
 
 document.getElementById("save").addEventListener("click", save);
 document.getElementById("reload").addEventListener("click", load);
@@ -20,6 +22,22 @@ function formatDate(s){
 function tagsToText(tags){
   return (tags||[]).map(g => (g||[]).join(", ")).join("\n");
 }
+function escapeHtml(s){
+  return String(s).replace(/[&<>"]/g, c => ({"&":"&amp;","<":"&lt;",">":"&gt;","\"":"&quot;"}[c]));
+}
+function renderGroupStats(stats){
+  groupStatsEl.innerHTML = (stats||[]).map(g => {
+    const ratio = g.fresh_ratio == null ? "—" : Math.round(g.fresh_ratio * 100) + "%";
+    const last = g.last_success_at ? formatDate(g.last_success_at * 1000) : "—";
+    const cooldown = g.cooldown_until ? `<span class="badge">пауза до ${formatDate(g.cooldown_until * 1000)}</span>` : "";
+    return `
+      <div class="row">
+        <div class="tags">${(g.tags||[]).map(t => `<span class="badge">${escapeHtml(t)}</span>`).join("")}${cooldown}</div>
+        <div class="chip">свежих: ${ratio} · найдено: ${g.total_hits} · постов: ${g.posts} · последний: ${last}</div>
+      </div>
+    `;
+  }).join("");
+}
 
 async function load(){
   const r = await fetch("/api/settings");
@@ -29,14 +47,17 @@ async function load(){
   intervalEl.value = s.post_interval_minutes || 60;
   filterEl.value = (s.filter_id ?? "");
   tagsEl.value = tagsToText(s.tags);
+  modeEl.value = s.mode || "random";
   nextChip.textContent = "Следующий пост: " + formatDate(s.next_run_at);
+  renderGroupStats(s.group_stats);
 }
 
 async function save(){
   const payload = {
     post_interval_minutes: Number(intervalEl.value),
     filter_id: filterEl.value ? Number(filterEl.value) : null,
-    tags_raw: tagsEl.value || ""
+    tags_raw: tagsEl.value || "",
+    mode: modeEl.value
   };
   const r = await fetch("/api/settings", {
     method:"POST",
@@ -0,0 +1,202 @@
+from __future__ import annotations
+import asyncio
+import logging
+import multiprocessing
+import sys
+from contextlib import suppress
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from aiohttp import web
+
+from app.config import load_config
+from app.services.event_bus import EventBusClient
+from app.services.loop_monitor import monitor_from_config
+from app.services.startup import Startup
+from app.storage.archive import HistoryArchive
+from app.storage.sent_store import SentImageStore
+from app.storage.stats import HistoryStats
+from app.storage.settings_store import SettingsStore
+from app.web.app_factory import create_web_app
+from app.web.ws import WsHub
+
+log = logging.getLogger(__name__)
+
+# служебные события шины — в WebSocket браузерам не уходят
+POSTER_STATE = "poster_state"
+SETTINGS_CHANGED = "settings_changed"
+# апдейт Telegram для админ-бота: его обрабатывает постер
+ADMIN_UPDATE = "admin_update"
+
+
+class RemotePoster:
+    # заменяет AutoPoster в веб-воркере: состояние приходит из шины, команды уходят постеру
+    def __init__(self):
+        self.bus: Optional[EventBusClient] = None
+        self.next_run_at: datetime | None = None
+        self._state: Dict[str, Any] = {}
+        self._pending: Set[asyncio.Task] = set()
+
+    def apply(self, event: str, data: Dict[str, Any]) -> None:
+        if event == POSTER_STATE:
+            self._state = data
+        if event in (POSTER_STATE, "status"):
+            raw = data.get("next_run_at")
+            self.next_run_at = datetime.fromisoformat(raw) if raw else None
+
+    async def post_now(self, tags: Optional[List[str]] = None) -> None:
+        await self.bus.command("post_now", tags=tags)
+
+    def notify_settings_changed(self) -> None:
+        # файл настроек уже записан воркером; постер перечитает его и оповестит остальных
+        task = asyncio.create_task(self._command(SETTINGS_CHANGED))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _command(self, cmd: str) -> None:
+        try:
+            await self.bus.command(cmd)
+        except ConnectionError as e:
+            log.warning("cannot reach poster for %s: %r", cmd, e)
+
+    def group_stats(self) -> List[dict]:
+        return self._state.get("group_stats", [])
+
+    def pool_depth(self) -> Dict[str, int]:
+        return self._state.get("pool_depth", {})
+
+    def metrics(self) -> Dict[str, Any]:
+        return self._state.get("metrics", {})
+
+
+async def _worker_main(index: int) -> None:
+    startup = Startup()
+    cfg = load_config()
+    loop_monitor = monitor_from_config(cfg)
+    if loop_monitor:
+        loop_monitor.start()
+
+    settings_store = SettingsStore(
+        cfg.settings_file,
+        default_interval=cfg.post_interval_minutes,
+        default_filter_id=cfg.filter_id
+    )
+    sent_store = SentImageStore(
+        cfg.sent_images_file,
+        archive=HistoryArchive(cfg.history_archive_dir),
+        # снимок пишет постер, воркер его только перечитывает
+        stats=HistoryStats(cfg.stats_snapshot_file, read_only=True),
+    )
+    ws_hub = WsHub()
+    remote = RemotePoster()
+
+    async def on_event(event: str, data: Dict[str, Any]) -> None:
+        remote.apply(event, data)
+        if event == POSTER_STATE:
+            return
+        if event == SETTINGS_CHANGED:
+            await settings_store.reload_if_changed()
+            return
+        if event == "new_image":
+            sent_store.observe(data.get("record"))
+        await ws_hub.broadcast(event, data)
+
+    remote.bus = EventBusClient(cfg.event_bus_path, on_event)
+    await remote.bus.start()
+
+    async def admin_updates(update: Any) -> bool:
+        try:
+            await remote.bus.command(ADMIN_UPDATE, update=update)
+        except ConnectionError:
+            return False
+        return True
+
+    app = create_web_app(
+        cfg=cfg,
+        settings_store=settings_store,
+        sent_store=sent_store,
+        autoposter=remote,
+        ws_hub=ws_hub,
+        metrics=lambda: {**remote.metrics(), "web_worker": index, "bus_connected": remote.bus.connected},
+        startup=startup,
+        loop_monitor=loop_monitor,
+        admin_updates=admin_updates,
+    )
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    # все воркеры слушают один порт, ядро раздаёт соединения между ними
+    site = web.TCPSite(runner, host=cfg.web_host, port=cfg.web_port, reuse_port=True)
+    await startup.phase("web", site.start())
+    log.info("Web worker %s: http://%s:%s", index, cfg.web_host, cfg.web_port)
+
+    await startup.run({"settings": settings_store.load(), "sent_history": sent_store.load()})
+    startup.mark_ready()
+
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await remote.bus.close()
+        await runner.cleanup()
+        if loop_monitor:
+            await loop_monitor.stop()
+
+
+def run_worker(index: int) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s [%(levelname)s] [web-{index}] %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+    with suppress(KeyboardInterrupt):
+        asyncio.run(_worker_main(index))
+
+
+class WebWorkers:
+    # процессы веб-панели; постер следит за ними и перезапускает упавшие
+    def __init__(self, count: int):
+        self._count = count
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs: List[Optional[multiprocessing.process.BaseProcess]] = [None] * count
+        self._task: asyncio.Task | None = None
+        self.restarts = 0
+
+    def _spawn(self, index: int) -> None:
+        proc = self._ctx.Process(target=run_worker, args=(index,), name=f"web-{index}", daemon=True)
+        proc.start()
+        self._procs[index] = proc
+
+    async def start(self) -> None:
+        for i in range(self._count):
+            self._spawn(i)
+        self._task = asyncio.create_task(self._supervise(), name="web-workers")
+
+    async def _supervise(self) -> None:
+        while True:
+            await asyncio.sleep(1.0)
+            for i, proc in enumerate(self._procs):
+                if proc is not None and not proc.is_alive():
+                    log.warning("web worker %s exited with %s, restarting", i, proc.exitcode)
+                    self.restarts += 1
+                    self._spawn(i)
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        for proc in self._procs:
+            if proc is not None and proc.is_alive():
+                proc.terminate()
+        for proc in self._procs:
+            if proc is not None:
+                await asyncio.to_thread(proc.join, 5)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self._count,
+            "alive": sum(1 for p in self._procs if p is not None and p.is_alive()),
+            "restarts": self.restarts,
+        }
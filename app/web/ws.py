@@ -1,8 +1,8 @@
 from __future__ import annotations
 import asyncio
-import json
 from aiohttp import web
 from typing import Any, Dict, Set
+from app import codec
 
 
 class WsHub:
@@ -19,7 +19,8 @@ class WsHub:
             self._clients.discard(ws)
 
     async def broadcast(self, event: str, data: Dict[str, Any]) -> None:
-        message = json.dumps({"event": event, "data": data}, ensure_ascii=False)
+        # кодируем один раз на событие, а не на клиента
+        message = codec.dumps_str({"event": event, "data": data})
         dead = []
         async with self._lock:
             for ws in self._clients:
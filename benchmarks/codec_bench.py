@@ -0,0 +1,77 @@
+from __future__ import annotations
+import argparse
+import random
+import timeit
+from typing import Any, Callable, Dict, List
+
+from app.codec import BACKENDS
+from app.models import ImageRecord, now_iso
+
+# синтетика по форме настоящих ответов: страница поиска Derpibooru (~60 полей на картинку),
+# ответ /api/images на MAX_IMAGES_EXPOSE записей и одно событие WebSocket
+
+
+def _image(i: int) -> Dict[str, Any]:
+    tags = [f"tag {random.randint(0, 5000)}" for _ in range(40)]
+    base = f"https://derpicdn.net/img/2024/5/1/{i}"
+    return {
+        "id": i, "tags": tags, "tag_ids": [random.randint(0, 10**6) for _ in tags], "tag_count": len(tags),
+        "representations": {k: f"{base}/{k}.png" for k in ("full", "large", "medium", "small", "tall", "thumb", "thumb_small", "thumb_tiny")},
+        "format": "png", "mime_type": "image/png", "animated": False, "size": 2_000_000 + i,
+        "width": 2000, "height": 1500, "aspect_ratio": 1.333, "duration": 0.04, "score": 300, "wilson_score": 0.93,
+        "upvotes": 320, "downvotes": 20, "faves": 150, "comment_count": 12, "uploader": f"user{i % 97}",
+        "view_url": f"{base}__safe_pony.png", "source_url": "https://example.com/a", "source_urls": ["https://example.com/a"],
+        "description": "lorem ipsum " * 40, "created_at": "2024-05-01T12:00:00Z", "updated_at": "2024-05-01T12:00:00Z",
+        "first_seen_at": "2024-05-01T12:00:00Z", "uploader_id": i % 97, "orig_sha512_hash": "ab" * 64,
+        "sha512_hash": "cd" * 64, "hidden_from_users": False, "processed": True, "thumbnails_generated": True,
+        "spoilered": False, "intensities": {"ne": 1.0, "nw": 1.0, "se": 1.0, "sw": 1.0}, "deletion_reason": None,
+        "duplicate_of": None, "name": f"{i}.png", "orig_size": 2_000_000 + i, "hidden_complex": None,
+    }
+
+
+def _bench(label: str, fn: Callable[[], Any], rounds: int) -> float:
+    per_call = min(timeit.repeat(fn, number=rounds, repeat=5)) / rounds
+    print(f"  {label:<28} {per_call * 1e6:10.1f} us")
+    return per_call
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="JSON codec per-path benchmark")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(1)
+    json_backend = BACKENDS["json"]()
+    page = json_backend.dumps({"images": [_image(i) for i in range(50)], "total": 12345})
+    records: List[Dict[str, Any]] = [
+        ImageRecord(url=f"https://derpicdn.net/img/{i}/large.png", author=f"user{i}", source=f"https://derpibooru.org/images/{i}",
+                    tags=[f"tag {j}" for j in range(30)], posted_at=now_iso(), image_id=i).to_dict()
+        for i in range(200)
+    ]
+    api_images = {"ok": True, "images": records}
+    ws_event = {"event": "new_image", "data": {"record": records[0]}}
+    print(f"search page: {len(page) / 1024:.0f} KiB, /api/images: {len(json_backend.dumps(api_images)) / 1024:.0f} KiB")
+
+    results: Dict[str, Dict[str, float]] = {}
+    for name, factory in BACKENDS.items():
+        backend = factory()
+        if backend is None:
+            print(f"{name}: not installed, skipped")
+            continue
+        print(name)
+        results[name] = {
+            "derpi search decode": _bench("derpi search decode", lambda: backend.decode_search(page), args.rounds),
+            "/api/images encode": _bench("/api/images encode", lambda: backend.dumps(api_images), args.rounds),
+            "ws event encode": _bench("ws event encode", lambda: backend.dumps_str(ws_event), args.rounds * 20),
+        }
+
+    base = results["json"]
+    for name, timings in results.items():
+        if name == "json":
+            continue
+        speedups = ", ".join(f"{path} x{base[path] / t:.1f}" for path, t in timings.items())
+        print(f"{name} vs json: {speedups}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,11 @@ setup(
         "python-dotenv>=1.0",
         "aiogram>=3.23.0",
     ],
+    extras_require={
+        "preprocess": ["Pillow>=10.0"],
+        "fast-json": ["msgspec>=0.18", "orjson>=3.9"],
+        "brotli": ["Brotli>=1.1"],
+    },
     entry_points={
         "console_scripts": [
             "derpi-bot=app.main:run",